@@ -0,0 +1,72 @@
+# coding: utf-8
+import math
+import threading
+from contextlib import contextmanager
+from rich.console import Console
+
+console = Console()
+
+
+class BandwidthBooster:
+    """大文件传输期间临时提高EIP带宽, 传输结束后恢复
+
+    目标带宽按传输大小计算 (在 target_seconds 内传完所需的Mbps), 限制在 [baseline, ceiling] 之间;
+    小于 min_bytes 的传输不值得两次API调用, 直接跳过。
+    同一个EIP上的并发传输共享一次提升 (引用计数), 最后一个传输结束时才恢复到 baseline。
+    带宽调整只在该EIP自己的锁内进行, 不同EIP (例如并发的多个节点) 的调整互不等待。
+    调整带宽失败只打印警告, 传输照常进行。
+    """
+
+    def __init__(self, eip_manager, baseline=5, ceiling=100, target_seconds=60, min_bytes=32 * 1024 * 1024):
+        self.eip_manager = eip_manager
+        self.baseline = baseline
+        self.ceiling = ceiling
+        self.target_seconds = target_seconds
+        self.min_bytes = min_bytes
+        self._active = {}  # eip_id -> [引用数, 当前带宽]
+        self._eip_locks = {}  # eip_id -> 保护该EIP引用计数和带宽调整的锁
+        self._lock = threading.Lock()
+
+    def _eip_lock(self, eip_id):
+        with self._lock:
+            return self._eip_locks.setdefault(eip_id, threading.Lock())
+
+    def target(self, size_bytes):
+        """传输 size_bytes 所需的带宽(Mbps)"""
+        needed = math.ceil(size_bytes * 8 / 1_000_000 / self.target_seconds)
+        return max(self.baseline, min(self.ceiling, needed))
+
+    @contextmanager
+    def boost(self, eip_id, size_bytes):
+        """在 with 块内提高 eip_id 的带宽; eip_id 为空或传输很小时不做任何调整"""
+        if not eip_id or self.ceiling <= self.baseline or size_bytes < self.min_bytes:
+            yield
+            return
+        size = self.target(size_bytes)
+        lock = self._eip_lock(eip_id)
+        with lock:
+            entry = self._active.setdefault(eip_id, [0, self.baseline])
+            entry[0] += 1
+            if size > entry[1] and self.eip_manager.update_bandwidth(eip_id, size):
+                console.print(f"[dim]EIP {eip_id} 带宽提升到 {size}Mbps ({size_bytes / 1024 / 1024:.1f} MB)[/dim]")
+                entry[1] = size
+        try:
+            yield
+        finally:
+            with lock:
+                entry = self._active[eip_id]
+                entry[0] -= 1
+                if entry[0] == 0:
+                    del self._active[eip_id]
+                    if entry[1] > self.baseline and self.eip_manager.update_bandwidth(eip_id, self.baseline):
+                        console.print(f"[dim]EIP {eip_id} 带宽恢复到 {self.baseline}Mbps[/dim]")
+
+
+def remote_size(conn, *paths):
+    """远端文件总大小(字节), 不存在的文件按0计算"""
+    quoted = " ".join(f"'{path}'" for path in paths)
+    result = conn.run(f"du -cb {quoted} 2>/dev/null | tail -n 1", hide=True, warn=True)
+    try:
+        return int(result.stdout.split()[0])
+    except (IndexError, ValueError):
+        return 0
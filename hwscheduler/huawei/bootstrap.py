@@ -0,0 +1,99 @@
+# coding: utf-8
+import base64
+import ipaddress
+import json
+
+HOSTS_BEGIN = "# BEGIN hwscheduler cluster"
+HOSTS_END = "# END hwscheduler cluster"
+
+SSH_CLIENT_CONFIG = """Host *
+    StrictHostKeyChecking no
+    UserKnownHostsFile /dev/null
+    LogLevel ERROR
+"""
+
+# 主机密钥已预先分发时, 节点之间按 /etc/ssh/ssh_known_hosts 严格校验
+SSH_CLIENT_CONFIG_STRICT = """Host *
+    StrictHostKeyChecking yes
+    LogLevel ERROR
+"""
+
+
+def encode_cloud_config(config):
+    """base64编码的cloud-config (JSON是合法的YAML, 避免手写转义)"""
+    script = "#cloud-config\n" + json.dumps(config, indent=2)
+    return base64.b64encode(script.encode('utf-8')).decode('utf-8')
+
+
+class ClusterBootstrap:
+    """通过cloud-init在实例首次启动时完成集群配置
+
+    私有IP按子网网段预先规划 (第 first_host 个地址起依次分配), 因此在创建请求中即可写入
+    完整的主机映射; 集群密钥对、SSH客户端配置和authorized_keys也一并放进user_data,
+    实例启动后即已完成免密登录配置, 不再需要逐节点的SSH配置阶段。
+    提供 host_keys (HostKeys) 时同时下发各节点的主机密钥和集群的 ssh_known_hosts,
+    节点之间的SSH也改为严格校验主机密钥。
+    """
+
+    def __init__(self, num_nodes, task_type, subnet_cidr, private_key_path, first_host=10, user="root",
+                 host_keys=None):
+        self.num_nodes = num_nodes
+        self.host_keys = host_keys
+        self.task_type = task_type
+        self.network = ipaddress.ip_network(subnet_cidr, strict=False)
+        self.first_host = first_host
+        self.user = user
+        with open(private_key_path, 'r') as f:
+            self.private_key = f.read()
+        with open(f"{private_key_path}.pub", 'r') as f:
+            self.public_key = f.read().strip()
+        if first_host + num_nodes >= self.network.num_addresses - 1:
+            raise ValueError(f"子网 {subnet_cidr} 地址不足以容纳 {num_nodes} 个节点")
+
+    def hostname(self, index):
+        return f"node{index}-{self.task_type}"
+
+    def private_ip(self, index):
+        """节点的固定私有IP"""
+        return str(self.network[self.first_host + index])
+
+    def hosts_entries(self):
+        """集群主机映射, 同时保留 SSHConfigurator 使用的 node-{index} 别名"""
+        return [f"{self.private_ip(i)}\t{self.hostname(i)} node-{i}" for i in range(self.num_nodes)]
+
+    def cloud_config(self, index):
+        ssh_dir = "/root/.ssh" if self.user == "root" else f"/home/{self.user}/.ssh"
+        hosts_block = "\n".join([HOSTS_BEGIN] + self.hosts_entries() + [HOSTS_END]) + "\n"
+        write_files = [
+            {'path': f"{ssh_dir}/id_rsa", 'content': self.private_key, 'permissions': '0600'},
+            {'path': f"{ssh_dir}/id_rsa.pub", 'content': self.public_key + "\n", 'permissions': '0644'},
+            {'path': f"{ssh_dir}/config",
+             'content': SSH_CLIENT_CONFIG_STRICT if self.host_keys else SSH_CLIENT_CONFIG, 'permissions': '0600'},
+            {'path': "/etc/hwscheduler_hosts", 'content': hosts_block, 'permissions': '0644'},
+        ]
+        if self.host_keys:
+            known_hosts = self.host_keys.known_hosts_lines({i: self.known_host_names(i) for i in range(self.num_nodes)})
+            write_files.append({'path': "/etc/ssh/ssh_known_hosts", 'content': "\n".join(known_hosts) + "\n",
+                                'permissions': '0644'})
+        config = {
+            'hostname': self.hostname(index),
+            'manage_etc_hosts': False,
+            'write_files': write_files,
+            'runcmd': [
+                f"cat {ssh_dir}/id_rsa.pub >> {ssh_dir}/authorized_keys",
+                f"chmod 700 {ssh_dir} && chmod 600 {ssh_dir}/authorized_keys",
+                f"chown -R {self.user}:{self.user} {ssh_dir}",
+                f"sed -i '/^{HOSTS_BEGIN}$/,/^{HOSTS_END}$/d' /etc/hosts",
+                "cat /etc/hwscheduler_hosts >> /etc/hosts",
+            ],
+        }
+        if self.host_keys:
+            config.update(self.host_keys.cloud_config(index))
+        return config
+
+    def known_host_names(self, index):
+        """节点在集群内部的所有名称 (与 hosts_entries 对应)"""
+        return [self.hostname(index), f"node-{index}", self.private_ip(index)]
+
+    def user_data(self, index):
+        return encode_cloud_config(self.cloud_config(index))
@@ -0,0 +1,154 @@
+# coding: utf-8
+import argparse
+import shlex
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from rich.console import Console
+from hwscheduler.huawei.cluster import ClusterGroup
+from hwscheduler.huawei.transfer import parallel_put, local_sha256
+
+console = Console()
+
+BROADCAST_TREE = "tree"
+BROADCAST_CHAIN = "chain"
+BROADCAST_MODES = (BROADCAST_TREE, BROADCAST_CHAIN)
+
+RELAY_SCRIPT_PATH = "/tmp/hwscheduler_relay.sh"
+# 从标准输入接收文件写到 $1; 后面还有节点时边写边经免密SSH转发给下一个节点 (链式流水线)
+RELAY_SCRIPT = f"""set -o pipefail
+path="$1"; shift
+if [ $# -eq 0 ]; then
+    cat > "$path.part"
+else
+    next="$1"; shift
+    tee "$path.part" | ssh -o BatchMode=yes -o ConnectTimeout=10 "$next" bash {RELAY_SCRIPT_PATH} "$path" "$@"
+fi && mv "$path.part" "$path"
+"""
+
+
+def binomial_schedule(count):
+    """二项树分发顺序: 节点i -> 依次发送的目标节点序号
+
+    每一轮所有已持有文件的节点各发给一个新节点, 持有者数量逐轮翻倍, 约 log2(count) 轮完成。
+    """
+    receivers = {i: [] for i in range(count)}
+    step = 1
+    while step < count:
+        for i in range(min(step, count - step)):
+            receivers[i].append(i + step)
+        step *= 2
+    return receivers
+
+
+def _ssh_target(group, node):
+    return f"{group.user}@{node['private_ip']}"
+
+
+def _run_one(group, node, command):
+    return group.run(command, hosts=[node['hostname']], stream=False)[node['hostname']]
+
+
+def broadcast(group, remote_path, local_path=None, mode=BROADCAST_TREE, verify=True):
+    """把文件分发到 group 的所有节点 (ClusterGroup, 节点通常来自 *_nodes_info.txt)
+
+    local_path 不为空时调度机只上传一次到第一个节点, 否则第一个节点上必须已有 remote_path。
+    之后节点之间经私有IP和 configure_pwdless 配置的免密SSH中继:
+    tree 按二项树逐轮翻倍 (发送失败的节点的下游由发送方接手), chain 沿节点顺序流水线转发。
+    返回 hostname -> 是否收到 (verify=True 时按sha256校验)。
+    """
+    nodes = group.nodes
+    results = {node['hostname']: False for node in nodes}
+    if not nodes:
+        return results
+    root = nodes[0]
+    started = time.monotonic()
+    if local_path:
+        with group.connection(root) as conn:
+            parallel_put(conn, local_path, remote_path)
+    results[root['hostname']] = True
+
+    # 中继脚本很小, 直接写到所有节点
+    install = group.run(f"cat > {RELAY_SCRIPT_PATH} <<'HWS_RELAY'\n{RELAY_SCRIPT}HWS_RELAY", stream=False)
+    for hostname in ClusterGroup.failed(install):
+        console.print(f"[red]✗ {hostname} 写入中继脚本失败[/red]")
+    path = shlex.quote(remote_path)
+    ssh = "ssh -o BatchMode=yes -o ConnectTimeout=10"
+
+    if mode == BROADCAST_CHAIN and len(nodes) > 1:
+        targets = [_ssh_target(group, node) for node in nodes[1:]]
+        result = _run_one(group, root,
+                          f"{ssh} {targets[0]} bash {RELAY_SCRIPT_PATH} {path} {' '.join(targets[1:])} < {path}")
+        for node in nodes[1:]:
+            results[node['hostname']] = result['ok']
+    elif len(nodes) > 1:
+        schedule = binomial_schedule(len(nodes))
+        pending = []
+        lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+            def relay(i):
+                queue = deque(schedule[i])
+                while queue:
+                    j = queue.popleft()
+                    result = _run_one(group, nodes[i],
+                                      f"{ssh} {_ssh_target(group, nodes[j])} bash {RELAY_SCRIPT_PATH} {path} < {path}")
+                    results[nodes[j]['hostname']] = result['ok']
+                    if result['ok']:
+                        with lock:
+                            pending.append(executor.submit(relay, j))
+                    else:
+                        console.print(f"[yellow]⚠ {nodes[i]['hostname']} -> {nodes[j]['hostname']} 转发失败, "
+                                      f"由 {nodes[i]['hostname']} 接手其下游[/yellow]")
+                        queue.extend(schedule[j])
+
+            pending.append(executor.submit(relay, 0))
+            while True:
+                with lock:
+                    if not pending:
+                        break
+                    future = pending.pop()
+                future.result()
+
+    if verify:
+        if local_path:
+            expected = local_sha256(local_path)
+        else:
+            expected = (_run_one(group, root, f"sha256sum {path}")['stdout'].split() or [""])[0]
+        sums = group.run(f"sha256sum {path}", stream=False)
+        for hostname, result in sums.items():
+            results[hostname] = bool(result['ok'] and expected and result['stdout'].split()[0] == expected)
+
+    received = sum(results.values())
+    console.print(f"[green]✓ {remote_path} 已分发到 {received}/{len(nodes)} 个节点 "
+                  f"({mode}, {time.monotonic() - started:.1f}s)[/green]")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='把大文件经节点间私网中继分发到集群所有节点',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""示例:
+  python -m hwscheduler.huawei.broadcast --cluster-info ./cache/spark_nodes_info.txt \\
+    --key-path KeyPair.pem --file ./cache/bundle.tar.gz --dest /tmp/bundle.tar.gz
+""")
+    parser.add_argument('--cluster-info', required=True, help='read_cluster_info_file 格式的节点文件')
+    parser.add_argument('--key-path', required=True, help='SSH私钥路径')
+    parser.add_argument('--user', default='root', help='远程用户 (默认: root)')
+    parser.add_argument('--file', default=None, help='本地文件 (不指定时第一个节点上必须已有 --dest)')
+    parser.add_argument('--dest', required=True, help='节点上的目标路径')
+    parser.add_argument('--mode', choices=BROADCAST_MODES, default=BROADCAST_TREE, help='tree: 二项树; chain: 流水线链')
+    args = parser.parse_args()
+
+    group = ClusterGroup.from_cluster_info(args.cluster_info, user=args.user, key_path=args.key_path)
+    results = broadcast(group, args.dest, args.file, args.mode)
+    group.pool.close_all()
+    failed = [hostname for hostname, ok in results.items() if not ok]
+    if failed:
+        console.print(f"[red]✗ 分发失败: {', '.join(failed)}[/red]")
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
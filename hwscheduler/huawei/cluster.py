@@ -0,0 +1,206 @@
+# coding: utf-8
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
+from hwscheduler.huawei.config_pwdless import read_cluster_info_file
+from hwscheduler.huawei.connection_pool import shared_pool
+
+console = Console()
+
+
+def read_instances_info_file(file_path):
+    """读取 ECSInstanceManager.save_instances_info 写出的实例信息文件, 返回节点列表"""
+    nodes = []
+    with open(file_path, 'r') as f:
+        next(f, None)  # 跳过表头
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) < 6:
+                continue
+            nodes.append({
+                'hostname': f"node-{parts[0]}",
+                'server_id': parts[1],
+                'private_ip': parts[3],
+                'public_ip': parts[4],
+            })
+    return nodes
+
+
+class _PrefixedStream:
+    """把远端输出按行加上主机名前缀打印, 供 fabric 的 out_stream/err_stream 使用"""
+
+    def __init__(self, hostname, style):
+        self.hostname = hostname
+        self.style = style
+        self._buffer = ""
+
+    def write(self, data):
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            console.print(f"[{self.style}]{self.hostname}[/{self.style}] | {escape(line)}", highlight=False)
+
+    def flush(self):
+        if self._buffer:
+            self.write("\n")
+
+
+class ClusterGroup:
+    """在一组集群节点上并行执行命令或脚本
+
+    节点记录来自 read_cluster_info_file / read_instances_info_file (或实例详情);
+    连接经 ClusterNetwork 决定地址和跳板机, 并从连接池复用。
+    并发数由 max_workers 限制, 每个主机有独立的超时, 输出可按行实时打印,
+    结果以 hostname -> 结果字典 返回, 可用 show() 汇总成表格。
+    """
+
+    def __init__(self, nodes, user="root", key_path=None, network=None, pool=None, max_workers=16, timeout=None):
+        self.nodes = list(nodes)
+        self.user = user
+        self.key_path = key_path
+        self.network = network
+        self.pool = pool or shared_pool()
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+    @classmethod
+    def from_cluster_info(cls, file_path, **kwargs):
+        return cls(read_cluster_info_file(file_path), **kwargs)
+
+    @classmethod
+    def from_instances_info(cls, file_path, **kwargs):
+        return cls(read_instances_info_file(file_path), **kwargs)
+
+    @property
+    def hostnames(self):
+        return [node['hostname'] for node in self.nodes]
+
+    def select(self, hostnames=None, predicate=None):
+        """按主机名或条件挑选子集, 返回新的 ClusterGroup (共享连接池和网络设置)"""
+        wanted = set(hostnames) if hostnames is not None else None
+        nodes = [node for node in self.nodes
+                 if (wanted is None or node['hostname'] in wanted) and (predicate is None or predicate(node))]
+        return ClusterGroup(nodes, self.user, self.key_path, self.network, self.pool, self.max_workers, self.timeout)
+
+    def connection(self, node):
+        """到节点的池化连接 (with 语句), 经 network 决定地址和跳板机"""
+        if self.network is None:
+            return self.pool.connection(node['public_ip'], self.user, self.key_path)
+        gateway = None if self.network.is_bastion(node) else self.network.gateway()
+        return self.pool.connection(self.network.ssh_host(node), self.user, self.key_path, gateway)
+
+    def _run_on(self, node, action, stream, timeout):
+        started = time.monotonic()
+        result = {'hostname': node['hostname'], 'ok': False, 'exited': None,
+                  'stdout': "", 'stderr': "", 'duration': 0.0, 'error': None}
+        streams = {}
+        if stream:
+            streams = {'out_stream': _PrefixedStream(node['hostname'], "cyan"),
+                       'err_stream': _PrefixedStream(node['hostname'], "red")}
+        try:
+            with self.connection(node) as conn:
+                run = action(conn, dict(streams, warn=True, hide=not stream, timeout=timeout))
+            result.update(ok=run.ok, exited=run.exited, stdout=run.stdout, stderr=run.stderr)
+        except Exception as e:
+            result['error'] = str(e) or type(e).__name__
+        finally:
+            for s in streams.values():
+                s.flush()
+        result['duration'] = time.monotonic() - started
+        return result
+
+    def _fan_out(self, action, hosts=None, stream=True, timeout=None):
+        group = self.select(hosts) if hosts is not None else self
+        timeout = timeout if timeout is not None else self.timeout
+        results = {}
+        if not group.nodes:
+            return results
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(group.nodes))) as executor:
+            futures = {executor.submit(self._run_on, node, action, stream, timeout): node['hostname']
+                       for node in group.nodes}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+
+    def run(self, command, hosts=None, stream=True, timeout=None, env=None):
+        """在全部 (或 hosts 指定的) 节点上执行命令, 返回 hostname -> 结果"""
+        if env:
+            return self._fan_out(lambda conn, kwargs: conn.run(command, env=env, **kwargs), hosts, stream, timeout)
+        return self._fan_out(lambda conn, kwargs: conn.run(command, **kwargs), hosts, stream, timeout)
+
+    def sudo(self, command, hosts=None, stream=True, timeout=None):
+        return self._fan_out(lambda conn, kwargs: conn.sudo(command, **kwargs), hosts, stream, timeout)
+
+    def run_script(self, local_path, args="", hosts=None, stream=True, timeout=None, interpreter="bash"):
+        """上传本地脚本到各节点并执行"""
+        remote_path = f"/tmp/{os.path.basename(local_path)}"
+
+        def action(conn, kwargs):
+            conn.put(local_path, remote_path)
+            return conn.run(f"{interpreter} {remote_path} {args}", **kwargs)
+        return self._fan_out(action, hosts, stream, timeout)
+
+    @staticmethod
+    def failed(results):
+        return [hostname for hostname, result in results.items() if not result['ok']]
+
+    @staticmethod
+    def show(results, title="执行结果"):
+        table = Table(title=title, show_header=True, header_style="bold cyan")
+        table.add_column("节点")
+        table.add_column("状态")
+        table.add_column("退出码", justify="right")
+        table.add_column("耗时(s)", justify="right")
+        table.add_column("说明")
+        for hostname in sorted(results):
+            result = results[hostname]
+            status = "[green]✓[/green]" if result['ok'] else "[red]✗[/red]"
+            detail = result['error'] or (result['stderr'].strip().splitlines() or [""])[-1]
+            table.add_row(hostname, status, str(result['exited'] if result['exited'] is not None else "-"),
+                          f"{result['duration']:.1f}", detail[:80])
+        console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='在集群节点上并行执行命令',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""示例:
+  python -m hwscheduler.huawei.cluster --cluster-info ./cache/spark_nodes_info.txt \\
+    --key-path KeyPair.pem --command "uptime"
+""")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--cluster-info', help='read_cluster_info_file 格式的节点文件')
+    source.add_argument('--instances-info', help='save_instances_info 写出的实例信息文件')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--command', help='要执行的命令')
+    action.add_argument('--script', help='要上传并执行的本地脚本')
+    parser.add_argument('--key-path', required=True, help='SSH私钥路径')
+    parser.add_argument('--user', default='root', help='远程用户 (默认: root)')
+    parser.add_argument('--hosts', nargs='*', default=None, help='只在这些主机名上执行')
+    parser.add_argument('--parallel', type=int, default=16, help='最大并发节点数')
+    parser.add_argument('--timeout', type=int, default=None, help='每个主机的命令超时(秒)')
+    parser.add_argument('--quiet', action='store_true', default=False, help='不实时打印输出')
+    args = parser.parse_args()
+
+    kwargs = dict(user=args.user, key_path=args.key_path, max_workers=args.parallel, timeout=args.timeout)
+    if args.cluster_info:
+        group = ClusterGroup.from_cluster_info(args.cluster_info, **kwargs)
+    else:
+        group = ClusterGroup.from_instances_info(args.instances_info, **kwargs)
+    if args.command:
+        results = group.run(args.command, hosts=args.hosts, stream=not args.quiet)
+    else:
+        results = group.run_script(args.script, hosts=args.hosts, stream=not args.quiet)
+    ClusterGroup.show(results)
+    group.pool.close_all()
+    if ClusterGroup.failed(results):
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
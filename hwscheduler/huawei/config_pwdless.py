@@ -1,8 +1,9 @@
-from fabric import Connection
 from concurrent.futures import ThreadPoolExecutor
 import os
 import subprocess
 import argparse
+from hwscheduler.huawei.ssh_probe import wait_for_ssh
+from hwscheduler.huawei.connection_pool import shared_pool
 
 def generate_ssh_key_locally(key_path="~/.ssh/cluster_key"):
     """
@@ -102,17 +103,14 @@ def clean_and_update_hosts(conn, nodes):
     # 验证更新
     conn.run("cat /etc/hosts")
 
-def configure_node(node, initial_key_path, user, nodes, private_key):
+def configure_node(node, initial_key_path, user, nodes, private_key, pool=None):
     """
     配置单个节点，上传私钥和公钥，配置authorized_keys，配置/etc/hosts和SSH客户端
     """
     print(f"\n--- Configuring node: {node['hostname']} ({node['public_ip']}) ---")
     try:
-        with Connection(
-            host=node['public_ip'],  # 使用public_ip连接
-            user=user,
-            connect_kwargs={"key_filename": initial_key_path},
-        ) as conn:
+        # 使用public_ip连接, 连接保留在池中供后续步骤复用
+        with (pool or shared_pool()).connection(node['public_ip'], user, initial_key_path) as conn:
             # 1. 清理并更新hosts文件
             print("\nUpdating /etc/hosts...")
             clean_and_update_hosts(conn, nodes)
@@ -155,7 +153,7 @@ Host *
         print(f"Error configuring node {node['hostname']}: {e}")
         return False
 
-def configure_pwdless(cluster_info,key_path,user):
+def configure_pwdless(cluster_info,key_path,user,pool=None):
     local_key_path = "/root/.ssh/cluster_key"
     nodes = read_cluster_info_file(cluster_info)
     
@@ -170,14 +168,19 @@ def configure_pwdless(cluster_info,key_path,user):
     # 在宿主机生成SSH密钥对
     print("=== Generating SSH key pair on local machine ===")
     local_private_key_path, public_key_content = generate_ssh_key_locally(local_key_path)
-    
-    
+
+    # 等待所有节点的SSH端口就绪后再并行配置
+    print("=== Waiting for SSH on all nodes ===")
+    ready = wait_for_ssh([node['public_ip'] for node in nodes])
+    not_ready = [node['hostname'] for node in nodes if not ready[node['public_ip']]]
+    if not_ready:
+        print(f"SSH not ready on: {', '.join(not_ready)}")
     
     with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
         futures = []
         for node in nodes:
             futures.append(executor.submit(
-                configure_node, node, key_path, user, nodes,local_private_key_path
+                configure_node, node, key_path, user, nodes,local_private_key_path,pool
             ))
         
         # Wait for all tasks to complete and collect results
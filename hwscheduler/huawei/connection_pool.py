@@ -0,0 +1,143 @@
+# coding: utf-8
+import threading
+import time
+from contextlib import contextmanager
+from fabric import Connection
+from rich.console import Console
+
+console = Console()
+
+
+class _PooledConnection:
+    """池中的一个连接及其使用状态"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self.in_use = 0
+
+
+def _gateway_key(gateway):
+    """跳板机在池键中的表示: fabric Connection 按 (user, host, port), 其它 (如 ProxyCommand 字符串) 原样使用"""
+    if gateway is None or isinstance(gateway, str):
+        return gateway
+    return (gateway.user, gateway.host, gateway.port)
+
+
+class ConnectionPool:
+    """按 (host, user, key, gateway) 复用的 fabric 连接池
+
+    同一任务的多个步骤先后复用池中的连接, 避免在高延迟的EIP上重复TCP、密钥交换和认证握手。
+    fabric Connection 不能被多个线程同时使用, 因此 connection() 独占借出一个连接:
+    并发的步骤 (例如DAG中并行的阶段) 访问同一主机时各自得到一个连接, 归还后留在池中复用。
+    取出连接时做健康检查: 传输层已断开的直接重连, 空闲超过 check_after 秒的额外打开一个
+    session 通道确认对端仍然响应; 空闲超过 idle_timeout 秒的连接在下次访问池时被关闭
+    (借出中的连接不会被回收, 即使上面的命令运行很久)。
+    池中的连接由池管理, 调用方不要自行 close(), 用完后由 close_all() 统一关闭。
+    """
+
+    def __init__(self, idle_timeout=300, check_after=30, connect_timeout=10):
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.connect_timeout = connect_timeout
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _healthy(self, entry, now):
+        transport = entry.conn.client.get_transport() if entry.conn.is_connected else None
+        if transport is None or not transport.is_active():
+            return False
+        if now - entry.last_checked < self.check_after:
+            return True
+        try:
+            transport.open_session(timeout=self.connect_timeout).close()
+        except Exception:
+            return False
+        entry.last_checked = now
+        return True
+
+    def _acquire(self, host, user, key_path, gateway):
+        """借出一个到 host 的空闲连接 (必要时新建), 返回池中的记录"""
+        self.evict_idle()
+        key = (host, user, key_path, _gateway_key(gateway))
+        with self._key_lock(key):
+            now = time.monotonic()
+            with self._lock:
+                idle = [entry for entry in self._entries.get(key, []) if not entry.in_use]
+            for entry in idle:
+                if self._healthy(entry, now):
+                    break
+                console.print(f"[dim]连接 {user}@{host} 已失效, 重新连接[/dim]")
+                with self._lock:
+                    self._entries[key].remove(entry)
+                entry.conn.close()
+            else:
+                conn = Connection(
+                    host=host,
+                    user=user,
+                    connect_kwargs={"key_filename": key_path},
+                    connect_timeout=self.connect_timeout,
+                    gateway=gateway,
+                )
+                conn.open()
+                entry = _PooledConnection(conn)
+                with self._lock:
+                    self._entries.setdefault(key, []).append(entry)
+            with self._lock:
+                entry.in_use += 1
+                entry.last_used = now
+            return entry
+
+    def _release(self, entry):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    @contextmanager
+    def connection(self, host, user="root", key_path=None, gateway=None):
+        """独占借出一个连接; 退出时不关闭连接, 归还到池中并刷新其使用时间"""
+        entry = self._acquire(host, user, key_path, gateway)
+        try:
+            yield entry.conn
+        finally:
+            self._release(entry)
+
+    def evict_idle(self):
+        """关闭空闲超时的连接"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for key, entries in list(self._entries.items()):
+                expired = [entry for entry in entries
+                           if not entry.in_use and now - entry.last_used > self.idle_timeout]
+                evicted.extend(expired)
+                self._entries[key] = [entry for entry in entries if entry not in expired]
+                if not self._entries[key]:
+                    del self._entries[key]
+        for entry in evicted:
+            entry.conn.close()
+        return len(evicted)
+
+    def close_all(self):
+        with self._lock:
+            entries = [entry for key_entries in self._entries.values() for entry in key_entries]
+            self._entries.clear()
+        for entry in entries:
+            entry.conn.close()
+
+
+_shared_pool = None
+
+
+def shared_pool():
+    """进程内共享的连接池"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = ConnectionPool()
+    return _shared_pool
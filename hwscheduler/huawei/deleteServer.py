@@ -6,8 +6,10 @@ from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkecs.v2.region.ecs_region import EcsRegion
 from huaweicloudsdkcore.exceptions import exceptions
 from huaweicloudsdkecs.v2 import *
+from hwscheduler.huawei.rate_limiter import call_api
+from hwscheduler.huawei.polling import default_job_policy
 
-def delete_servers(servers, region, ak, sk, max_retries=2):
+def delete_servers(servers, region, ak, sk, max_retries=2, policy=None, delete_publicip=True):
     """
     Deletes Huawei Cloud ECS instances.
 
@@ -17,6 +19,8 @@ def delete_servers(servers, region, ak, sk, max_retries=2):
         ak (str): Huawei Cloud Access Key.
         sk (str): Huawei Cloud Secret Key.
         max_retries (int): Maximum number of retries.
+        policy (PollingPolicy): Polling policy for the delete job, defaults to default_job_policy().
+        delete_publicip (bool): Release bound EIPs together with the servers; False keeps them (e.g. pooled EIPs).
 
     Returns:
         bool: True if all servers were deleted successfully, False otherwise.
@@ -34,6 +38,7 @@ def delete_servers(servers, region, ak, sk, max_retries=2):
 
         retry_count = 0
         last_exception = None
+        policy = policy or default_job_policy()
 
         while retry_count <= max_retries:
             try:
@@ -41,27 +46,27 @@ def delete_servers(servers, region, ak, sk, max_retries=2):
                 request = DeleteServersRequest()
                 request.body = DeleteServersRequestBody(
                     servers=servers,
-                    delete_publicip=True,  # 同时删除EIP
+                    delete_publicip=delete_publicip,  # 是否同时删除EIP
                     delete_volume=True     # 同时删除磁盘
                 )
-                response = client.delete_servers(request)
+                response = call_api(client.delete_servers, request)
 
                 # 2. 获取Job ID
                 job_id = response.job_id
                 print(f"删除操作已提交，Job ID: {job_id}")
 
-                # 3. 轮询Job状态
-                max_attempts = 30  # 最大尝试次数
-                wait_interval = 10  # 每次等待间隔(秒)
-
+                # 3. 轮询Job状态 (快速开始, 指数退避)
                 from huaweicloudsdkecs.v2 import ShowJobRequest
 
-                for attempt in range(max_attempts):
+                session = policy.start("job:delete_servers")
+                status = None
+                while not session.expired():
+                    session.sleep()
                     job_request = ShowJobRequest(job_id=job_id)
-                    job_response = client.show_job(job_request)
+                    job_response = call_api(client.show_job, job_request)
 
                     status = job_response.status
-                    print(f"Job状态检查 [{attempt+1}/{max_attempts}]: {status}")
+                    print(f"Job状态检查 [{int(session.elapsed)}s/{policy.timeout}s]: {status}")
 
                     # 添加子任务状态检查
                     if hasattr(job_response, 'sub_jobs') and job_response.sub_jobs:
@@ -70,6 +75,7 @@ def delete_servers(servers, region, ak, sk, max_retries=2):
                                 print(f"子任务失败 - 类型: {sub_job.type}, 原因: {sub_job.fail_reason}")
 
                     if status == "SUCCESS":
+                        session.succeeded()
                         print("服务器及相关资源(EIP、磁盘)删除成功完成!")
                         return True
                     elif status == "FAIL":
@@ -77,8 +83,6 @@ def delete_servers(servers, region, ak, sk, max_retries=2):
                         # 准备重试
                         break
 
-                    time.sleep(wait_interval)
-
                 print(f"等待超时，未能在预期时间内完成删除操作。最后状态: {status}")
 
                 # 如果执行到这里，说明删除失败或超时
@@ -1,6 +1,5 @@
 # coding: utf-8
 # 在文件顶部添加新的import
-from fabric import Connection
 from concurrent.futures import ThreadPoolExecutor
 import os
 import subprocess
@@ -9,6 +8,7 @@ import argparse
 import os
 import time
 import base64
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from rich.console import Console
@@ -22,13 +22,19 @@ from huaweicloudsdkeip.v2.region.eip_region import EipRegion
 from huaweicloudsdkeip.v2 import *
 from huaweicloudsdkcore.exceptions import exceptions
 from hwscheduler.huawei.fabric_login import connect_with_key
+from hwscheduler.huawei.rate_limiter import call_api
+from hwscheduler.huawei.polling import default_ready_policy, default_job_policy
+from hwscheduler.huawei.network import ClusterNetwork, NETWORK_MODES, NETWORK_PUBLIC, NETWORK_BASTION, NETWORK_PRIVATE
+from hwscheduler.huawei.bootstrap import ClusterBootstrap, encode_cloud_config
+from hwscheduler.huawei.host_keys import HostKeys
 console = Console()
 
 # 添加新的SSH配置类
 class SSHConfigurator:
-    def __init__(self, ak, sk, region):
+    def __init__(self, ak, sk, region, network=None):
         self.credentials = BasicCredentials(ak, sk)
         self.region = region
+        self.network = network or ClusterNetwork()  # 决定经公网IP还是跳板机访问节点
 
     def generate_ssh_key_locally(self, key_path="~/.ssh/cluster_key"):
         """在本地生成SSH密钥对"""
@@ -71,28 +77,24 @@ class SSHConfigurator:
         conn.sudo(f"echo '{new_hosts_content}' > /etc/hosts", warn=True)
         console.print(f"[dim]已更新 {conn.host} 的hosts文件[/dim]")
 
-    def configure_node(self, node, initial_key_path, user, nodes, private_key):
-        """配置单个节点的SSH免密登录"""
+    @staticmethod
+    def node_from_instance(info):
+        """实例详情 -> 节点信息 (主机名按序号命名)"""
+        return {
+            'hostname': f"node-{info['index']}",
+            'public_ip': info.get('public_ip', 'N/A'),
+            'private_ip': info['private_ip']
+        }
+
+    def configure_node_keys(self, node, initial_key_path, user, private_key):
+        """节点SSH可用后立即上传集群密钥并配置免密登录 (不涉及hosts文件)"""
         max_retries = 3
-        retry_delay = 10  # 秒
-        time.sleep(30)
-        print("mydebug:configure node:",node['public_ip'],user,initial_key_path)
+        retry_delay = 2  # 秒, SSH端口已确认就绪, 失败多为瞬时错误
+        if not self.network.wait_for_ssh([node])[node['hostname']]:
+            return False
         for attempt in range(max_retries):
             try:
-                with Connection(
-                    host=node['public_ip'],
-                    user=user,
-                    connect_kwargs={
-                        "key_filename": initial_key_path,
-                    }
-                ) as conn:
-                    # Test the connection (optional, but recommended)
-                    # 先执行一个简单的命令测试连接是否真正可用
-                    conn.run("echo 'Testing SSH connection'", hide=True, warn=True)
-                    
-                    # 更新hosts文件
-                    self.clean_and_update_hosts(conn, nodes)
-                    
+                with self.network.connect(node, user, initial_key_path) as conn:
                     # 配置SSH目录和权限
                     conn.run("mkdir -p ~/.ssh && chmod 700 ~/.ssh", hide=True)
                     
@@ -127,6 +129,30 @@ class SSHConfigurator:
                     continue
                 console.print(f"[red]✗ 配置 {node['hostname']} 失败: {str(e)}[/red]")
                 return False
+
+    def sync_node_hosts(self, node, initial_key_path, user, nodes):
+        """把完整的节点列表写入单个节点的/etc/hosts"""
+        try:
+            with self.network.connect(node, user, initial_key_path) as conn:
+                self.clean_and_update_hosts(conn, nodes)
+            return True
+        except Exception as e:
+            console.print(f"[red]✗ 更新 {node['hostname']} 的hosts失败: {str(e)}[/red]")
+            return False
+
+    def sync_cluster_hosts(self, nodes, initial_key_path, user="root"):
+        """集群唯一的屏障: 所有节点就绪后并行同步hosts文件, 返回成功的节点数"""
+        if not nodes:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(10, len(nodes))) as executor:
+            results = executor.map(lambda node: self.sync_node_hosts(node, initial_key_path, user, nodes), nodes)
+            return sum(1 for ok in results if ok)
+
+    def configure_node(self, node, initial_key_path, user, nodes, private_key):
+        """配置单个节点的SSH免密登录"""
+        return self.configure_node_keys(node, initial_key_path, user, private_key) \
+            and self.sync_node_hosts(node, initial_key_path, user, nodes)
+
     def configure_cluster_pwdless(self, nodes_info, initial_key_path, user="root"):
         """配置整个集群的免密登录"""
         if not nodes_info:
@@ -134,32 +160,57 @@ class SSHConfigurator:
             return False
 
         console.rule("[bold blue]配置集群SSH免密登录[/bold blue]")
-        
-        # 生成密钥对
-        private_key, _ = self.generate_ssh_key_locally()
-        
-        # 准备节点信息
-        nodes = [{
-            'hostname': f"node-{info['index']}",
-            'public_ip': info['public_ip'],
-            'private_ip': info['private_ip']
-        } for info in nodes_info if info.get('public_ip') != 'N/A']
-        
-        console.print(f"[cyan]正在为 {len(nodes)} 个节点配置免密登录...[/cyan]")
-        
-        # 使用线程池并行配置
-        success_count = 0
-        with ThreadPoolExecutor(max_workers=min(5, len(nodes))) as executor:
-            futures = []
-            for node in nodes:
-                futures.append(executor.submit(
-                    self.configure_node, node, initial_key_path, user, nodes, private_key
-                ))
-            
-            for future in as_completed(futures):
-                if future.result():
-                    success_count += 1
-        
+        self.network.use_nodes(nodes_info)
+        setup = StreamingClusterSetup(self, initial_key_path, user)
+        for info in nodes_info:
+            setup.submit(info)
+        return setup.finish()
+
+
+class StreamingClusterSetup:
+    """流式集群配置: 实例一旦ACTIVE就开始SSH探测和密钥配置
+
+    submit() 在实例就绪时调用, 立即在后台线程中配置该节点;
+    finish() 等待所有节点的密钥配置完成后统一同步hosts文件, 这是唯一的屏障。
+    """
+
+    def __init__(self, configurator, initial_key_path, user="root", max_workers=10):
+        self.configurator = configurator
+        self.initial_key_path = initial_key_path
+        self.user = user
+        self.private_key, _ = configurator.generate_ssh_key_locally()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+
+    def submit(self, instance_info):
+        """提交一个就绪的实例; 调度机无法访问的实例 (例如没有公网IP) 忽略"""
+        if not self.configurator.network.reachable(instance_info):
+            return None
+        node = self.configurator.node_from_instance(instance_info)
+        future = self._executor.submit(
+            self.configurator.configure_node_keys, node, self.initial_key_path, self.user, self.private_key
+        )
+        self._futures[future] = node
+        return future
+
+    def finish(self):
+        """等待全部节点配置完成并同步hosts, 返回是否全部成功"""
+        try:
+            configured = []
+            for future in as_completed(self._futures):
+                try:
+                    if future.result():
+                        configured.append(self._futures[future])
+                except Exception as e:
+                    console.print(f"[red]✗ 配置 {self._futures[future]['hostname']} 出错: {str(e)}[/red]")
+        finally:
+            self._executor.shutdown(wait=False)
+
+        nodes = sorted(self._futures.values(), key=lambda node: node['hostname'])
+        console.print(f"[cyan]正在同步 {len(nodes)} 个节点的hosts文件...[/cyan]")
+        hosts_synced = self.configurator.sync_cluster_hosts(nodes, self.initial_key_path, self.user)
+        success_count = min(len(configured), hosts_synced)
+
         console.print(Panel(
             f"[bold]SSH配置完成![/bold]\n\n"
             f"[white]总节点数:[/white] {len(nodes)}\n"
@@ -168,8 +219,8 @@ class SSHConfigurator:
             title="SSH配置结果",
             border_style="blue"
         ))
-        
-        return success_count == len(nodes)
+        return bool(nodes) and success_count == len(nodes)
+
 class EIPManager:
     def __init__(self, ak, sk, region):
         self.credentials = BasicCredentials(ak, sk)
@@ -178,6 +229,27 @@ class EIPManager:
             .with_credentials(self.credentials) \
             .with_region(self.region) \
             .build()
+        self._bandwidth_ids = {}  # eip_id -> bandwidth_id
+
+    def bandwidth_id(self, eip_id):
+        """查询EIP对应的带宽ID (创建响应中不包含, 首次查询后缓存)"""
+        if eip_id not in self._bandwidth_ids:
+            response = call_api(self.client.show_publicip, ShowPublicipRequest(publicip_id=eip_id))
+            self._bandwidth_ids[eip_id] = response.publicip.bandwidth_id
+        return self._bandwidth_ids[eip_id]
+
+    def update_bandwidth(self, eip_id, size):
+        """调整EIP的带宽大小(Mbps), 返回是否成功"""
+        try:
+            request = UpdateBandwidthRequest(
+                bandwidth_id=self.bandwidth_id(eip_id),
+                body=UpdateBandwidthRequestBody(bandwidth=UpdateBandwidthOption(size=size))
+            )
+            call_api(self.client.update_bandwidth, request)
+            return True
+        except exceptions.ClientRequestException as e:
+            console.print(f"[yellow]⚠ 调整EIP {eip_id} 带宽到 {size}Mbps 失败: {e.error_code} {e.error_msg}[/yellow]")
+            return False
 
     def create_eips(self, num_eips, task_name, bandwidth_size=5):
         """批量创建EIP"""
@@ -219,25 +291,30 @@ class EIPManager:
         
         return created_eips
 
+    def build_create_request(self, task_name, bandwidth_size=5):
+        """构造单个EIP的创建请求"""
+        request = CreatePublicipRequest()
+        publicip = CreatePublicipOption(type="5_bgp")
+        bandwidth = CreatePublicipBandwidthOption(
+            share_type="PER",
+            name=task_name,
+            size=bandwidth_size
+        )
+        request.body = CreatePublicipRequestBody(
+            bandwidth=bandwidth,
+            publicip=publicip,
+        )
+        return request
+
     def _create_single_eip(self, progress, task_id, task_name, bandwidth_size=5):
         """创建单个EIP"""
         progress.update(task_id, description=f"[cyan]准备创建EIP {task_name}...")
         
         try:
-            request = CreatePublicipRequest()
-            publicip = CreatePublicipOption(type="5_bgp")
-            bandwidth = CreatePublicipBandwidthOption(
-                share_type="PER",
-                name=task_name,
-                size=bandwidth_size
-            )
-            request.body = CreatePublicipRequestBody(
-                bandwidth=bandwidth,
-                publicip=publicip,
-            )
+            request = self.build_create_request(task_name, bandwidth_size)
             
             progress.update(task_id, description=f"[cyan]发送创建请求 {task_name}...")
-            response = self.client.create_publicip(request)
+            response = call_api(self.client.create_publicip, request)
 
             if not response.publicip:
                 progress.update(task_id, description=f"[bold red]✗ {task_name} 创建失败: 未返回EIP信息", completed=100, visible=False)
@@ -256,7 +333,7 @@ class EIPManager:
             progress.update(task_id, description=f"[bold red]✗ {task_name} 创建异常: {e.error_code}", completed=100, visible=False)
             return None
         except Exception as ex:
-            progress.update(task_id, description=f"[bold red]✗ {task_name} 创建未知异常", completed=100, visible=False)
+            progress.update(task_id, description=f"[bold red]✗ {task_name} 创建未知异常: {ex}", completed=100, visible=False)
             return None
 
     def delete_eips(self, eip_ids):
@@ -315,7 +392,7 @@ class EIPManager:
             
             try:
                 request = DeletePublicipRequest(publicip_id=eip_id)
-                self.client.delete_publicip(request)
+                call_api(self.client.delete_publicip, request)
                 
                 progress.update(task_id, description=f"[green]✓ {eip_id} 删除成功!", completed=1)
                 deleted = True
@@ -330,7 +407,7 @@ class EIPManager:
                 if retry_count <= max_retries: 
                     time.sleep(5 * (retry_count))
             except Exception as ex:
-                progress.update(task_id, description=f"[red]删除 {eip_id} 未知错误 (尝试 {retry_count + 1})")
+                progress.update(task_id, description=f"[red]删除 {eip_id} 未知错误: {ex} (尝试 {retry_count + 1})")
                 retry_count += 1
                 if retry_count <= max_retries: 
                     time.sleep(5)
@@ -339,11 +416,167 @@ class EIPManager:
             progress.update(task_id, description=f"[bold red]✗ {eip_id} 删除失败 (最大重试)", completed=1)
         return deleted
 
+def extract_server_details(server):
+    """从ServerDetail中提取实例ID、私有IP、公网IP和状态"""
+    private_ip = None
+    public_ip = None
+
+    # 获取私有IP
+    if getattr(server, 'addresses', None):
+        for _, ip_list in server.addresses.items():
+            for ip_info in ip_list:
+                if ip_info.addr:
+                    if ip_info.os_ext_ip_stype == 'fixed':
+                        private_ip = ip_info.addr
+                    elif ip_info.os_ext_ip_stype == 'floating':
+                        public_ip = ip_info.addr
+                    break
+            if private_ip and public_ip:
+                break
+
+    # 获取EIP信息
+    if getattr(server, 'publicip', None) and getattr(server.publicip, 'public_ip_address', None):
+        public_ip = server.publicip.public_ip_address
+
+    return {
+        'id': server.id,
+        'private_ip': private_ip if private_ip else "N/A",
+        'public_ip': public_ip if public_ip else "N/A",
+        'status': server.status
+    }
+
+class _ServerWaiter:
+    """单个实例的等待状态, 各自按 PollingPolicy 退避 (due为下一次需要查询的时间)"""
+    def __init__(self, server_id, name_tag=None, history_key=None, session=None):
+        self.server_id = server_id
+        self.name_tag = name_tag
+        self.history_key = history_key
+        self.registered = time.monotonic()
+        self.session = session
+        self.due = self.registered + session.next_delay() if session else self.registered
+        self.status = None
+        self.server = None
+        self.event = threading.Event()
+
+class InstanceStatusPoller:
+    """共享的实例状态轮询器
+
+    所有等待中的实例共用一个后台线程, 每个周期只发送一次
+    ListServersDetails 请求 (按Name标签或ID列表过滤), 再把结果分发给各个等待者,
+    使控制面调用次数从 O(N) 降为 O(1)。
+    查询间隔由 PollingPolicy 决定: 每个等待者有自己的退避进度, 线程睡到最早到期的等待者,
+    到期时一次查询全部等待中的实例, 只推进已到期者的退避; 新登记的实例不会推迟已有实例的查询。
+    """
+    TERMINAL_STATUSES = ("ACTIVE", "ERROR")
+    PAGE_LIMIT = 1000
+
+    def __init__(self, client, policy=None):
+        self.client = client
+        self.policy = policy or default_ready_policy()
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def register(self, server_id, name_tag=None, history_key=None):
+        """登记一个待轮询的实例, 返回其等待对象
+
+        name_tag为实例的Name标签值, 同一运行的实例可以用一次标签过滤查询全部拿到;
+        history_key用于记录/参考该类实例 (如同一规格) 的历史启动耗时
+        """
+        with self._lock:
+            waiter = self._waiters.get(server_id)
+            if waiter is None:
+                waiter = _ServerWaiter(server_id, name_tag, history_key, self.policy.start(history_key))
+                self._waiters[server_id] = waiter
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ecs-status-poller", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return waiter
+
+    def unregister(self, server_id):
+        with self._lock:
+            self._waiters.pop(server_id, None)
+
+    def _pending_waiters(self):
+        with self._lock:
+            return [w for w in self._waiters.values() if not w.event.is_set()]
+
+    def list_servers(self, name_tag=None, server_ids=None):
+        """一次性查询一组实例的详情 (按页获取), 按Name标签或ID列表过滤"""
+        servers = []
+        offset = 1
+        while True:
+            request = ListServersDetailsRequest(limit=self.PAGE_LIMIT, offset=offset)
+            if name_tag:
+                request.tags = f"Name={name_tag}"
+            else:
+                request.server_id = ",".join(server_ids)
+            response = call_api(self.client.list_servers_details, request)
+            page = response.servers or []
+            servers.extend(page)
+            if len(page) < self.PAGE_LIMIT:
+                return servers
+            offset += 1
+
+    def poll_once(self):
+        """执行一次批量查询并分发结果"""
+        pending = self._pending_waiters()
+        if not pending:
+            return
+        # 按Name标签分组, 每个标签一次请求; 没有标签的实例合并为一次ID列表查询
+        tags = {w.name_tag for w in pending if w.name_tag}
+        untagged_ids = [w.server_id for w in pending if not w.name_tag]
+        servers = []
+        for name_tag in tags:
+            servers.extend(self.list_servers(name_tag=name_tag))
+        if untagged_ids:
+            servers.extend(self.list_servers(server_ids=untagged_ids))
+        found = {server.id: server for server in servers}
+        with self._lock:
+            for waiter in pending:
+                server = found.get(waiter.server_id)
+                if server is None:
+                    continue
+                waiter.status = server.status
+                waiter.server = server
+                if server.status in self.TERMINAL_STATUSES:
+                    waiter.event.set()
+                    if server.status == "ACTIVE":
+                        self.policy.record(waiter.history_key, time.monotonic() - waiter.registered)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                # 没有等待者时退出线程, 下次register时重新启动
+                if all(w.event.is_set() for w in self._waiters.values()):
+                    self._thread = None
+                    return
+                self._wakeup.clear()
+                due = min(w.due for w in self._waiters.values() if not w.event.is_set())
+            # 等待期间有新实例登记则重新计算最早的到期时间 (新实例可能更早到期)
+            if self._wakeup.wait(max(0.0, due - time.monotonic())):
+                continue
+            now = time.monotonic()
+            with self._lock:
+                for waiter in self._waiters.values():
+                    if waiter.due <= now:
+                        waiter.due = now + waiter.session.next_delay()
+            try:
+                self.poll_once()
+            except exceptions.ClientRequestException as e:
+                console.print(f"[yellow]⚠ 批量查询实例状态失败: {e.error_code}[/yellow]")
+            except Exception as ex:
+                console.print(f"[yellow]⚠ 批量查询实例状态出错: {str(ex)}[/yellow]")
+
 class ECSInstanceManager:
-    def __init__(self, ak, sk, region):
+    def __init__(self, ak, sk, region, ready_policy=None, job_policy=None):
         self.ak = ak
         self.sk = sk
         self.region = region
+        self.ready_policy = ready_policy or default_ready_policy()  # 实例就绪等待策略
+        self.job_policy = job_policy or default_job_policy()  # Job完成等待策略
         self.credentials = BasicCredentials(ak, sk)
         self.ecs_region = EcsRegion.value_of(region)
         self.client = EcsClient.new_builder() \
@@ -353,32 +586,180 @@ class ECSInstanceManager:
         self.eip_manager = EIPManager(ak, sk, region)
         self.ssh_configurator = SSHConfigurator(ak, sk, region)  # 新增SSH配置器
         self.eip_list = []  # 新增实例变量存储EIP列表
+        self.eip_pool = None  # 设置为EIPPool后, EIP从池中借用并在实例删除后归还
+        self.status_poller = InstanceStatusPoller(self.client, self.ready_policy)  # 共享的实例状态轮询器
+
+    def build_create_request(self, vpc_id, instance_index, instance_type, instance_zone,
+                             ami, key_pair, security_group_id, subnet_id, run_number,
+                             task_type, timeout_hours, actor, eip_id=None, bootstrap=None, host_keys=None):
+        """构造单个实例的创建请求, 返回 (request, instance_name)
+
+        bootstrap为ClusterBootstrap时, 使用其规划的固定私有IP和完整的cloud-init配置;
+        host_keys为HostKeys时, 实例使用调度机预先生成的SSH主机密钥;
+        使用EIP池时EIP不随实例释放
+        """
+        instance_name = f"{run_number}-{task_type}-node{instance_index}-timeout{timeout_hours}-{actor}"
+
+        # 1. 准备创建请求
+        request = CreatePostPaidServersRequest()
+
+        # 2. 配置实例参数
+        root_volume = PostPaidServerRootVolume(volumetype="SSD")
+        nics = [PostPaidServerNic(subnet_id=subnet_id)]
+        sg_list = []
+        if security_group_id:
+            sg_list.append(PostPaidServerSecurityGroup(id=security_group_id))
+
+        if bootstrap:
+            nics = [PostPaidServerNic(subnet_id=subnet_id, ip_address=bootstrap.private_ip(instance_index))]
+            cloud_config = bootstrap.cloud_config(instance_index)
+        else:
+            cloud_config = {'hostname': f"node{instance_index}-{task_type}"}
+        if host_keys and not (bootstrap and bootstrap.host_keys):
+            cloud_config.update(host_keys.cloud_config(instance_index))
+        user_data = encode_cloud_config(cloud_config)
+
+        server_tags = [
+            PostPaidServerTag(key="Name", value=f'{run_number}-{task_type}'),
+            PostPaidServerTag(key="Index", value=f'{instance_index}'),
+            PostPaidServerTag(key="WarningHours", value=timeout_hours),
+            PostPaidServerTag(key="Actor", value=actor)
+        ]
+
+        terminate_time = datetime.utcnow() + timedelta(hours=int(timeout_hours))
+        terminate_time_str = terminate_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        server_body_params = {
+            'flavor_ref': instance_type,
+            'image_ref': ami,
+            'name': instance_name,
+            'key_name': key_pair,
+            'vpcid': vpc_id,
+            'nics': nics,
+            'root_volume': root_volume,
+            'user_data': user_data,
+            'server_tags': server_tags,
+            'availability_zone': instance_zone,
+            'auto_terminate_time': terminate_time_str
+        }
+        # 如果需要绑定EIP
+        if  eip_id:
+            server_body_params['publicip'] = PostPaidServerPublicip(
+                id=eip_id,
+                delete_on_termination=self.eip_pool is None
+            )
+        if sg_list:
+            server_body_params['security_groups'] = sg_list
+        server_body = PostPaidServer(**server_body_params)
+        request.body = CreatePostPaidServersRequestBody(server=server_body)
+        return request, instance_name
 
     def create_instance(self, progress, task_id, vpc_id, instance_index, instance_type, instance_zone,
                        ami, key_pair, security_group_id, subnet_id, run_number,
-                       task_type, timeout_hours, actor, eip_id=None):
+                       task_type, timeout_hours, actor, eip_id=None, bootstrap=None, host_keys=None):
         """创建单个ECS实例"""
         instance_name = f"{run_number}-{task_type}-node{instance_index}-timeout{timeout_hours}-{actor}"
         
         progress.update(task_id, description=f"[cyan]准备创建 {instance_name}...")
         try:
-            # 1. 准备创建请求
+            request, instance_name = self.build_create_request(
+                vpc_id, instance_index, instance_type, instance_zone, ami, key_pair,
+                security_group_id, subnet_id, run_number, task_type, timeout_hours, actor, eip_id, bootstrap,
+                host_keys
+            )
+
+            progress.update(task_id, description=f"[cyan]发送创建请求 {instance_name}...")
+            response = call_api(self.client.create_post_paid_servers, request)
+
+            if not response.server_ids or len(response.server_ids) == 0:
+                progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建失败: 未返回ID", completed=100, visible=False)
+                return None
+
+            server_id = response.server_ids[0]
+            progress.update(task_id, description=f"[green]✓ {instance_name} 请求成功 (ID: {server_id})...等待就绪")
+
+            instance_details = self._wait_for_instance_ready(progress, task_id, server_id, instance_name,
+                                                             name_tag=f'{run_number}-{task_type}',
+                                                             history_key=f"active:{instance_type}")
+            if not instance_details:
+                progress.update(task_id, description=f"[bold red]✗ {instance_name} 就绪失败", completed=100, visible=False)
+                return None
+            
+            progress.update(task_id, description=f"[bold green]✓ {instance_name} 创建完成!", completed=100, visible=False)
+            
+            # 修改_create_instance方法中的返回部分
+            return {
+                'index': instance_index,
+                'id': instance_details['id'],
+                'name': instance_name,
+                'private_ip': instance_details['private_ip'],
+                # 如果有EIP，则使用EIP的IP地址，否则使用实例详情中的公网IP或'N/A'
+                'public_ip': next((eip['ip'] for eip in self.eip_list if eip['id'] == eip_id), instance_details.get('public_ip', 'N/A')),
+                'status': instance_details['status'],
+                'eip_id': eip_id
+            }
+
+        except exceptions.ClientRequestException as e:
+            print(f"创建失败：${e.error_msg}")
+            progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建异常: {e.error_code}", completed=100, visible=False)
+            return None
+        except Exception as ex:
+            progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建未知异常: {ex}", completed=100, visible=False)
+            return None
+
+    def create_instances_bulk(self, progress, task_id, count, vpc_id, instance_type, instance_zone,
+                              ami, key_pair, security_group_id, subnet_id, run_number,
+                              task_type, timeout_hours, actor, use_ip=False, bandwidth_size=5, on_ready=None):
+        """单次请求批量创建多个ECS实例 (使用count字段)
+
+        华为云会为批量创建的实例自动追加 -0001, -0002 ... 名称后缀,
+        节点序号、主机名以及Index标签都在创建后按后缀推导, 再把server_ids映射回实例详情列表。
+        需要公网IP时由同一请求为每个实例自动分配EIP (随实例释放)。
+        on_ready(instance_detail) 在每个实例ACTIVE并补齐名称后立即调用。
+        """
+        name_tag = f'{run_number}-{task_type}'
+        base_name = f"{run_number}-{task_type}-timeout{timeout_hours}-{actor}"
+
+        progress.update(task_id, description=f"[cyan]准备批量创建 {count} 个实例 ({base_name})...")
+        try:
             request = CreatePostPaidServersRequest()
 
-            # 2. 配置实例参数
             root_volume = PostPaidServerRootVolume(volumetype="SSD")
             nics = [PostPaidServerNic(subnet_id=subnet_id)]
             sg_list = []
             if security_group_id:
                 sg_list.append(PostPaidServerSecurityGroup(id=security_group_id))
 
+            # 同一请求的实例共享user_data, 节点序号只能在启动后从元数据中的名称得到。
+            # 调度机在实例ACTIVE后会把名称改成 ...-node{i}-... (_finalize_bulk_instance), 与cloud-init
+            # 的执行先后不确定, 因此等待改名后的最终名称; 超时仍未改名时才退回自动追加的 -0001 后缀
             user_data_script = f"""#cloud-config
-hostname: node{instance_index}-{task_type}"""
+write_files:
+  - path: /usr/local/bin/set-node-hostname.py
+    permissions: '0755'
+    content: |
+      import json, re, subprocess, time, urllib.request
+      deadline = time.time() + 600
+      while True:
+          name = json.load(urllib.request.urlopen("http://169.254.169.254/openstack/latest/meta_data.json"))["name"]
+          final = re.search(r"-node(\\d+)-", name)
+          if final:
+              index = int(final.group(1))
+              break
+          if time.time() > deadline:
+              suffix = re.search(r"-(\\d+)$", name)
+              if not suffix:
+                  raise SystemExit(f"cannot derive node index from {{name}}")
+              index = int(suffix.group(1)) - 1
+              break
+          time.sleep(5)
+      subprocess.run(["hostnamectl", "set-hostname", f"node{{index}}-{task_type}"], check=True)
+runcmd:
+  - [python3, /usr/local/bin/set-node-hostname.py]"""
             user_data = base64.b64encode(user_data_script.encode('utf-8')).decode('utf-8')
 
             server_tags = [
-                PostPaidServerTag(key="Name", value=f'{run_number}-{task_type}'),
-                PostPaidServerTag(key="Index", value=f'{instance_index}'),
+                PostPaidServerTag(key="Name", value=name_tag),
                 PostPaidServerTag(key="WarningHours", value=timeout_hours),
                 PostPaidServerTag(key="Actor", value=actor)
             ]
@@ -389,7 +770,7 @@ hostname: node{instance_index}-{task_type}"""
             server_body_params = {
                 'flavor_ref': instance_type,
                 'image_ref': ami,
-                'name': instance_name,
+                'name': base_name,
                 'key_name': key_pair,
                 'vpcid': vpc_id,
                 'nics': nics,
@@ -397,112 +778,155 @@ hostname: node{instance_index}-{task_type}"""
                 'user_data': user_data,
                 'server_tags': server_tags,
                 'availability_zone': instance_zone,
-                'auto_terminate_time': terminate_time_str
+                'auto_terminate_time': terminate_time_str,
+                'count': count,
+                'is_auto_rename': True
             }
-            # 如果需要绑定EIP
-            if  eip_id:
+            # 每个实例各自的EIP无法预先指定, 由本次请求统一分配
+            if use_ip:
                 server_body_params['publicip'] = PostPaidServerPublicip(
-                    id=eip_id,
+                    eip=PostPaidServerEip(
+                        iptype="5_bgp",
+                        bandwidth=PostPaidServerEipBandwidth(size=bandwidth_size, sharetype="PER")
+                    ),
                     delete_on_termination=True
                 )
             if sg_list:
                 server_body_params['security_groups'] = sg_list
-            server_body = PostPaidServer(**server_body_params)
-            request.body = CreatePostPaidServersRequestBody(server=server_body)
+            request.body = CreatePostPaidServersRequestBody(server=PostPaidServer(**server_body_params))
 
-            progress.update(task_id, description=f"[cyan]发送创建请求 {instance_name}...")
-            response = self.client.create_post_paid_servers(request)
+            progress.update(task_id, description=f"[cyan]发送批量创建请求 ({count} 个实例)...")
+            response = call_api(self.client.create_post_paid_servers, request)
+        except exceptions.SdkException as e:
+            print(f"批量创建失败：{e.error_msg}")
+            progress.update(task_id, description=f"[bold red]✗ 批量创建异常: {e.error_code or e.error_msg}", completed=100)
+            return []
+        except Exception as ex:
+            progress.update(task_id, description=f"[bold red]✗ 批量创建未知异常: {ex}", completed=100)
+            return []
 
-            if not response.server_ids or len(response.server_ids) == 0:
-                progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建失败: 未返回ID", completed=100, visible=False)
-                return None
+        server_ids = response.server_ids or []
+        if not server_ids:
+            progress.update(task_id, description="[bold red]✗ 批量创建失败: 未返回ID", completed=100)
+            return []
 
-            server_id = response.server_ids[0]
-            progress.update(task_id, description=f"[green]✓ {instance_name} 请求成功 (ID: {server_id})...等待就绪")
+        progress.update(task_id, description=f"[green]✓ 批量请求成功 ({len(server_ids)} 个ID)...等待就绪")
+        created = []
 
-            instance_details = self._wait_for_instance_ready(progress, task_id, server_id, instance_name)
-            if not instance_details:
-                progress.update(task_id, description=f"[bold red]✗ {instance_name} 就绪失败", completed=100, visible=False)
-                return None
-            
-            progress.update(task_id, description=f"[bold green]✓ {instance_name} 创建完成!", completed=100, visible=False)
-            
-            # 修改_create_instance方法中的返回部分
-            return {
+        def collect(server_id, waiter):
+            if waiter.status != "ACTIVE":
+                return
+            instance_index = _bulk_instance_index(waiter.server.name, server_ids.index(server_id))
+            instance_name = f"{run_number}-{task_type}-node{instance_index}-timeout{timeout_hours}-{actor}"
+            self._finalize_bulk_instance(server_id, instance_name, f"node{instance_index}-{task_type}", instance_index)
+
+            instance_details = extract_server_details(waiter.server)
+            detail = {
                 'index': instance_index,
-                'id': instance_details['id'],
+                'id': server_id,
                 'name': instance_name,
                 'private_ip': instance_details['private_ip'],
-                # 如果有EIP，则使用EIP的IP地址，否则使用实例详情中的公网IP或'N/A'
-                'public_ip': next((eip['ip'] for eip in self.eip_list if eip['id'] == eip_id), instance_details.get('public_ip', 'N/A')),
+                'public_ip': instance_details.get('public_ip', 'N/A'),
                 'status': instance_details['status'],
-                'eip_id': eip_id
+                'eip_id': None
             }
+            created.append(detail)
+            if on_ready:
+                on_ready(detail)
+
+        waiters = self._wait_for_instances_ready(progress, task_id, server_ids, name_tag=name_tag,
+                                                 history_key=f"active:{instance_type}", on_ready=collect)
+        for server_id in server_ids:
+            waiter = waiters.get(server_id)
+            if waiter is None or waiter.status != "ACTIVE":
+                console.print(f"[red]✗ 实例 {server_id} 未能就绪 (状态: {waiter.status if waiter else 'N/A'})[/red]")
+
+        progress.update(task_id, description=f"[bold green]✓ 批量创建完成: {len(created)}/{count}", completed=100)
+        return sorted(created, key=lambda x: x['index'])
+
+    def _finalize_bulk_instance(self, server_id, instance_name, hostname, instance_index):
+        """为批量创建的实例补齐名称、主机名和Index标签"""
+        try:
+            update_request = UpdateServerRequest(server_id=server_id)
+            update_request.body = UpdateServerRequestBody(
+                server=UpdateServerOption(name=instance_name, hostname=hostname)
+            )
+            call_api(self.client.update_server, update_request)
 
+            tag_request = BatchCreateServerTagsRequest(server_id=server_id)
+            tag_request.body = BatchCreateServerTagsRequestBody(
+                action="create",
+                tags=[BatchAddServerTag(key="Index", value=f'{instance_index}')]
+            )
+            call_api(self.client.batch_create_server_tags, tag_request)
         except exceptions.ClientRequestException as e:
-            print(f"创建失败：${e.error_msg}")
-            progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建异常: {e.error_code}", completed=100, visible=False)
-            return None
-        except Exception as ex:
-            progress.update(task_id, description=f"[bold red]✗ {instance_name} 创建未知异常", completed=100, visible=False)
-            return None
+            console.print(f"[yellow]⚠ 更新实例 {server_id} 名称/标签失败: {e.error_code}[/yellow]")
 
-    def _wait_for_instance_ready(self, progress, task_id, server_id, instance_name="[N/A]", timeout=300, interval=10):
-        """等待实例变为ACTIVE状态"""
-        progress.update(task_id, description=f"[cyan]等待 {instance_name} ({server_id}) 启动...")
+    def _wait_for_instances_ready(self, progress, task_id, server_ids, name_tag=None, timeout=None, history_key=None,
+                                  on_ready=None):
+        """等待一组实例到达终态, 返回 server_id -> 等待对象
+
+        查询节奏由 self.ready_policy 决定, timeout 默认取策略的超时时间;
+        on_ready(server_id, waiter) 在每个实例到达终态时立即调用, 不必等待整批完成
+        """
+        timeout = timeout or self.ready_policy.timeout
         start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                detail_request = ShowServerRequest(server_id=server_id)
-                detail_response = self.client.show_server(detail_request)
-                status = detail_response.server.status
-                
-                progress.update(task_id, description=f"[cyan]状态 {instance_name}: {status} (等待 {int(time.time()-start_time)}s)")
+        waiters = {server_id: self.status_poller.register(server_id, name_tag, history_key) for server_id in server_ids}
+        notified = set()
+        try:
+            while time.time() - start_time < timeout:
+                finished = [server_id for server_id, w in waiters.items() if w.event.is_set()]
+                for server_id in finished:
+                    if on_ready and server_id not in notified:
+                        notified.add(server_id)
+                        on_ready(server_id, waiters[server_id])
+                done = len(finished)
+                progress.update(task_id, description=f"[cyan]等待实例就绪: {done}/{len(waiters)} (等待 {int(time.time()-start_time)}s)")
+                if done == len(waiters):
+                    break
+                time.sleep(1)
+        finally:
+            for server_id in server_ids:
+                self.status_poller.unregister(server_id)
+        return waiters
 
-                if status == "ACTIVE":
-                    private_ip = None
-                    public_ip = None
-                    
-                    # 获取私有IP
-                    if hasattr(detail_response.server, 'addresses'):
-                        for _, ip_list in detail_response.server.addresses.items():
-                            for ip_info in ip_list:
-                                if ip_info.addr: 
-                                    if ip_info.os_ext_ip_stype == 'fixed':
-                                        private_ip = ip_info.addr
-                                    elif ip_info.os_ext_ip_stype == 'floating':
-                                        public_ip = ip_info.addr
-                                    break
-                            if private_ip and public_ip:
-                                break
-                    
-                    # 获取EIP信息
-                    if hasattr(detail_response.server, 'publicip'):
-                        public_ip = detail_response.server.publicip.public_ip_address
-                    
-                    return {
-                        'id': detail_response.server.id,
-                        'private_ip': private_ip if private_ip else "N/A",
-                        'public_ip': public_ip if public_ip else "N/A",
-                        'status': status
-                    }
-                elif status == "ERROR":
-                    return None
-                time.sleep(interval)
-            except exceptions.ClientRequestException as e:
-                if e.status_code == 404 or "NotFound" in e.error_code or "Ecs.0114" in e.error_code:
-                    progress.update(task_id, description=f"[yellow]{instance_name} 暂未找到, 等待...")
+    def _wait_for_instance_ready(self, progress, task_id, server_id, instance_name="[N/A]", timeout=None, name_tag=None, history_key=None):
+        """等待实例变为ACTIVE状态 (由共享的状态轮询器统一查询)"""
+        progress.update(task_id, description=f"[cyan]等待 {instance_name} ({server_id}) 启动...")
+        timeout = timeout or self.ready_policy.timeout
+        start_time = time.time()
+        waiter = self.status_poller.register(server_id, name_tag, history_key)
+        try:
+            while time.time() - start_time < timeout:
+                # 短暂等待以便刷新进度信息, 状态由轮询线程统一更新
+                if waiter.event.wait(1):
+                    break
+                if waiter.status:
+                    progress.update(task_id, description=f"[cyan]状态 {instance_name}: {waiter.status} (等待 {int(time.time()-start_time)}s)")
                 else:
-                    progress.update(task_id, description=f"[red]检查 {instance_name} 状态出错: {e.error_code}")
-                time.sleep(interval)
-        
-        return None
+                    progress.update(task_id, description=f"[yellow]{instance_name} 暂未找到, 等待...")
+            if not waiter.event.is_set():
+                return None
+        finally:
+            self.status_poller.unregister(server_id)
+
+        progress.update(task_id, description=f"[cyan]状态 {instance_name}: {waiter.status} (等待 {int(time.time()-start_time)}s)")
+        if waiter.status != "ACTIVE":
+            return None
+        return extract_server_details(waiter.server)
+
+    def delete_instances(self, server_ids, max_retries=2, bulk=True, delete_publicip=None):
+        """批量删除ECS实例
 
-    def delete_instances(self, server_ids, max_retries=2):
-        """批量删除ECS实例"""
+        bulk为True时所有实例放在同一个DeleteServers请求中, 只跟踪一个Job,
+        并且只对子任务失败的实例进行重试; 否则逐个实例提交删除请求。
+        delete_publicip默认在未使用EIP池时连带删除EIP, 使用EIP池时保留EIP以便归还。
+        """
         if not server_ids:
             console.print("[yellow]⚠ 没有可删除的实例![/yellow]")
             return True
+        if delete_publicip is None:
+            delete_publicip = self.eip_pool is None
 
         success_count = 0
         failed_deletions = []
@@ -516,21 +940,27 @@ hostname: node{instance_index}-{task_type}"""
             console=console,
             transient=True
         ) as progress_bar:
-            with ThreadPoolExecutor(max_workers=min(5, len(server_ids))) as executor:
-                future_to_server_id = {
-                    executor.submit(self._delete_single_instance, progress_bar, server_id, max_retries): server_id
-                    for server_id in server_ids
-                }
-                for future in as_completed(future_to_server_id):
-                    server_id = future_to_server_id[future]
-                    try:
-                        if future.result():
-                            success_count += 1
-                        else:
+            if bulk:
+                deleted, failed_deletions = self._delete_instances_bulk(progress_bar, server_ids, max_retries,
+                                                                        delete_publicip)
+                success_count = len(deleted)
+            else:
+                with ThreadPoolExecutor(max_workers=min(5, len(server_ids))) as executor:
+                    future_to_server_id = {
+                        executor.submit(self._delete_single_instance, progress_bar, server_id, max_retries,
+                                        delete_publicip): server_id
+                        for server_id in server_ids
+                    }
+                    for future in as_completed(future_to_server_id):
+                        server_id = future_to_server_id[future]
+                        try:
+                            if future.result():
+                                success_count += 1
+                            else:
+                                failed_deletions.append(server_id)
+                        except Exception as exc:
+                            console.print(f"[red]删除实例 {server_id} 时发生意外错误: {exc}[/red]")
                             failed_deletions.append(server_id)
-                    except Exception as exc:
-                        console.print(f"[red]删除实例 {server_id} 时发生意外错误: {exc}[/red]")
-                        failed_deletions.append(server_id)
 
         console.print(Panel(
             f"[bold]删除操作完成![/bold]\n\n"
@@ -543,7 +973,7 @@ hostname: node{instance_index}-{task_type}"""
         ))
         return success_count == len(server_ids)
 
-    def _delete_single_instance(self, progress, server_id, max_retries):
+    def _delete_single_instance(self, progress, server_id, max_retries, delete_publicip=True):
         """Helper method to delete a single instance and handle retries."""
         task_id = progress.add_task(f"删除 {server_id}...", total=1)
         retry_count = 0
@@ -554,14 +984,15 @@ hostname: node{instance_index}-{task_type}"""
                 request = DeleteServersRequest()
                 request.body = DeleteServersRequestBody(
                     servers=[ServerId(id=server_id)],
-                    delete_publicip=True,
+                    delete_publicip=delete_publicip,
                     delete_volume=True
                 )
-                response = self.client.delete_servers(request)
+                response = call_api(self.client.delete_servers, request)
                 job_id = response.job_id
                 progress.update(task_id, description=f"删除 {server_id}, Job: {job_id}, 等待完成...")
 
-                if self._wait_for_job_complete(progress, task_id, job_id, server_id_for_log=server_id):
+                if self._wait_for_job_complete(progress, task_id, job_id, server_id_for_log=server_id,
+                                               history_key="job:delete_servers"):
                     progress.update(task_id, description=f"[green]✓ {server_id} 删除成功!", completed=1)
                     deleted = True
                     return True
@@ -575,7 +1006,7 @@ hostname: node{instance_index}-{task_type}"""
                 retry_count += 1
                 if retry_count <= max_retries: time.sleep(5)
             except Exception as ex:
-                progress.update(task_id, description=f"[red]删除 {server_id} 未知错误 (尝试 {retry_count + 1})")
+                progress.update(task_id, description=f"[red]删除 {server_id} 未知错误: {ex} (尝试 {retry_count + 1})")
                 retry_count += 1
                 if retry_count <= max_retries: time.sleep(5)
         
@@ -583,15 +1014,72 @@ hostname: node{instance_index}-{task_type}"""
             progress.update(task_id, description=f"[bold red]✗ {server_id} 删除失败 (最大重试)", completed=1)
         return deleted
 
-    def _wait_for_job_complete(self, progress, task_id, job_id, server_id_for_log="N/A", max_attempts=30, interval=10):
+    def _delete_instances_bulk(self, progress, server_ids, max_retries, delete_publicip=True):
+        """单个DeleteServers请求删除全部实例, 仅重试子任务失败的实例
+
+        返回 (已删除的实例列表, 删除失败的实例列表)
+        """
+        task_id = progress.add_task(f"批量删除 {len(server_ids)} 个实例...", total=len(server_ids))
+        remaining = list(server_ids)
+        deleted = []
+
+        for attempt in range(max_retries + 1):
+            progress.update(task_id, description=f"批量删除 {len(remaining)} 个实例 (尝试 {attempt + 1})")
+            try:
+                request = DeleteServersRequest()
+                request.body = DeleteServersRequestBody(
+                    servers=[ServerId(id=server_id) for server_id in remaining],
+                    delete_publicip=delete_publicip,
+                    delete_volume=True
+                )
+                response = call_api(self.client.delete_servers, request)
+                job_id = response.job_id
+                progress.update(task_id, description=f"批量删除 {len(remaining)} 个实例, Job: {job_id}, 等待完成...")
+                job_ok, job_response = self._wait_for_job(progress, task_id, job_id,
+                                                          server_id_for_log=f"{len(remaining)} 个实例",
+                                                          history_key="job:delete_servers")
+                failed = _failed_sub_job_servers(job_ok, job_response, remaining)
+            except exceptions.ClientRequestException as e:
+                progress.update(task_id, description=f"[red]批量删除失败: {e.error_code} (尝试 {attempt + 1})")
+                failed = remaining
+            except Exception as ex:
+                progress.update(task_id, description=f"[red]批量删除未知错误: {ex} (尝试 {attempt + 1})")
+                failed = remaining
+
+            deleted.extend(server_id for server_id in remaining if server_id not in failed)
+            progress.update(task_id, completed=len(deleted))
+            remaining = [server_id for server_id in remaining if server_id in failed]
+            if not remaining:
+                progress.update(task_id, description=f"[green]✓ {len(deleted)} 个实例删除成功!")
+                break
+            if attempt < max_retries:
+                console.print(f"[yellow]⚠ {len(remaining)} 个实例删除失败, 准备重试: {', '.join(remaining)}[/yellow]")
+                time.sleep(5 * (attempt + 1))
+
+        if remaining:
+            progress.update(task_id, description=f"[bold red]✗ {len(remaining)} 个实例删除失败 (最大重试)")
+        return deleted, remaining
+
+    def _wait_for_job_complete(self, progress, task_id, job_id, server_id_for_log="N/A", history_key=None):
         """等待作业完成"""
+        return self._wait_for_job(progress, task_id, job_id, server_id_for_log, history_key)[0]
+
+    def _wait_for_job(self, progress, task_id, job_id, server_id_for_log="N/A", history_key=None):
+        """等待作业完成, 返回 (是否成功, 最后一次查询到的Job详情)
+
+        查询节奏由 self.job_policy 决定; history_key 标识作业类型 (如删除), 用于学习典型耗时
+        """
         current_desc_prefix = progress.tasks[task_id].description.split(", 等待完成...")[0] if progress and task_id is not None else f"Job {job_id}"
+        job_response = None
+        entity_info = ""
+        session = self.job_policy.start(history_key)
 
-        for attempt in range(max_attempts):
-            progress.update(task_id, description=f"{current_desc_prefix}, Job状态检查 {attempt+1}/{max_attempts}...")
+        while not session.expired():
+            session.sleep()
+            progress.update(task_id, description=f"{current_desc_prefix}, Job状态检查 (等待 {int(session.elapsed)}s)...")
             try:
                 job_request = ShowJobRequest(job_id=job_id)
-                job_response = self.client.show_job(job_request)
+                job_response = call_api(self.client.show_job, job_request)
                 status = job_response.status
                 entity_info = ""
                 if hasattr(job_response, 'entities') and job_response.entities and hasattr(job_response.entities, 'server_id'):
@@ -606,21 +1094,38 @@ hostname: node{instance_index}-{task_type}"""
                         if sub_job.status == "FAIL":
                             console.print(f"[yellow]Job {job_id} {entity_info} 的子任务失败 - 类型: {sub_job.type}, 原因: {sub_job.fail_reason}[/yellow]")
                 if status == "SUCCESS":
-                    return True
+                    session.succeeded()
+                    return True, job_response
                 elif status == "FAIL":
                     fail_reason = job_response.fail_reason if hasattr(job_response, 'fail_reason') else "未知原因"
                     console.print(f"[red]Job {job_id} {entity_info} 执行失败! 原因: {fail_reason}[/red]")
-                    return False
-                time.sleep(interval)
+                    return False, job_response
             except exceptions.ClientRequestException as e:
                 progress.update(task_id, description=f"{current_desc_prefix}, Job状态检查失败: {e.error_code}")
-                time.sleep(interval)
             except Exception as ex_job:
-                progress.update(task_id, description=f"{current_desc_prefix}, Job状态意外错误")
-                time.sleep(interval)
+                progress.update(task_id, description=f"{current_desc_prefix}, Job状态意外错误: {ex_job}")
         
-        console.print(f"[yellow]⚠ Job {job_id} {entity_info} 检查超时! 未能在 {max_attempts*interval} 秒内完成[/yellow]")
-        return False
+        console.print(f"[yellow]⚠ Job {job_id} {entity_info} 检查超时! 未能在 {self.job_policy.timeout} 秒内完成[/yellow]")
+        return False, job_response
+
+    def server_statuses(self, server_ids):
+        """批量查询实例状态, 返回 server_id -> status (已删除、查询不到的实例不在结果中)"""
+        if not server_ids:
+            return {}
+        return {server.id: server.status for server in self.status_poller.list_servers(server_ids=server_ids)}
+
+    def allocate_eips(self, num_eips, task_name, bandwidth_size=5):
+        """为实例准备EIP: 设置了EIP池时从池中借用, 否则现场申请"""
+        if self.eip_pool is not None:
+            return self.eip_pool.lease(num_eips, lessee=task_name)
+        return self.eip_manager.create_eips(num_eips, task_name, bandwidth_size)
+
+    def release_eips(self, eip_ids):
+        """实例删除后处理EIP: 归还到EIP池或直接删除"""
+        if self.eip_pool is not None:
+            self.eip_pool.release(eip_ids)
+            return True
+        return self.eip_manager.delete_eips(eip_ids)
 
     def save_instances_info(self, task_name, instances_info):
         """保存实例信息到文件"""
@@ -632,6 +1137,28 @@ hostname: node{instance_index}-{task_type}"""
                 f.write(f"{info['index']}\t{info['id']}\t{info['name']}\t{info['private_ip']}\t{info.get('public_ip', 'N/A')}\t{info['status']}\n")
         console.print(f"[dim]实例信息已保存到: [underline]{filename}[/underline][/dim]")
         return filename
+def _failed_sub_job_servers(job_ok, job_response, server_ids):
+    """根据Job的sub_jobs找出删除失败的实例
+
+    Job成功时只有状态为FAIL的子任务对应的实例算失败; Job失败或超时时,
+    没有对应成功子任务的实例都视为失败。
+    """
+    sub_jobs = getattr(job_response, 'sub_jobs', None) or []
+    sub_status = {}
+    for sub_job in sub_jobs:
+        entities = getattr(sub_job, 'entities', None)
+        server_id = getattr(entities, 'server_id', None) if entities else None
+        if server_id:
+            sub_status[server_id] = sub_job.status
+    if job_ok:
+        return [server_id for server_id in server_ids if sub_status.get(server_id) == "FAIL"]
+    return [server_id for server_id in server_ids if sub_status.get(server_id) != "SUCCESS"]
+
+def _bulk_instance_index(server_name, default_index):
+    """根据批量创建时自动追加的 -0001 名称后缀推导节点序号"""
+    suffix = server_name.rsplit("-", 1)[-1] if server_name else ""
+    return int(suffix) - 1 if suffix.isdigit() else default_index
+
 def save_eips_to_file(task_name, eip_list):
     """将EIP信息保存到文件"""
     os.makedirs("./cache", exist_ok=True)
@@ -689,24 +1216,56 @@ def main():
     parser.add_argument('--actor', required=True, help='操作者')
     parser.add_argument('--use-ip', action='store_true', help='是否分配公网IP (默认为不分配)', default=False)
     parser.add_argument('--bandwidth', type=int, default=5, help='EIP带宽大小(Mbps)')
+    parser.add_argument('--bulk-create', action='store_true', default=False,
+                        help='使用单次请求(count字段)批量创建全部实例')
+    parser.add_argument('--bootstrap', action='store_true', default=False,
+                        help='通过cloud-init下发集群密钥、SSH配置和主机映射, 跳过逐节点SSH配置')
+    parser.add_argument('--subnet-cidr', default=None, help='子网网段 (如: 192.168.0.0/24), --bootstrap时用于规划固定私有IP')
+    parser.add_argument('--eip-pool', action='store_true', default=False,
+                        help='从持久化EIP池借用EIP, 删除实例后归还 (不与 --bulk-create 同时生效)')
+    parser.add_argument('--eip-pool-state', default="./cache/eip_pool.json", help='EIP池状态文件路径')
+    parser.add_argument('--network', choices=NETWORK_MODES, default="public",
+                        help='public: 每个实例一个EIP; bastion: 只有node0 (或 --bastion-host) 有公网IP, 其余节点经跳板机访问; '
+                             'private: 调度机位于同一VPC, 不申请EIP, 直接使用私有IP')
+    parser.add_argument('--bastion-host', default=None, help='bastion模式下使用已有的跳板机地址 (此时不申请EIP)')
+    parser.add_argument('--host-keys', action='store_true', default=False,
+                        help='由调度机生成各节点的SSH主机密钥并通过cloud-init下发, 启动前写入known_hosts')
     args = parser.parse_args()
 
+    if args.host_keys and args.bulk_create:
+        parser.error("--host-keys 需要逐个实例的user_data, 不能与 --bulk-create 同时使用")
+    if args.bootstrap and (args.bulk_create or not args.subnet_cidr):
+        parser.error("--bootstrap 需要 --subnet-cidr, 且不能与 --bulk-create 同时使用")
+    if args.network == NETWORK_BASTION and (args.bulk_create or not (args.use_ip or args.bastion_host)):
+        parser.error("--network bastion 需要 --use-ip 或 --bastion-host, 且不能与 --bulk-create 同时使用")
+    if args.network == NETWORK_PRIVATE and args.use_ip:
+        parser.error("--network private 不申请EIP, 不能与 --use-ip 同时使用")
+
+    initial_key_path = "/root/schedule/KeyPair-loacl.pem"
+    network = ClusterNetwork(args.network, key_path=initial_key_path, bastion_host=args.bastion_host)
     manager = ECSInstanceManager(args.ak, args.sk, args.region)
+    manager.ssh_configurator.network = network
+    if args.eip_pool and args.use_ip and not args.bulk_create:
+        from hwscheduler.huawei.eip_pool import EIPPool
+        manager.eip_pool = EIPPool(manager.eip_manager, bandwidth=args.bandwidth, state_path=args.eip_pool_state)
     console.rule(f"[bold blue]测试模式: 创建 {args.num_instances} 个实例后自动删除[/bold blue]")
     instance_zone = args.instance_zone if args.instance_zone else f"{args.region}a"
     created_instances_details = []
     
-    if args.use_ip:
-        console.print(f"[cyan]正在为 {args.num_instances} 个实例申请EIP...[/cyan]")
-        manager.eip_list = manager.eip_manager.create_eips(  # 存储到实例变量
-            args.num_instances, 
+    eip_count = network.eip_count(args.num_instances)
+    if args.use_ip and not args.bulk_create and eip_count:
+        console.print(f"[cyan]正在为 {eip_count} 个实例申请EIP...[/cyan]")
+        manager.eip_list = manager.allocate_eips(  # 存储到实例变量
+            eip_count,
             f"{args.run_number}_{args.task_type}",
             args.bandwidth
         )
         
-        if not manager.eip_list or len(manager.eip_list) < args.num_instances:
+        if not manager.eip_list or len(manager.eip_list) < eip_count:
             console.print("[red]✗ EIP申请失败或数量不足，无法继续创建实例[/red]")
             return
+        # bastion模式下node0的EIP即跳板机地址, 其余节点就绪时即可经它配置
+        network.use_nodes([{'index': 0, 'public_ip': manager.eip_list[0]['ip']}])
         save_eips_to_file(f"{args.run_number}_{args.task_type}", manager.eip_list)
         
         # 显示EIP信息
@@ -718,60 +1277,122 @@ def main():
             eip_table.add_row(str(i), eip['id'], eip['ip'])
         console.print(eip_table)
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeElapsedColumn(),
-        console=console,
-    ) as creation_progress:
-        with ThreadPoolExecutor(max_workers=min(args.num_instances, 10)) as executor:
-            futures = {}
-            for i in range(args.num_instances):
-                task_id = creation_progress.add_task(f"Instance {i}...", total=100, start=False, visible=True)
-                creation_progress.update(task_id, completed=0)
-
-                # 如果有EIP列表，获取对应的EIP ID
-                eip_id = manager.eip_list[i]['id'] if args.use_ip and i < len(manager.eip_list) else None
+    # 流式配置: 每个实例ACTIVE后立即开始SSH探测和密钥配置, 只有最终的hosts同步需要等待全部实例
+    bootstrap = None
+    cluster_setup = None
+    host_keys = HostKeys(f"{args.run_number}_{args.task_type}") if args.host_keys else None
+    if args.bootstrap:
+        # 集群配置随创建请求下发, 实例启动后即可免密登录
+        private_key, _ = manager.ssh_configurator.generate_ssh_key_locally()
+        bootstrap = ClusterBootstrap(args.num_instances, args.task_type, args.subnet_cidr, private_key,
+                                     host_keys=host_keys)
+    elif args.use_ip or network.mode != NETWORK_PUBLIC:
+        cluster_setup = StreamingClusterSetup(manager.ssh_configurator, initial_key_path, user="root")
+    on_ready = cluster_setup.submit if cluster_setup else None
+    if host_keys:
+        # 实例启动前已知的名称 (主机名、EIP、规划的私有IP) 先写入known_hosts, 其余地址在就绪时补上
+        host_keys.register({
+            i: [f"node{i}-{args.task_type}",
+                manager.eip_list[i]['ip'] if args.use_ip and i < len(manager.eip_list) else None,
+                bootstrap.private_ip(i) if bootstrap else None]
+            for i in range(args.num_instances)
+        })
+
+        def on_ready(instance_info, submit=on_ready):
+            host_keys.register({instance_info['index']: [instance_info.get('public_ip'), instance_info.get('private_ip')]})
+            if submit:
+                submit(instance_info)
+
+    if args.bulk_create:
+        # 单次请求批量创建, 不受线程池并发数限制
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn(),
+            console=console,
+        ) as creation_progress:
+            task_id = creation_progress.add_task(f"批量创建 {args.num_instances} 个实例...", total=100)
+            created_instances_details = manager.create_instances_bulk(
+                creation_progress, task_id,
+                count=args.num_instances,
+                vpc_id=args.vpc_id,
+                instance_type=args.instance_type,
+                instance_zone=instance_zone,
+                ami=args.ami,
+                key_pair=args.key_pair,
+                security_group_id=args.security_group_id,
+                subnet_id=args.subnet_id,
+                run_number=args.run_number,
+                task_type=args.task_type,
+                timeout_hours=args.timeout_hours,
+                actor=args.actor,
+                use_ip=args.use_ip,
+                bandwidth_size=args.bandwidth,
+                on_ready=on_ready
+            )
+    else:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console,
+        ) as creation_progress:
+            with ThreadPoolExecutor(max_workers=min(args.num_instances, 10)) as executor:
+                futures = {}
+                for i in range(args.num_instances):
+                    task_id = creation_progress.add_task(f"Instance {i}...", total=100, start=False, visible=True)
+                    creation_progress.update(task_id, completed=0)
+
+                    # 如果有EIP列表，获取对应的EIP ID
+                    eip_id = manager.eip_list[i]['id'] if args.use_ip and i < len(manager.eip_list) else None  # bastion模式只有node0有EIP
                 
-                future = executor.submit(
-                    manager.create_instance,
-                    creation_progress, task_id, 
-                    vpc_id=args.vpc_id,
-                    instance_index=i,
-                    instance_type=args.instance_type,
-                    instance_zone=instance_zone,
-                    ami=args.ami,
-                    key_pair=args.key_pair,
-                    security_group_id=args.security_group_id,
-                    subnet_id=args.subnet_id,
-                    run_number=args.run_number,
-                    task_type=args.task_type,
-                    timeout_hours=args.timeout_hours,
-                    actor=args.actor,
-                    eip_id=eip_id
-                )
-                futures[future] = (i, task_id) 
+                    future = executor.submit(
+                        manager.create_instance,
+                        creation_progress, task_id, 
+                        vpc_id=args.vpc_id,
+                        instance_index=i,
+                        instance_type=args.instance_type,
+                        instance_zone=instance_zone,
+                        ami=args.ami,
+                        key_pair=args.key_pair,
+                        security_group_id=args.security_group_id,
+                        subnet_id=args.subnet_id,
+                        run_number=args.run_number,
+                        task_type=args.task_type,
+                        timeout_hours=args.timeout_hours,
+                        actor=args.actor,
+                        eip_id=eip_id,
+                        bootstrap=bootstrap,
+                        host_keys=host_keys
+                    )
+                    futures[future] = (i, task_id) 
 
-            for future in as_completed(futures):
-                instance_index, task_id = futures[future]
-                try:
-                    instance_detail = future.result()
-                    if instance_detail:
-                        created_instances_details.append(instance_detail)
-                    else:
-                        creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} failed.", completed=100, visible=False)
-                except Exception as e:
-                    creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} error: {e}", completed=100, visible=False)
-                    console.print(f"[red]Error processing instance {instance_index}: {e}[/red]")
+                for future in as_completed(futures):
+                    instance_index, task_id = futures[future]
+                    try:
+                        instance_detail = future.result()
+                        if instance_detail:
+                            created_instances_details.append(instance_detail)
+                            if on_ready:
+                                on_ready(instance_detail)
+                        else:
+                            creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} failed.", completed=100, visible=False)
+                    except Exception as e:
+                        creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} error: {e}", completed=100, visible=False)
+                        console.print(f"[red]Error processing instance {instance_index}: {e}[/red]")
 
     if not created_instances_details:
         console.print("[red]✗ 测试失败: 没有实例成功创建.[/red]")
         # 清理已申请的EIP
         if args.use_ip and manager.eip_list:
             console.print("[yellow]清理已申请的EIP...[/yellow]")
-            manager.eip_manager.delete_eips([eip['id'] for eip in manager.eip_list])
+            manager.release_eips([eip['id'] for eip in manager.eip_list])
+        network.close()
+        if host_keys:
+            host_keys.cleanup()
         return
 
     console.print(f"\n[bold green]总共 {len(created_instances_details)}/{args.num_instances} 个实例创建成功.[/bold green]")
@@ -786,26 +1407,17 @@ def main():
             created_instances_details
         )
         # 配置SSH免密登录（仅在成功创建实例且有公网IP时）
-        if args.use_ip and any(inst.get('public_ip', 'N/A') != 'N/A' for inst in created_instances_details):
+        if cluster_setup and any(network.reachable(inst) for inst in created_instances_details):
             console.rule("[bold blue]配置SSH免密登录[/bold blue]")
-            
-            # 获取初始SSH密钥路径（从参数或默认位置）
-            # initial_key_path = os.path.expanduser("~/.ssh/id_rsa")  # 默认使用用户的SSH密钥
-            # if args.key_pair:
-            #     # 如果是华为云的密钥对，可能需要从特定位置获取
-            #     initial_key_path = os.path.expanduser(f"~/.ssh/{args.key_pair}.pem")
-            initial_key_path="/root/schedule/KeyPair-loacl.pem"
-            # 配置免密登录
-            ssh_success = manager.ssh_configurator.configure_cluster_pwdless(
-                created_instances_details,
-                initial_key_path=initial_key_path,
-                user="root"
-            )
+            # 各节点的密钥配置已在实例就绪时开始, 这里只等待其完成并同步hosts
+            ssh_success = cluster_setup.finish()
             
             if ssh_success:
                 console.print("[bold green]✓ SSH免密登录配置成功![/bold green]")
             else:
                 console.print("[yellow]⚠ SSH免密登录配置部分失败[/yellow]")
+        elif bootstrap:
+            console.print("[bold green]✓ 集群密钥、SSH配置和主机映射已由cloud-init完成[/bold green]")
         
         
         table = Table(title="已创建实例列表 (等待删除)", show_header=True, header_style="bold green")
@@ -828,6 +1440,9 @@ def main():
         
         server_ids_to_delete = [inst['id'] for inst in created_instances_details]
         eip_ids_to_delete = [inst['eip_id'] for inst in created_instances_details if inst.get('eip_id')]
+        if manager.eip_pool is not None:
+            # 借用的EIP全部归还, 包括创建失败的实例未用上的
+            eip_ids_to_delete = [eip['id'] for eip in manager.eip_list]
         
         console.rule("[bold red]自动删除模式[/bold red]")
         wait_seconds = 10
@@ -836,6 +1451,9 @@ def main():
             print(f"\r[yellow]开始删除倒计时: {i}s...[/yellow]", end="")
             time.sleep(1)
         print("\r" + " " * 30 + "\r", end="") 
+        network.close()
+        if host_keys:
+            host_keys.cleanup()
 
         # 先删除实例
         all_deleted_successfully = manager.delete_instances(server_ids_to_delete)
@@ -843,7 +1461,7 @@ def main():
         # 然后删除EIP
         if eip_ids_to_delete:
             console.print("[cyan]开始清理关联的EIP...[/cyan]")
-            manager.eip_manager.delete_eips(eip_ids_to_delete)
+            manager.release_eips(eip_ids_to_delete)
             
             # 清理文件
             info_path = f"./cache/{args.run_number}_{args.task_type}_ip_info.txt"
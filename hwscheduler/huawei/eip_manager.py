@@ -11,6 +11,7 @@ from huaweicloudsdkcore.auth.credentials import BasicCredentials
 from huaweicloudsdkeip.v2.region.eip_region import EipRegion
 from huaweicloudsdkcore.exceptions import exceptions
 from huaweicloudsdkeip.v2 import *
+from hwscheduler.huawei.rate_limiter import call_api
 
 console = Console()
 
@@ -41,7 +42,7 @@ class EIPManager:
             )
             
             progress.update(task_id, description=f"[cyan]发送创建请求 {task_name}...")
-            response = self.client.create_publicip(request)
+            response = call_api(self.client.create_publicip, request)
 
             if not response.publicip:
                 progress.update(task_id, description=f"[bold red]✗ {task_name} 创建失败: 未返回EIP信息", completed=100, visible=False)
@@ -98,7 +99,7 @@ class EIPManager:
             
             try:
                 request = DeletePublicipRequest(publicip_id=eip_id)
-                response = self.client.delete_publicip(request)
+                response = call_api(self.client.delete_publicip, request)
                 
                 progress.update(task_id, description=f"[green]✓ {eip_id} 删除成功!", completed=100, visible=False)
                 console.print(f"[green]✓ EIP {eip_id} 删除成功![/green]")
@@ -0,0 +1,215 @@
+# coding: utf-8
+import argparse
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from rich.console import Console
+from rich.table import Table
+from huaweicloudsdkeip.v2 import *
+from huaweicloudsdkcore.exceptions import exceptions
+from hwscheduler.huawei.rate_limiter import call_api
+from hwscheduler.huawei.ecs_manager import EIPManager
+
+console = Console()
+
+DEFAULT_EIP_POOL_STATE = "./cache/eip_pool.json"
+
+# EIP未绑定任何端口时的状态
+UNBOUND_STATUS = "DOWN"
+
+
+class EIPPool:
+    """持久化的EIP池
+
+    池中保持 pool_size 个未绑定的EIP, 任务通过 lease() 借出后以 publicip id 绑定到新实例
+    (delete_on_termination=False), 删除实例时保留EIP (delete_publicip=False), 再通过 release() 归还。
+    EIP的申请和释放因此不再位于任务的关键路径上。
+    池状态保存在 ./cache/eip_pool.json 中并通过文件锁保护, 多个任务进程可以共享同一个池。
+    """
+
+    def __init__(self, eip_manager: EIPManager, pool_size=4, bandwidth=5, name_prefix="hwscheduler_pool",
+                 state_path=DEFAULT_EIP_POOL_STATE):
+        self.eip_manager = eip_manager
+        self.client = eip_manager.client
+        self.pool_size = pool_size
+        self.bandwidth = bandwidth
+        self.name_prefix = name_prefix
+        self.state_path = state_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def _locked_state(self):
+        """在文件锁内读写池状态"""
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(f"{self.state_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = {'eips': []}
+                if os.path.exists(self.state_path):
+                    with open(self.state_path, 'r') as f:
+                        state = json.load(f)
+                yield state
+                tmp_path = f"{self.state_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _statuses(self, eip_ids):
+        """查询一组EIP的当前状态, 返回 id -> status (已不存在的EIP不在结果中)"""
+        if not eip_ids:
+            return {}
+        response = call_api(self.client.list_publicips, ListPublicipsRequest(id=list(eip_ids), limit=len(eip_ids)))
+        return {pub.id: pub.status for pub in response.publicips or []}
+
+    def lease(self, count, lessee=None):
+        """借出count个未绑定的EIP; 池中不足时当场申请补足, 新申请的EIP同样归属于池"""
+        with self._locked_state() as state:
+            idle = [eip for eip in state['eips'] if eip['state'] == 'idle']
+            try:
+                statuses = self._statuses([eip['id'] for eip in idle])
+                # 已被删除的EIP移出池; 仍处于绑定中的 (实例删除尚未完成) 暂不借出
+                missing = {eip['id'] for eip in idle if eip['id'] not in statuses}
+                state['eips'] = [eip for eip in state['eips'] if eip['id'] not in missing]
+                usable = [eip for eip in idle if statuses.get(eip['id']) == UNBOUND_STATUS]
+            except exceptions.ClientRequestException as e:
+                console.print(f"[yellow]⚠ 查询EIP池状态失败: {e.error_code}, 按本地状态借出[/yellow]")
+                usable = idle
+            leased = usable[:count]
+            for eip in leased:
+                eip['state'] = 'leased'
+                eip['leased_by'] = lessee
+                eip['leased_at'] = time.time()
+
+        shortfall = count - len(leased)
+        if shortfall > 0:
+            console.print(f"[yellow]⚠ EIP池空闲不足, 现场申请 {shortfall} 个EIP[/yellow]")
+            leased.extend(self._add(self.eip_manager.create_eips(shortfall, self._next_name(), self.bandwidth),
+                                    state='leased', lessee=lessee))
+        console.print(f"[green]✓ 从EIP池借出 {len(leased)} 个EIP[/green]")
+        return [{'id': eip['id'], 'ip': eip['ip'], 'name': eip['name'], 'pooled': True} for eip in leased]
+
+    def release(self, eip_ids):
+        """归还EIP (实例已删除且未连带删除EIP)"""
+        ids = set(eip_ids)
+        with self._locked_state() as state:
+            for eip in state['eips']:
+                if eip['id'] in ids:
+                    eip['state'] = 'idle'
+                    eip['leased_by'] = None
+                    eip['idle_since'] = time.time()
+        console.print(f"[green]✓ 已归还 {len(ids)} 个EIP到池中[/green]")
+
+    def _next_name(self):
+        return f"{self.name_prefix}_{int(time.time())}"
+
+    def _add(self, created, state='idle', lessee=None):
+        """把新申请的EIP登记到池中"""
+        now = time.time()
+        records = [{
+            'id': eip['id'],
+            'ip': eip['ip'],
+            'name': eip['name'],
+            'state': state,
+            'leased_by': lessee,
+            'leased_at': now if state == 'leased' else None,
+            'idle_since': now
+        } for eip in created]
+        with self._locked_state() as pool_state:
+            pool_state['eips'].extend(records)
+        return records
+
+    def refill(self):
+        """补齐空闲EIP数量"""
+        with self._locked_state() as state:
+            missing = self.pool_size - sum(1 for eip in state['eips'] if eip['state'] == 'idle')
+        if missing <= 0:
+            return 0
+        console.print(f"[cyan]EIP池补充 {missing} 个EIP...[/cyan]")
+        return len(self._add(self.eip_manager.create_eips(missing, self._next_name(), self.bandwidth)))
+
+    def start(self, interval=60):
+        """启动后台补齐线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def _loop():
+            while not self._stop.is_set():
+                try:
+                    self.refill()
+                except Exception as e:
+                    console.print(f"[red]EIP池维护出错: {e}[/red]")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=_loop, name="eip-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def drain(self):
+        """释放池中全部空闲EIP"""
+        with self._locked_state() as state:
+            idle = [eip['id'] for eip in state['eips'] if eip['state'] == 'idle']
+            state['eips'] = [eip for eip in state['eips'] if eip['state'] != 'idle']
+        if idle:
+            self.eip_manager.delete_eips(idle)
+        return idle
+
+    def show(self):
+        with self._locked_state() as state:
+            eips = list(state['eips'])
+        table = Table(title="EIP池", show_header=True, header_style="bold cyan")
+        table.add_column("ID", style="dim")
+        table.add_column("IP地址")
+        table.add_column("状态")
+        table.add_column("借用者")
+        for eip in eips:
+            table.add_row(eip['id'], eip['ip'], eip['state'], str(eip.get('leased_by') or ''))
+        console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='华为云EIP池 (保持一定数量的未绑定EIP供任务复用)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""示例:
+  python -m hwscheduler.huawei.eip_pool --ak YOUR_AK --sk YOUR_SK --region cn-east-3 --size 8
+""")
+    parser.add_argument('--ak', required=True, help='华为云Access Key')
+    parser.add_argument('--sk', required=True, help='华为云Secret Key')
+    parser.add_argument('--region', required=True, help='区域(如: cn-north-4)')
+    parser.add_argument('--size', type=int, default=4, help='保持的空闲EIP数量')
+    parser.add_argument('--bandwidth', type=int, default=5, help='EIP带宽大小(Mbps)')
+    parser.add_argument('--interval', type=int, default=60, help='补齐检查间隔(秒)')
+    parser.add_argument('--state-path', default=DEFAULT_EIP_POOL_STATE, help='池状态文件路径')
+    parser.add_argument('--drain', action='store_true', help='释放全部空闲EIP后退出')
+    args = parser.parse_args()
+
+    pool = EIPPool(EIPManager(args.ak, args.sk, args.region), pool_size=args.size,
+                   bandwidth=args.bandwidth, state_path=args.state_path)
+    if args.drain:
+        pool.drain()
+        return
+
+    console.rule(f"[bold blue]EIP池运行中: 保持 {args.size} 个空闲EIP[/bold blue]")
+    pool.start(interval=args.interval)
+    try:
+        while True:
+            time.sleep(args.interval)
+            pool.show()
+    except KeyboardInterrupt:
+        console.print("[yellow]停止EIP池维护 (保留现有EIP, 可使用 --drain 释放)[/yellow]")
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
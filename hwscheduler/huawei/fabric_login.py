@@ -1,7 +1,9 @@
-from fabric import Connection
 import argparse
+from contextlib import contextmanager
+from hwscheduler.huawei.connection_pool import shared_pool
 
-def connect_with_key(host, key_path, user="root"):
+@contextmanager
+def connect_with_key(host, key_path, user="root", pool=None):
     """
     Connects to a remote host via SSH using a private key.
 
@@ -9,23 +11,18 @@ def connect_with_key(host, key_path, user="root"):
         host (str): The hostname or IP address of the remote server.
         key_path (str): The path to the private key file.
         user (str): The username to connect as (default: "root").
+        pool (ConnectionPool): Pool to borrow the connection from (default: the shared pool),
+            so later steps on the same host reuse the established session.
 
-    Returns:
-        fabric.Connection: A fabric Connection object if successful, None otherwise.
+    Yields:
+        fabric.Connection: A verified connection, lent exclusively for the with block and
+            returned to the pool afterwards (do not close it).
     """
-    try:
-        c = Connection(
-            host=host,
-            user=user,
-            connect_kwargs={"key_filename": key_path},
-        )
+    with (pool or shared_pool()).connection(host, user, key_path) as c:
         # Test the connection (optional, but recommended)
         c.run("uname -a", hide=True)  # Run a simple command to verify connection
         print(f"Successfully connected to {host} as {user} using key: {key_path}")
-        return c
-    except Exception as e:
-        print(f"Error connecting to {host}: {e}")
-        return None
+        yield c
 
 
 if __name__ == "__main__":
@@ -36,14 +33,14 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    conn = connect_with_key(args.host, args.key_path, args.user)
-
-    if conn:
-        # Now you can use the 'conn' object to execute commands on the remote server
-        result = conn.run("ls -l /tmp", hide=True)  # Example: List files in /tmp
-        print(result.stdout)
-
-        # Close the connection when you're done
-        conn.close()
-    else:
-        print("Failed to establish connection.")
\ No newline at end of file
+    try:
+        with connect_with_key(args.host, args.key_path, args.user) as conn:
+            # Now you can use the 'conn' object to execute commands on the remote server
+            result = conn.run("ls -l /tmp", hide=True)  # Example: List files in /tmp
+            print(result.stdout)
+    except Exception as e:
+        print(f"Error connecting to {args.host}: {e}")
+        print("Failed to establish connection.")
+    finally:
+        # The pool owns the connection; close it once we are done
+        shared_pool().close_all()
@@ -0,0 +1,75 @@
+# coding: utf-8
+import os
+import shutil
+import subprocess
+import threading
+from rich.console import Console
+from hwscheduler.huawei.saveInfo import KNOWN_HOSTS_PATH, write_known_hosts
+
+console = Console()
+
+DEFAULT_HOST_KEY_DIR = "./cache/host_keys"
+
+
+class HostKeys:
+    """由调度机为每个节点预先生成的SSH主机密钥
+
+    私钥通过 cloud-init 的 ssh_keys 在首次启动时写入实例 (替换镜像自动生成的主机密钥),
+    公钥在实例启动前就写入调度机的 known_hosts, 连接时可以严格校验主机密钥,
+    不再需要等待DNS解析和 ssh-keyscan 重试。
+    """
+
+    def __init__(self, run_name, key_dir=DEFAULT_HOST_KEY_DIR, known_hosts_path=KNOWN_HOSTS_PATH):
+        self.key_dir = os.path.join(key_dir, run_name)
+        self.known_hosts_path = known_hosts_path
+        self._lock = threading.Lock()
+
+    def _key_path(self, index):
+        return os.path.join(self.key_dir, f"node{index}_ed25519")
+
+    def generate(self, index):
+        """生成 (或读取已生成的) 节点主机密钥, 返回 (私钥内容, 公钥 "ssh-ed25519 AAAA...")"""
+        path = self._key_path(index)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(self.key_dir, exist_ok=True)
+                subprocess.run(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-C', f"node{index}", '-f', path],
+                               check=True)
+                os.chmod(path, 0o600)
+        with open(path, 'r') as f:
+            private_key = f.read()
+        with open(f"{path}.pub", 'r') as f:
+            public_key = " ".join(f.read().split()[:2])
+        return private_key, public_key
+
+    def public_key(self, index):
+        return self.generate(index)[1]
+
+    def cloud_config(self, index):
+        """cloud-config 片段: 使用预生成的主机密钥, 不再自动生成其他类型"""
+        private_key, public_key = self.generate(index)
+        return {
+            'ssh_deletekeys': True,
+            'ssh_genkeytypes': [],
+            'ssh_keys': {
+                'ed25519_private': private_key,
+                'ed25519_public': public_key,
+            },
+        }
+
+    def register(self, names_by_index):
+        """把节点的主机密钥以各自的名称 (主机名/IP) 写入调度机的 known_hosts ({index: [names]})"""
+        entries = {name: [self.public_key(index)]
+                   for index, names in names_by_index.items() for name in names if name and name != 'N/A'}
+        if not entries:
+            return
+        with self._lock:
+            write_known_hosts(entries, self.known_hosts_path)
+
+    def known_hosts_lines(self, names_by_index):
+        """集群内部使用的 ssh_known_hosts 内容 ({index: [names]} -> 行列表)"""
+        return [f"{','.join(names)} {self.public_key(index)}" for index, names in sorted(names_by_index.items())]
+
+    def cleanup(self):
+        """删除本次运行生成的主机私钥"""
+        shutil.rmtree(self.key_dir, ignore_errors=True)
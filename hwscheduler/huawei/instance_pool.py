@@ -0,0 +1,434 @@
+# coding: utf-8
+import argparse
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
+from rich.table import Table
+from huaweicloudsdkcore.exceptions import exceptions
+from hwscheduler.huawei.ecs_manager import ECSInstanceManager
+from hwscheduler.huawei.connection_pool import shared_pool
+from hwscheduler.huawei.ssh_probe import wait_for_ssh_host
+
+console = Console()
+
+DEFAULT_POOL_STATE = "./cache/instance_pool.json"
+# 归还时清理上一个任务留下的工作区: 测试日志/构建产物包/中继脚本、Spark的target目录、
+# configure_pwdless 写入的 /etc/hosts 节点映射, 并恢复池实例自己的主机名 ({hostname})
+WORKSPACE_RESET_COMMAND = " && ".join([
+    "rm -rf /tmp/chukonu_* /tmp/staging /tmp/spark_bundle.tar.gz* /tmp/hwscheduler_relay.sh /root/build_wheel.sh",
+    "(test ! -d /root/spark || find /root/spark -type d -name target -prune -exec rm -rf {{}} +)",
+    "sed -i -E '/[[:space:]]node-?[0-9]+/d' /etc/hosts",
+    "hostnamectl set-hostname {hostname}",
+])
+
+
+def pool_key(instance_type, ami, instance_zone):
+    """实例池的分组键: (规格, 镜像, 可用区)"""
+    return f"{instance_type}|{ami}|{instance_zone}"
+
+
+class InstancePool:
+    """预热实例池
+
+    在ECSInstanceManager之上为每个 (规格, 镜像, 可用区) 保持N个已启动、已完成初始化的实例,
+    任务通过 lease()/release() 借用和归还实例, 后台线程负责补齐数量并回收空闲超时的实例。
+    池状态保存在 ./cache/instance_pool.json 中并通过文件锁保护, 多个任务进程可以共享同一个池。
+    池实例在 timeout_hours 后会被自动终止, 剩余时间不足 lease_margin 秒的实例不再借出;
+    新实例经SSH登录检查 (setup) 后才进入池; 借出前确认实例仍为ACTIVE,
+    归还时经SSH清理工作区 (reset), 清理失败的实例直接删除。
+    """
+
+    def __init__(self, manager: ECSInstanceManager, vpc_id, key_pair, security_group_id, subnet_id,
+                 actor, pool_size=2, idle_ttl=3600, timeout_hours="24", use_ip=False, bandwidth=5,
+                 setup=None, state_path=DEFAULT_POOL_STATE, key_path=None, user="root", reset=None,
+                 lease_margin=7200):
+        self.manager = manager
+        self.vpc_id = vpc_id
+        self.key_pair = key_pair
+        self.security_group_id = security_group_id
+        self.subnet_id = subnet_id
+        self.actor = actor
+        self.pool_size = pool_size
+        self.idle_ttl = idle_ttl
+        self.timeout_hours = timeout_hours
+        self.use_ip = use_ip
+        self.bandwidth = bandwidth
+        self.state_path = state_path
+        self.key_path = key_path
+        self.user = user
+        # setup(instance) -> bool, 实例就绪后执行的初始化 (例如SSH检查、预热脚本);
+        # 默认在有 key_path 时确认实例可以用该密钥登录, 未通过检查的实例不进入池
+        self.setup = setup or (self._check_login if key_path else None)
+        # reset(instance, hostname) -> bool, 归还时清理工作区; 默认在有 key_path 时执行 WORKSPACE_RESET_COMMAND
+        self.reset = reset or (self._reset_workspace if key_path else None)
+        self.lease_margin = lease_margin
+        self.keys = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def _locked_state(self):
+        """在文件锁内读写池状态"""
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(f"{self.state_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                state = {'instances': []}
+                if os.path.exists(self.state_path):
+                    with open(self.state_path, 'r') as f:
+                        state = json.load(f)
+                yield state
+                tmp_path = f"{self.state_path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(state, f, indent=2)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _expires_at(self, inst):
+        """池实例的自动终止时间 (旧状态文件没有记录时按创建时间推算)"""
+        return inst.get('expires_at') or inst['created_at'] + float(self.timeout_hours) * 3600
+
+    def lease(self, instance_type, ami, instance_zone, count=1, lessee=None):
+        """从池中借出count个空闲实例; 数量不足时不借出任何实例并返回空列表
+
+        借出前批量查询实例状态: 已被删除或不再ACTIVE的实例从池中移除,
+        即将自动终止的实例删除, 都不会借出。
+        """
+        key = pool_key(instance_type, ami, instance_zone)
+        self.keys.add(key)
+        now = time.time()
+        expiring, dead = [], []
+        with self._locked_state() as state:
+            idle = [inst for inst in state['instances'] if inst['key'] == key and inst['state'] == 'idle']
+            expiring = [inst for inst in idle if self._expires_at(inst) - now < self.lease_margin]
+            idle = [inst for inst in idle if inst not in expiring]
+            try:
+                statuses = self.manager.server_statuses([inst['id'] for inst in idle])
+            except exceptions.SdkException as e:
+                console.print(f"[yellow]⚠ 无法确认池实例状态, 不借出: {e.error_code or e.error_msg}[/yellow]")
+                return []
+            dead = [inst for inst in idle if statuses.get(inst['id']) != "ACTIVE"]
+            idle = [inst for inst in idle if inst not in dead]
+            stale = {inst['id'] for inst in expiring + dead}
+            state['instances'] = [inst for inst in state['instances'] if inst['id'] not in stale]
+            leased = idle[:count] if len(idle) >= count else []
+            for inst in leased:
+                inst['state'] = 'leased'
+                inst['leased_by'] = lessee
+                inst['leased_at'] = now
+
+        self._drop_stale([inst['detail'] for inst in expiring], [inst['detail'] for inst in dead])
+        if not leased:
+            console.print(f"[yellow]⚠ 实例池 {key} 空闲实例不足: {len(idle)}/{count}[/yellow]")
+            return []
+        console.print(f"[green]✓ 从实例池借出 {len(leased)} 个实例 ({key})[/green]")
+        # 按任务内的顺序重新编号, 保持与新建实例相同的字段
+        return [dict(inst['detail'], index=i, pooled=True) for i, inst in enumerate(leased)]
+
+    def _drop_stale(self, expiring, dead):
+        """删除即将自动终止的实例; 已经不存在的实例只归还其EIP"""
+        if expiring:
+            console.print(f"[yellow]删除 {len(expiring)} 个即将自动终止的池实例...[/yellow]")
+            self._delete_instances(expiring)
+        if dead:
+            console.print(f"[yellow]⚠ {len(dead)} 个池实例已不存在或不可用, 从池中移除: "
+                          f"{', '.join(detail['id'] for detail in dead)}[/yellow]")
+            eip_ids = [detail['eip_id'] for detail in dead if detail.get('eip_id')]
+            if eip_ids and self.manager.eip_pool is not None:
+                self.manager.release_eips(eip_ids)
+
+    @staticmethod
+    def _host(detail):
+        return detail.get('public_ip') if detail.get('public_ip') not in (None, 'N/A') else detail['private_ip']
+
+    def _check_login(self, detail):
+        """等待SSH端口就绪并用 key_path 登录一次"""
+        host = self._host(detail)
+        if not wait_for_ssh_host(host):
+            return False
+        try:
+            with shared_pool().connection(host, self.user, self.key_path) as conn:
+                return conn.run("true", hide=True, warn=True).ok
+        except Exception as e:
+            console.print(f"[red]✗ 登录池实例 {detail['name']} 失败: {e}[/red]")
+            return False
+
+    def _reset_workspace(self, detail, hostname):
+        """经SSH执行 WORKSPACE_RESET_COMMAND"""
+        host = self._host(detail)
+        try:
+            with shared_pool().connection(host, self.user, self.key_path) as conn:
+                return conn.run(WORKSPACE_RESET_COMMAND.format(hostname=hostname), hide=True, warn=True).ok
+        except Exception as e:
+            console.print(f"[red]✗ 清理池实例 {detail['name']} 失败: {e}[/red]")
+            return False
+
+    def release(self, instances, reuse=True):
+        """归还实例; reuse为False时 (例如任务失败导致环境不可复用) 直接删除
+
+        reuse为True时先清理工作区, 没有配置清理方式或清理失败的实例同样删除
+        """
+        ids = {inst['id'] for inst in instances}
+        with self._locked_state() as state:
+            records = {inst['id']: inst for inst in state['instances'] if inst['id'] in ids}
+        clean = set()
+        if reuse and self.reset is None:
+            console.print("[yellow]⚠ 实例池没有配置工作区清理 (key_path/reset), 归还的实例将被删除[/yellow]")
+        elif reuse:
+            with ThreadPoolExecutor(max_workers=min(max(len(records), 1), 10)) as executor:
+                futures = {executor.submit(self.reset, inst['detail'], self._hostname(inst)): inst_id
+                           for inst_id, inst in records.items()}
+                clean = {futures[future] for future in as_completed(futures) if future.result()}
+        to_delete = []
+        with self._locked_state() as state:
+            kept = []
+            for inst in state['instances']:
+                if inst['id'] in ids and inst['id'] not in clean:
+                    to_delete.append(inst['detail'])
+                    continue
+                if inst['id'] in ids:
+                    inst['state'] = 'idle'
+                    inst['leased_by'] = None
+                    inst['idle_since'] = time.time()
+                kept.append(inst)
+            state['instances'] = kept
+        if to_delete:
+            self._delete_instances(to_delete)
+        console.print(f"[green]✓ 已归还 {len(ids) - len(to_delete)} 个实例, 删除 {len(to_delete)} 个[/green]")
+
+    @staticmethod
+    def _hostname(inst):
+        """池实例创建时的主机名 (与 create_instance 的 cloud-config 一致)"""
+        instance_type = inst['key'].split("|")[0]
+        return f"node{inst['slot']}-{instance_type.replace('.', '-')}"
+
+    def _create_pool_instance(self, progress, task_id, key, slot):
+        """创建并初始化一个池实例"""
+        instance_type, ami, instance_zone = key.split("|")
+        eip_id = None
+        if self.use_ip:
+            eips = self.manager.allocate_eips(1, f"pool_{slot}", self.bandwidth)
+            if not eips:
+                return None
+            self.manager.eip_list.extend(eips)
+            eip_id = eips[0]['id']
+        detail = self.manager.create_instance(
+            progress, task_id,
+            vpc_id=self.vpc_id,
+            instance_index=slot,
+            instance_type=instance_type,
+            instance_zone=instance_zone,
+            ami=ami,
+            key_pair=self.key_pair,
+            security_group_id=self.security_group_id,
+            subnet_id=self.subnet_id,
+            run_number="pool",
+            task_type=instance_type.replace(".", "-"),
+            timeout_hours=self.timeout_hours,
+            actor=self.actor,
+            eip_id=eip_id
+        )
+        if not detail:
+            if eip_id:
+                self.manager.release_eips([eip_id])
+            return None
+        if self.setup and not self.setup(detail):
+            console.print(f"[red]✗ 池实例 {detail['name']} 初始化失败, 删除[/red]")
+            self._delete_instances([detail])
+            return None
+        return detail
+
+    def _delete_instances(self, details):
+        """删除池实例; 使用EIP池时实例的EIP被保留, 删除后归还"""
+        self.manager.delete_instances([detail['id'] for detail in details])
+        eip_ids = [detail['eip_id'] for detail in details if detail.get('eip_id')]
+        if eip_ids and self.manager.eip_pool is not None:
+            self.manager.release_eips(eip_ids)
+
+    def refill(self, key):
+        """补齐某个分组的空闲实例数量"""
+        with self._locked_state() as state:
+            members = [inst for inst in state['instances'] if inst['key'] == key]
+            missing = self.pool_size - sum(1 for inst in members if inst['state'] == 'idle')
+            next_slot = max([inst['slot'] for inst in members], default=-1) + 1
+        if missing <= 0:
+            return 0
+
+        console.print(f"[cyan]实例池 {key} 补充 {missing} 个实例...[/cyan]")
+        created = []
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn(),
+            console=console,
+        ) as progress:
+            with ThreadPoolExecutor(max_workers=min(missing, 10)) as executor:
+                futures = {}
+                for i in range(missing):
+                    slot = next_slot + i
+                    task_id = progress.add_task(f"Pool instance {slot}...", total=100)
+                    futures[executor.submit(self._create_pool_instance, progress, task_id, key, slot)] = slot
+                for future in as_completed(futures):
+                    try:
+                        detail = future.result()
+                    except Exception as e:
+                        console.print(f"[red]创建池实例 {futures[future]} 出错: {e}[/red]")
+                        continue
+                    if detail:
+                        created.append((futures[future], detail))
+
+        now = time.time()
+        with self._locked_state() as state:
+            for slot, detail in created:
+                state['instances'].append({
+                    'id': detail['id'],
+                    'key': key,
+                    'slot': slot,
+                    'state': 'idle',
+                    'leased_by': None,
+                    'created_at': now,
+                    'expires_at': now + float(self.timeout_hours) * 3600,
+                    'idle_since': now,
+                    'detail': detail
+                })
+        return len(created)
+
+    def reap(self):
+        """删除空闲时间超过TTL或即将自动终止的实例"""
+        now = time.time()
+        expired = []
+        with self._locked_state() as state:
+            kept = []
+            for inst in state['instances']:
+                if inst['state'] == 'idle' and (now - inst.get('idle_since', now) > self.idle_ttl
+                                                or self._expires_at(inst) - now < self.lease_margin):
+                    expired.append(inst['detail'])
+                else:
+                    kept.append(inst)
+            state['instances'] = kept
+        if expired:
+            console.print(f"[yellow]回收 {len(expired)} 个空闲超时的池实例...[/yellow]")
+            self._delete_instances(expired)
+        return [detail['id'] for detail in expired]
+
+    def maintain_once(self):
+        self.reap()
+        for key in list(self.keys):
+            self.refill(key)
+
+    def start(self, interval=60):
+        """启动后台补齐/回收线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def _loop():
+            while not self._stop.is_set():
+                try:
+                    self.maintain_once()
+                except Exception as e:
+                    console.print(f"[red]实例池维护出错: {e}[/red]")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=_loop, name="instance-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def drain(self):
+        """删除池中全部空闲实例"""
+        with self._locked_state() as state:
+            idle = [inst['detail'] for inst in state['instances'] if inst['state'] == 'idle']
+            state['instances'] = [inst for inst in state['instances'] if inst['state'] != 'idle']
+        if idle:
+            self._delete_instances(idle)
+        return [detail['id'] for detail in idle]
+
+    def show(self):
+        with self._locked_state() as state:
+            instances = list(state['instances'])
+        table = Table(title="实例池", show_header=True, header_style="bold cyan")
+        table.add_column("分组")
+        table.add_column("ID", style="dim")
+        table.add_column("私有IP")
+        table.add_column("公网IP")
+        table.add_column("状态")
+        table.add_column("借用者")
+        for inst in instances:
+            table.add_row(inst['key'], inst['id'], inst['detail'].get('private_ip', 'N/A'),
+                          inst['detail'].get('public_ip', 'N/A'), inst['state'], str(inst.get('leased_by') or ''))
+        console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='华为云ECS预热实例池 (按规格/镜像/可用区保持空闲实例)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""示例:
+  python -m hwscheduler.huawei.instance_pool --ak YOUR_AK --sk YOUR_SK --region cn-east-3 \\
+    --vpc-id vpc-123 --instance-type kc1.large.4 --ami xxxx --key-pair my-key \\
+    --security-group-id sg-xxxx --subnet-id subnet-yyyy --actor tester --size 4 --use-ip
+""")
+    parser.add_argument('--ak', required=True, help='华为云Access Key')
+    parser.add_argument('--sk', required=True, help='华为云Secret Key')
+    parser.add_argument('--region', required=True, help='区域(如: cn-north-4)')
+    parser.add_argument('--vpc-id', required=True, help='VPC ID')
+    parser.add_argument('--instance-type', required=True, help='实例类型 (如: s6.large.2)')
+    parser.add_argument('--instance-zone', help='可用区(如: cn-north-4a, 默认: <region>a)', default=None)
+    parser.add_argument('--ami', required=True, help='镜像ID')
+    parser.add_argument('--key-pair', required=True, help='SSH密钥对名称')
+    parser.add_argument('--security-group-id', required=True, help='安全组ID')
+    parser.add_argument('--subnet-id', required=True, help='子网ID')
+    parser.add_argument('--actor', required=True, help='操作者')
+    parser.add_argument('--size', type=int, default=2, help='每个分组保持的空闲实例数')
+    parser.add_argument('--idle-ttl', type=int, default=3600, help='空闲实例回收时间(秒)')
+    parser.add_argument('--timeout-hours', default="24", help='池实例自动终止时间(小时)')
+    parser.add_argument('--interval', type=int, default=60, help='补齐/回收检查间隔(秒)')
+    parser.add_argument('--use-ip', action='store_true', help='是否分配公网IP (默认为不分配)', default=False)
+    parser.add_argument('--bandwidth', type=int, default=5, help='EIP带宽大小(Mbps)')
+    parser.add_argument('--key-path', default=None,
+                        help='SSH私钥路径, 用于新实例的登录检查和归还时的工作区清理 (未指定时归还的实例会被删除)')
+    parser.add_argument('--user', default="root", help='SSH登录用户')
+    parser.add_argument('--state-path', default=DEFAULT_POOL_STATE, help='池状态文件路径')
+    parser.add_argument('--drain', action='store_true', help='删除全部空闲实例后退出')
+    args = parser.parse_args()
+
+    manager = ECSInstanceManager(args.ak, args.sk, args.region)
+    pool = InstancePool(
+        manager, args.vpc_id, args.key_pair, args.security_group_id, args.subnet_id, args.actor,
+        pool_size=args.size, idle_ttl=args.idle_ttl, timeout_hours=args.timeout_hours,
+        use_ip=args.use_ip, bandwidth=args.bandwidth, state_path=args.state_path,
+        key_path=args.key_path, user=args.user
+    )
+    if args.drain:
+        pool.drain()
+        return
+
+    if not args.key_path:
+        console.print("[yellow]⚠ 未指定 --key-path: 新实例不做登录检查, 归还的实例无法清理将被删除[/yellow]")
+    instance_zone = args.instance_zone if args.instance_zone else f"{args.region}a"
+    pool.keys.add(pool_key(args.instance_type, args.ami, instance_zone))
+    console.rule(f"[bold blue]实例池运行中: 每组保持 {args.size} 个空闲实例[/bold blue]")
+    pool.start(interval=args.interval)
+    try:
+        while True:
+            time.sleep(args.interval)
+            pool.show()
+    except KeyboardInterrupt:
+        console.print("[yellow]停止实例池维护 (保留现有实例, 可使用 --drain 删除)[/yellow]")
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
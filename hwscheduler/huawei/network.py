@@ -0,0 +1,107 @@
+# coding: utf-8
+import threading
+from fabric import Connection
+from hwscheduler.huawei.ssh_probe import wait_for_ssh, wait_for_ssh_via
+from hwscheduler.huawei.connection_pool import shared_pool
+
+# 网络模式
+NETWORK_PUBLIC = "public"      # 每个节点一个EIP, 直接连接公网IP
+NETWORK_BASTION = "bastion"    # 只有跳板机有公网IP, 其余节点经跳板机 (ProxyJump) 连接私有IP
+NETWORK_PRIVATE = "private"    # 调度机位于同一VPC内, 不申请EIP, 直接连接私有IP
+NETWORK_MODES = (NETWORK_PUBLIC, NETWORK_BASTION, NETWORK_PRIVATE)
+
+
+class ClusterNetwork:
+    """决定调度机如何通过SSH访问集群节点
+
+    bastion模式下默认使用node0作为跳板机 (也可以指定长期存在的跳板机地址),
+    其他节点通过跳板机SSH连接上的 direct-tcpip 通道访问其私有IP。
+    跳板机连接在所有节点之间共享 (paramiko的Transport支持并发打开多个通道)。
+    private模式下调度机与集群位于同一VPC, 所有连接和传输都走私有IP, 不受EIP带宽限制。
+    """
+
+    def __init__(self, mode=NETWORK_PUBLIC, key_path=None, user="root", bastion_host=None):
+        if mode not in NETWORK_MODES:
+            raise ValueError(f"未知的网络模式: {mode}")
+        self.mode = mode
+        self.key_path = key_path
+        self.user = user
+        self.bastion_host = bastion_host
+        self._gateway = None
+        self._lock = threading.Lock()
+
+    def eip_count(self, num_instances):
+        """需要申请的EIP数量: bastion模式只给node0分配 (已指定外部跳板机时不分配), private模式不分配"""
+        if self.mode == NETWORK_PRIVATE:
+            return 0
+        if self.mode == NETWORK_BASTION:
+            return 0 if self.bastion_host else min(1, num_instances)
+        return num_instances
+
+    def use_nodes(self, nodes_info):
+        """根据创建结果确定跳板机 (未指定时使用node0的公网IP)"""
+        if self.mode == NETWORK_BASTION and not self.bastion_host:
+            first = min(nodes_info, key=lambda info: info['index'], default=None)
+            if first and first.get('public_ip', 'N/A') != 'N/A':
+                self.bastion_host = first['public_ip']
+
+    def is_bastion(self, node):
+        return self.mode == NETWORK_BASTION and node.get('public_ip') == self.bastion_host
+
+    def reachable(self, node):
+        """调度机能否访问该节点"""
+        if self.mode == NETWORK_BASTION:
+            return bool(self.bastion_host) and node.get('private_ip', 'N/A') != 'N/A'
+        if self.mode == NETWORK_PRIVATE:
+            return node.get('private_ip', 'N/A') != 'N/A'
+        return node.get('public_ip', 'N/A') != 'N/A'
+
+    def ssh_host(self, node):
+        """节点的SSH目标地址"""
+        if self.mode == NETWORK_PRIVATE or (self.mode == NETWORK_BASTION and not self.is_bastion(node)):
+            return node['private_ip']
+        return node['public_ip']
+
+    def gateway(self):
+        """跳板机连接 (非bastion模式下为None)"""
+        if self.mode != NETWORK_BASTION:
+            return None
+        with self._lock:
+            if self._gateway is None:
+                self._gateway = Connection(
+                    host=self.bastion_host,
+                    user=self.user,
+                    connect_kwargs={"key_filename": self.key_path}
+                )
+            # 提前建立连接, 避免多个线程同时打开同一个跳板机连接
+            if not self._gateway.is_connected:
+                self._gateway.open()
+            return self._gateway
+
+    def connect(self, node, user=None, key_path=None, pool=None):
+        """从连接池独占借出到节点的连接 (with 语句, bastion模式下自动经跳板机), 退出时归还而不关闭"""
+        gateway = None if self.is_bastion(node) else self.gateway()
+        return (pool or shared_pool()).connection(self.ssh_host(node), user or self.user,
+                                                  key_path or self.key_path, gateway)
+
+    def wait_for_ssh(self, nodes):
+        """等待节点SSH就绪, 返回 hostname -> 是否就绪"""
+        if self.mode != NETWORK_BASTION:
+            ready = wait_for_ssh([self.ssh_host(node) for node in nodes])
+            return {node['hostname']: ready[self.ssh_host(node)] for node in nodes}
+        if not wait_for_ssh([self.bastion_host])[self.bastion_host]:
+            return {node['hostname']: False for node in nodes}
+        inner = [node for node in nodes if not self.is_bastion(node)]
+        ready = wait_for_ssh_via(self.gateway(), [node['private_ip'] for node in inner])
+        results = {node['hostname']: True for node in nodes if self.is_bastion(node)}
+        results.update({node['hostname']: ready[node['private_ip']] for node in inner})
+        return results
+
+    def close(self):
+        # 经跳板机的池化连接依赖跳板机连接, 先关闭
+        if self.mode == NETWORK_BASTION:
+            shared_pool().close_all()
+        with self._lock:
+            if self._gateway is not None:
+                self._gateway.close()
+                self._gateway = None
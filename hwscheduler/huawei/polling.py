@@ -0,0 +1,137 @@
+# coding: utf-8
+import json
+import os
+import random
+import threading
+import time
+from statistics import median
+
+DEFAULT_HISTORY_PATH = "./cache/polling_history.json"
+
+
+class TransitionHistory:
+    """记录各类状态转换的历史耗时 (例如某规格实例到ACTIVE的时间), 保存在本地缓存文件中"""
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, keep=20):
+        self.path = path
+        self.keep = keep
+        self._samples = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._samples is None:
+            self._samples = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r') as f:
+                        self._samples = json.load(f)
+                except (OSError, ValueError):
+                    self._samples = {}
+        return self._samples
+
+    def expected(self, key):
+        """返回该转换的典型耗时 (历史中位数), 没有历史时返回None"""
+        with self._lock:
+            samples = self._load().get(key)
+            return median(samples) if samples else None
+
+    def record(self, key, duration):
+        with self._lock:
+            samples = self._load().setdefault(key, [])
+            samples.append(round(duration, 2))
+            del samples[:-self.keep]
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._samples, f, indent=2)
+                os.replace(tmp_path, self.path)
+
+
+class PollingPolicy:
+    """轮询策略: 快速开始, 指数退避加抖动, 直到上限
+
+    有历史记录时, 第一次等待直接跳到典型耗时的 lead 倍处, 然后从 initial 开始重新快速轮询,
+    既不会在状态不可能变化前浪费调用, 也能在转换完成后很快发现。
+    """
+
+    def __init__(self, initial=1.0, factor=2.0, max_interval=15.0, jitter=0.2, timeout=300,
+                 lead=0.8, history=None):
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.lead = lead
+        self.history = history
+
+    def start(self, key=None):
+        """开始一次等待"""
+        return PollSession(self, key)
+
+    def record(self, key, duration):
+        if self.history is not None and key:
+            self.history.record(key, duration)
+
+
+class PollSession:
+    """一次等待过程的轮询状态"""
+
+    def __init__(self, policy, key=None):
+        self.policy = policy
+        self.key = key
+        self.started = time.monotonic()
+        self.attempt = 0
+        expected = policy.history.expected(key) if policy.history is not None and key else None
+        self.first_delay = expected * policy.lead if expected else None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.elapsed >= self.policy.timeout
+
+    def next_delay(self):
+        """下一次轮询前应等待的秒数"""
+        policy = self.policy
+        if self.attempt == 0 and self.first_delay:
+            delay = self.first_delay
+        else:
+            step = self.attempt - 1 if self.first_delay else self.attempt
+            delay = min(policy.max_interval, policy.initial * (policy.factor ** step))
+        self.attempt += 1
+        delay *= random.uniform(1 - policy.jitter, 1 + policy.jitter)
+        remaining = policy.timeout - self.elapsed
+        if remaining > 0:
+            # 不要睡过超时点; 已超时 (由调用方自行决定是否继续) 时保持退避间隔
+            delay = min(delay, remaining)
+        return max(0.0, delay)
+
+    def sleep(self):
+        time.sleep(self.next_delay())
+
+    def succeeded(self):
+        """记录本次转换耗时, 供后续等待参考"""
+        self.policy.record(self.key, self.elapsed)
+
+
+_shared_history = None
+
+
+def shared_history():
+    """进程内共享的历史记录"""
+    global _shared_history
+    if _shared_history is None:
+        _shared_history = TransitionHistory()
+    return _shared_history
+
+
+def default_ready_policy():
+    """实例启动等待的默认策略"""
+    return PollingPolicy(initial=1.0, max_interval=15.0, timeout=300, history=shared_history())
+
+
+def default_job_policy():
+    """Job完成等待的默认策略"""
+    return PollingPolicy(initial=1.0, max_interval=15.0, timeout=300, history=shared_history())
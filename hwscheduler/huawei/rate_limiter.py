@@ -0,0 +1,130 @@
+# coding: utf-8
+import random
+import threading
+import time
+from huaweicloudsdkcore.exceptions import exceptions
+
+# 华为云API网关流控错误码
+THROTTLE_ERROR_CODES = {"APIGW.0308", "APIGW.0307", "Ecs.0069"}
+
+# 各API族的默认预算: (每秒令牌数, 桶容量)
+DEFAULT_BUDGETS = {
+    'ecs_create': (2.0, 5),
+    'ecs_query': (10.0, 20),
+    'ecs_update': (5.0, 10),
+    'ecs_delete': (2.0, 5),
+    'ecs_job': (10.0, 20),
+    'eip': (5.0, 10),
+    'default': (5.0, 10),
+}
+
+# SDK方法名 -> API族
+API_FAMILIES = {
+    'create_post_paid_servers': 'ecs_create',
+    'show_server': 'ecs_query',
+    'list_servers_details': 'ecs_query',
+    'update_server': 'ecs_update',
+    'batch_create_server_tags': 'ecs_update',
+    'delete_servers': 'ecs_delete',
+    'show_job': 'ecs_job',
+    'create_publicip': 'eip',
+    'delete_publicip': 'eip',
+    'show_publicip': 'eip',
+    'list_publicips': 'eip',
+    'update_publicip': 'eip',
+    'update_bandwidth': 'eip',
+}
+
+
+def is_throttled(error):
+    """判断SDK异常是否为流控"""
+    if not isinstance(error, exceptions.ClientRequestException):
+        return False
+    return error.status_code == 429 or error.error_code in THROTTLE_ERROR_CODES
+
+
+class TokenBucket:
+    """线程安全的令牌桶"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        """阻塞直到取得令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = max(self.blocked_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def block(self, seconds):
+        """被流控后暂停整个API族, 避免所有线程同时重试"""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class RateLimiter:
+    """进程级客户端限流器, 每个API族一个令牌桶, 遇到流控错误码时指数退避"""
+
+    def __init__(self, budgets=None, max_throttle_retries=5, base_backoff=1.0, max_backoff=30.0):
+        budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.buckets = {family: TokenBucket(rate, capacity) for family, (rate, capacity) in budgets.items()}
+        self.max_throttle_retries = max_throttle_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def family_of(self, fn):
+        return API_FAMILIES.get(getattr(fn, '__name__', ''), 'default')
+
+    def call(self, fn, *args, **kwargs):
+        """通过对应API族的令牌桶调用SDK方法, 流控时退避后重试"""
+        bucket = self.buckets[self.family_of(fn)]
+        for attempt in range(self.max_throttle_retries + 1):
+            bucket.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except exceptions.ClientRequestException as e:
+                if not is_throttled(e) or attempt == self.max_throttle_retries:
+                    raise
+                backoff = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+                bucket.block(backoff * random.uniform(0.5, 1.0))
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """获取进程内共享的限流器"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def configure_rate_limiter(budgets=None, **kwargs):
+    """替换进程内共享的限流器 (例如按账户配额调整预算)"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = RateLimiter(budgets, **kwargs)
+        return _rate_limiter
+
+
+def call_api(fn, *args, **kwargs):
+    """所有华为云SDK调用的统一入口"""
+    return get_rate_limiter().call(fn, *args, **kwargs)
@@ -3,6 +3,12 @@ import subprocess
 import os
 import time
 import socket
+import base64
+import hashlib
+import hmac
+from hwscheduler.huawei.ssh_probe import wait_for_ssh, wait_for_ssh_host
+
+KNOWN_HOSTS_PATH = os.path.expanduser("~/.ssh/known_hosts")
 def is_root():
     """检查当前用户是否是root用户"""
     return os.geteuid() == 0
@@ -77,7 +83,7 @@ def printFile(path):
         print(f"Error: {e}")
     
 # 使用 ssh-keyscan 将节点主机名添加到 known_hosts
-def add_to_known_hosts(hostname, retries=20, delay=5):
+def add_to_known_hosts(hostname, retries=3, delay=2, wait_ready=True):
     ssh_dir = os.path.expanduser("~/.ssh")
     os.makedirs(ssh_dir, exist_ok=True)
     
@@ -86,6 +92,10 @@ def add_to_known_hosts(hostname, retries=20, delay=5):
     if not os.path.exists(known_hosts_path):
         open(known_hosts_path, 'a').close()
     os.chmod(known_hosts_path, 0o600)
+
+    # 先等待SSH端口返回banner, 之后的 ssh-keyscan 基本一次成功
+    if wait_ready and not wait_for_ssh_host(hostname):
+        raise RuntimeError(f"SSH on {hostname} not ready")
     
     for attempt in range(retries):
         try:
@@ -124,21 +134,140 @@ def add_to_known_hosts(hostname, retries=20, delay=5):
     print(f'Failed to add {hostname} to known_hosts after {retries} attempts.')
     raise RuntimeError("Max retries exceeded")
 
+def _write_hosts(content, hosts_file='/etc/hosts'):
+    """一次性重写hosts文件: root时先写临时文件再rename, 否则通过一次 sudo tee 写入"""
+    if is_root():
+        tmp_path = f"{hosts_file}.hwscheduler.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, hosts_file)
+            return
+        except OSError:
+            # 容器内的 /etc/hosts 通常是bind mount, 不能rename覆盖, 退回到原地写入
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with open(hosts_file, 'w') as f:
+                f.write(content)
+            return
+    subprocess.run(['sudo', 'tee', hosts_file], input=content, stdout=subprocess.DEVNULL,
+                   universal_newlines=True, check=True)
+
+
+def update_hosts_block(task_type, entries, hosts_file='/etc/hosts'):
+    """用 entries ([(ip, hostname)]) 替换 /etc/hosts 中该任务的受管区块
+
+    同时清理旧版本逐行追加的 node{数字}-{task_type} 条目, 整个文件只写一次。
+    """
+    begin = f"# BEGIN hwscheduler {task_type}"
+    end = f"# END hwscheduler {task_type}"
+    legacy = re.compile(r'\b(node\d+-{})\b'.format(re.escape(task_type)))
+    with open(hosts_file, 'r') as f:
+        lines = f.read().splitlines()
+
+    kept, in_block = [], False
+    for line in lines:
+        if line.strip() == begin:
+            in_block = True
+        elif line.strip() == end:
+            in_block = False
+        elif not in_block and not legacy.search(line):
+            kept.append(line)
+    block = [begin] + [f"{ip}\t{hostname}" for ip, hostname in entries] + [end]
+    _write_hosts("\n".join(kept + block) + "\n", hosts_file)
+
+
+def _hash_hostname(hostname, salt):
+    """known_hosts 的哈希主机名格式 (与 ssh-keyscan -H 相同)"""
+    digest = hmac.new(salt, hostname.encode('utf-8'), hashlib.sha1).digest()
+    return f"|1|{base64.b64encode(salt).decode()}|{base64.b64encode(digest).decode()}"
+
+
+def _matches_host(field, hostnames):
+    """known_hosts 条目的主机字段 (明文或哈希) 是否属于 hostnames 之一"""
+    for name in field.split(','):
+        if name.startswith('|1|'):
+            try:
+                _, _, salt, _ = name.split('|')
+                salt = base64.b64decode(salt)
+            except ValueError:
+                continue
+            if any(_hash_hostname(hostname, salt) == name for hostname in hostnames):
+                return True
+        elif name in hostnames:
+            return True
+    return False
+
+
+def write_known_hosts(host_keys, known_hosts_path=KNOWN_HOSTS_PATH):
+    """把 {hostname: ["keytype key", ...]} 写入known_hosts (哈希主机名), 先删除这些主机的旧条目"""
+    os.makedirs(os.path.dirname(known_hosts_path), exist_ok=True)
+    lines = []
+    if os.path.exists(known_hosts_path):
+        with open(known_hosts_path, 'r') as f:
+            lines = f.read().splitlines()
+    names = set(host_keys)
+    kept = [line for line in lines if not line.strip() or line.startswith('#')
+            or not _matches_host(line.split()[0], names)]
+    added = [f"{_hash_hostname(hostname, os.urandom(20))} {key}"
+             for hostname, keys in host_keys.items() for key in keys]
+    tmp_path = f"{known_hosts_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write("\n".join(kept + added) + "\n")
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, known_hosts_path)
+
+
+def scan_host_keys(hostnames, retries=3, delay=2, timeout=5):
+    """一次 ssh-keyscan 并行扫描全部主机, 只对未返回密钥的主机重试
+
+    返回 {hostname: ["keytype key", ...]}, 重试后仍失败的主机不在结果中。
+    """
+    host_keys = {}
+    pending = list(dict.fromkeys(hostnames))
+    for attempt in range(retries):
+        if not pending:
+            break
+        result = subprocess.run(['ssh-keyscan', '-T', str(timeout)] + pending,
+                                capture_output=True, text=True)
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and not line.startswith('#') and parts[0] in pending:
+                host_keys.setdefault(parts[0], []).append(" ".join(parts[1:3]))
+        pending = [hostname for hostname in pending if hostname not in host_keys]
+        if pending:
+            print(f"Attempt {attempt + 1}/{retries}: no host key from {', '.join(pending)}")
+            if attempt < retries - 1:
+                time.sleep(delay)
+    return host_keys
+
+
 def save_info(instances,task_type,is_public):
     fileName = task_type + "_nodes_info.txt"
-    # 保存节点信息到一个文件，包含 Public IP 地址
+    entries = []
+    # 保存节点信息到一个文件，包含 Public IP 地址 (调度机位于VPC内时为私有IP)
     with open(f'./cache/{fileName}', 'w') as f:
         for instance in instances:
-            # 保存节点信息到文件，每一行格式为：node{index} {Public IP} {server_id} {private_ip}
-            f.write(f'node{instance[0]}-{task_type} {instance[1]} {instance[2]} {instance[3]}\n')
-            
-            # 根据是否 root 决定是否添加 sudo
-            sudo_prefix = "" if is_root() else "sudo "
             ip = instance[1] if is_public else instance[3]
-            command = f"echo '{ip} node{instance[0]}-{task_type}' | {sudo_prefix}tee -a /etc/hosts"
-            # 执行命令
-            subprocess.run(command, shell=True, check=True)
-            add_to_known_hosts(f"node{instance[0]}-{task_type}")
+            # 保存节点信息到文件，每一行格式为：node{index} {连接地址} {server_id} {private_ip}
+            f.write(f'node{instance[0]}-{task_type} {ip} {instance[2]} {instance[3]}\n')
+            entries.append((ip, f"node{instance[0]}-{task_type}"))
+
+    # 所有节点的hosts条目一次写入
+    update_hosts_block(task_type, entries)
+    hostnames = [hostname for _, hostname in entries]
+
+    # 同时探测所有节点, 再一次性扫描全部主机密钥
+    ready = wait_for_ssh(hostnames)
+    not_ready = [hostname for hostname in hostnames if not ready[hostname]]
+    if not_ready:
+        raise RuntimeError(f"SSH on {', '.join(not_ready)} not ready")
+    host_keys = scan_host_keys(hostnames)
+    missing = [hostname for hostname in hostnames if hostname not in host_keys]
+    if missing:
+        raise RuntimeError(f"Failed to scan host keys of {', '.join(missing)}")
+    write_known_hosts(host_keys)
+    print(f'Added {len(host_keys)} hosts to known_hosts.')
             
     print(f'Node information with Public IPs has been saved to {fileName}')
     
@@ -0,0 +1,188 @@
+# coding: utf-8
+import errno
+import selectors
+import socket
+import time
+from rich.console import Console
+from hwscheduler.huawei.polling import PollingPolicy
+
+console = Console()
+
+SSH_BANNER_PREFIX = b"SSH-"
+
+
+def default_probe_policy():
+    """SSH探测的默认策略: 0.5s起步, 短间隔指数退避"""
+    return PollingPolicy(initial=0.5, factor=2.0, max_interval=5.0, jitter=0.2, timeout=300)
+
+
+class _ProbeTarget:
+    """单个主机的探测状态"""
+
+    def __init__(self, host, port, session):
+        self.host = host
+        self.port = port
+        self.session = session
+        self.sock = None
+        self.reading = False
+        self.attempt_deadline = 0.0
+        self.next_attempt = 0.0
+        self.last_error = None
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.reading = False
+
+
+class SSHReadinessProbe:
+    """同时探测大量主机的SSH就绪状态
+
+    对每个主机发起非阻塞的TCP连接 (默认22端口), 连接建立后读取SSH banner,
+    收到 "SSH-" 前缀才算就绪; 失败的主机按 PollingPolicy 退避后重试。
+    所有主机在同一个 selector 中处理, 不需要为每个主机占用线程。
+    """
+
+    def __init__(self, port=22, connect_timeout=3.0, policy=None):
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.policy = policy or default_probe_policy()
+
+    def _start_attempt(self, selector, target, now):
+        target.close()
+        target.attempt_deadline = now + self.connect_timeout
+        try:
+            addr = socket.getaddrinfo(target.host, target.port, type=socket.SOCK_STREAM)[0]
+        except socket.gaierror as e:
+            # 主机名暂时无法解析 (例如hosts尚未写入), 按失败处理
+            self._fail(target, e, now)
+            return
+        sock = socket.socket(addr[0], addr[1], addr[2])
+        sock.setblocking(False)
+        code = sock.connect_ex(addr[4])
+        if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+            sock.close()
+            self._fail(target, OSError(code, errno.errorcode.get(code, str(code))), now)
+            return
+        target.sock = sock
+        selector.register(sock, selectors.EVENT_WRITE, target)
+
+    def _fail(self, target, error, now):
+        target.last_error = error
+        target.close()
+        target.next_attempt = now + target.session.next_delay()
+
+    def _handle(self, selector, target, now):
+        """处理可写 (连接完成) 或可读 (banner到达) 事件, 就绪返回True"""
+        if not target.reading:
+            code = target.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if code != 0:
+                selector.unregister(target.sock)
+                self._fail(target, OSError(code, errno.errorcode.get(code, str(code))), now)
+                return False
+            target.reading = True
+            selector.modify(target.sock, selectors.EVENT_READ, target)
+            return False
+        try:
+            banner = target.sock.recv(256)
+        except OSError as e:
+            banner, error = b"", e
+        else:
+            error = ValueError(f"unexpected banner {banner[:32]!r}")
+        selector.unregister(target.sock)
+        if banner.startswith(SSH_BANNER_PREFIX):
+            target.close()
+            return True
+        self._fail(target, error, now)
+        return False
+
+    def wait(self, hosts, timeout=None):
+        """等待所有主机的SSH就绪, 返回 host -> 是否就绪"""
+        timeout = timeout or self.policy.timeout
+        deadline = time.monotonic() + timeout
+        targets = {host: _ProbeTarget(host, self.port, self.policy.start()) for host in dict.fromkeys(hosts)}
+        results = {host: False for host in targets}
+        pending = set(targets)
+        selector = selectors.DefaultSelector()
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                for host in list(pending):
+                    target = targets[host]
+                    if target.sock is None and target.next_attempt <= now:
+                        self._start_attempt(selector, target, now)
+                    elif target.sock is not None and now >= target.attempt_deadline:
+                        selector.unregister(target.sock)
+                        self._fail(target, socket.timeout("timed out"), now)
+
+                wakeups = [t.attempt_deadline if t.sock is not None else t.next_attempt
+                           for t in (targets[h] for h in pending)]
+                wait = max(0.0, min(min(wakeups), deadline) - time.monotonic())
+                for key, _ in selector.select(wait):
+                    target = key.data
+                    if self._handle(selector, target, time.monotonic()):
+                        results[target.host] = True
+                        pending.discard(target.host)
+        finally:
+            for target in targets.values():
+                if target.sock is not None:
+                    selector.unregister(target.sock)
+                target.close()
+            selector.close()
+
+        for host in pending:
+            console.print(f"[red]✗ {host}:{self.port} SSH在 {timeout} 秒内未就绪: {targets[host].last_error}[/red]")
+        return results
+
+
+def wait_for_ssh(hosts, port=22, timeout=None, policy=None):
+    """等待一组主机的SSH就绪, 返回 host -> 是否就绪"""
+    return SSHReadinessProbe(port=port, policy=policy).wait(hosts, timeout)
+
+
+def wait_for_ssh_host(host, port=22, timeout=None, policy=None):
+    """等待单个主机的SSH就绪"""
+    return wait_for_ssh([host], port, timeout, policy)[host]
+
+
+def _read_banner(channel, timeout):
+    channel.settimeout(timeout)
+    try:
+        return channel.recv(256)
+    finally:
+        channel.close()
+
+
+def wait_for_ssh_via(gateway, hosts, port=22, timeout=None, policy=None, connect_timeout=3.0):
+    """通过跳板机 (已打开的fabric Connection) 探测内网主机的SSH就绪状态
+
+    对每个主机在跳板机的SSH连接上打开 direct-tcpip 通道并读取banner, 内网地址无需公网可达。
+    返回 host -> 是否就绪
+    """
+    policy = policy or default_probe_policy()
+    timeout = timeout or policy.timeout
+    deadline = time.monotonic() + timeout
+    gateway.open()
+    transport = gateway.client.get_transport()
+    results = {}
+    for host in dict.fromkeys(hosts):
+        session = policy.start()
+        last_error = None
+        while time.monotonic() < deadline:
+            try:
+                channel = transport.open_channel("direct-tcpip", (host, port), ("127.0.0.1", 0),
+                                                 timeout=connect_timeout)
+                if _read_banner(channel, connect_timeout).startswith(SSH_BANNER_PREFIX):
+                    results[host] = True
+                    break
+                last_error = ValueError("unexpected banner")
+            except Exception as e:
+                last_error = e
+            time.sleep(min(session.next_delay(), max(0.0, deadline - time.monotonic())))
+        else:
+            results[host] = False
+            console.print(f"[red]✗ {host}:{port} (经跳板机) SSH在 {timeout} 秒内未就绪: {last_error}[/red]")
+    return results
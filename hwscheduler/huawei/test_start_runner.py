@@ -1,8 +1,8 @@
-from fabric import Connection
 import argparse
 import requests
+from hwscheduler.huawei.connection_pool import shared_pool
 
-def start_github_runner(node, ssh_key_path, user, github_token, runner_name):
+def start_github_runner(node, ssh_key_path, user, github_token, runner_name, pool=None):
     """
     简化版 GitHub Actions Runner 启动脚本
     1. 获取 registration token
@@ -10,11 +10,8 @@ def start_github_runner(node, ssh_key_path, user, github_token, runner_name):
     3. 安装并启动服务
     """
     try:
-        with Connection(
-            host=node,
-            user=user,  # 外部连接使用 root 用户
-            connect_kwargs={"key_filename": ssh_key_path},
-        ) as conn:
+        # 外部连接使用 root 用户; 复用连接池中已建立的连接
+        with (pool or shared_pool()).connection(node, user, ssh_key_path) as conn:
             # 1. 从 GitHub API 获取 registration token
             print("获取 GitHub runner 注册 token...")
             headers = {
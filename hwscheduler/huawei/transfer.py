@@ -0,0 +1,311 @@
+# coding: utf-8
+import hashlib
+import json
+import os
+import queue
+import shlex
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from rich.console import Console
+
+console = Console()
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+# 小于该大小的文件直接用 conn.get/conn.put (paramiko 本身已有预取), 不值得开多个通道
+PARALLEL_MIN_SIZE = 64 * 1024 * 1024
+# 并行传输的分段大小, 也是断点续传记录进度的粒度
+SEGMENT_SIZE = 8 * 1024 * 1024
+# 单个SFTP读写请求的大小 (OpenSSH sftp-server 的上限)
+SFTP_BLOCK_SIZE = 32 * 1024
+
+
+# tar 退出码1表示打包期间有文件被修改 (例如仍在写入的日志), 归档本身可用
+TAR_OK_STATUS = (0, 1)
+
+
+@contextmanager
+def _exec_stream(conn, command, ok_status=(0,)):
+    """在连接的SSH传输层上直接打开一个执行通道, 调用方从通道读取标准输出
+
+    退出时检查远端命令的退出码, 不在 ok_status 中时抛出 RuntimeError (附带stderr)。
+    """
+    conn.open()
+    channel = conn.client.get_transport().open_session()
+    try:
+        channel.exec_command(command)
+        yield channel
+        status = channel.recv_exit_status()
+        if status not in ok_status:
+            stderr = b""
+            while channel.recv_stderr_ready():
+                stderr += channel.recv_stderr(STREAM_CHUNK_SIZE)
+            raise RuntimeError(f"remote command failed ({status}): {command}\n{stderr.decode(errors='replace')}")
+        if status != 0:
+            console.print(f"[yellow]⚠ 远端命令退出码 {status}: {command}[/yellow]")
+    finally:
+        channel.close()
+
+
+def _tar_command(remote_dir, paths=(".",), find_args=None, compress=True, exclude=(), list_command=None):
+    """生成把 remote_dir 下的内容打包到标准输出的tar命令
+
+    find_args 不为空时只打包 find 选中的文件 (相对 remote_dir 的路径, 保留目录结构);
+    list_command 是在 remote_dir 下执行、输出以NUL分隔的待打包路径的任意shell命令。
+    """
+    flags = "-czf" if compress else "-cf"
+    excludes = "".join(f" --exclude={shlex.quote(pattern)}" for pattern in exclude)
+    if find_args:
+        list_command = f"find {' '.join(shlex.quote(p) for p in paths)} {find_args} -print0"
+    if list_command:
+        return f"cd {shlex.quote(remote_dir)} && {list_command} | tar {flags} -{excludes} --null -T -"
+    return f"tar -C {shlex.quote(remote_dir)} {flags} -{excludes} {' '.join(shlex.quote(p) for p in paths)}"
+
+
+def stream_tar(conn, remote_dir, local_archive, paths=(".",), find_args=None, compress=True, exclude=(),
+               list_command=None):
+    """把远端目录直接打包下载为本地归档文件, 远端不落盘, 压缩和传输同时进行
+
+    返回写入的字节数
+    """
+    os.makedirs(os.path.dirname(local_archive) or ".", exist_ok=True)
+    part_path = f"{local_archive}.part"
+    written = 0
+    try:
+        command = _tar_command(remote_dir, paths, find_args, compress, exclude, list_command)
+        with _exec_stream(conn, command, TAR_OK_STATUS) as channel:
+            with open(part_path, 'wb') as f:
+                while True:
+                    data = channel.recv(STREAM_CHUNK_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    os.replace(part_path, local_archive)
+    return written
+
+
+def stream_extract(conn, remote_dir, local_dir, paths=(".",), find_args=None, compress=True):
+    """把远端目录直接打包并在本地边接收边解压到 local_dir, 返回解出的成员数"""
+    os.makedirs(local_dir, exist_ok=True)
+    count = 0
+    with _exec_stream(conn, _tar_command(remote_dir, paths, find_args, compress), TAR_OK_STATUS) as channel:
+        with channel.makefile('rb') as stream, \
+                tarfile.open(fileobj=stream, mode="r|gz" if compress else "r|") as archive:
+            for member in archive:
+                if member.name.startswith("/") or ".." in member.name.split("/"):
+                    console.print(f"[yellow]⚠ 跳过不安全的路径: {member.name}[/yellow]")
+                    continue
+                archive.extract(member, local_dir)
+                count += 1
+    return count
+
+
+def remote_find_size(conn, remote_dir, paths=(".",), find_args=""):
+    """远端 find 选中文件的总大小(字节), 用于在流式传输前估算传输量"""
+    command = (f"cd {shlex.quote(remote_dir)} && find {' '.join(shlex.quote(p) for p in paths)} -type f {find_args}"
+               " -printf '%s\\n' | awk '{s+=$1} END {print s+0}'")
+    result = conn.run(command, hide=True, warn=True)
+    try:
+        return int(result.stdout.split()[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+def remote_list_size(conn, remote_dir, list_command):
+    """list_command (见 _tar_command) 列出的路径的总大小(字节)"""
+    command = f"cd {shlex.quote(remote_dir)} && {list_command} | du -cb --files0-from=- 2>/dev/null | tail -n 1"
+    result = conn.run(command, hide=True, warn=True)
+    try:
+        return int(result.stdout.split()[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+def remote_sha256(conn, remote_path):
+    result = conn.run(f"sha256sum {shlex.quote(remote_path)}", hide=True)
+    return result.stdout.split()[0]
+
+
+def local_sha256(local_path):
+    digest = hashlib.sha256()
+    with open(local_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _segments(size, segment_size):
+    """把 [0, size) 切成 (序号, 偏移, 长度) 的分段"""
+    return [(index, offset, min(segment_size, size - offset))
+            for index, offset in enumerate(range(0, size, segment_size))]
+
+
+def _load_state(state_path, source):
+    """读取断点续传状态; 源文件 (路径/大小/修改时间/分段大小) 变化时作废, 返回已完成的分段序号集合"""
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if state.get('source') != source:
+        return set()
+    return set(state.get('done', []))
+
+
+def _save_state(state_path, source, done):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'source': source, 'done': sorted(done)}, f)
+    os.replace(tmp_path, state_path)
+
+
+def _run_segments(conn, segments, channels, transfer_segment, on_done):
+    """在 channels 个SFTP通道上并行处理分段: 每个线程打开自己的通道, 从共享队列领取分段"""
+    pending = queue.Queue()
+    for segment in segments:
+        pending.put(segment)
+
+    def worker():
+        sftp = conn.client.open_sftp()
+        try:
+            while True:
+                try:
+                    segment = pending.get_nowait()
+                except queue.Empty:
+                    return
+                transfer_segment(sftp, segment)
+                on_done(segment)
+        finally:
+            sftp.close()
+
+    with ThreadPoolExecutor(max_workers=channels) as executor:
+        futures = [executor.submit(worker) for _ in range(min(channels, len(segments)))]
+        for future in futures:
+            future.result()
+
+
+def parallel_get(conn, remote_path, local_path, channels=4, segment_size=SEGMENT_SIZE, verify=True):
+    """多通道并行下载大文件
+
+    文件按 segment_size 分段, 由 channels 个SFTP通道并发读取, 每个分段内用 readv 流水线发出
+    全部读请求, 不再每个块等待一次往返。进度记录在 <local_path>.part.json, 中断后再次调用会跳过
+    已完成的分段 (远端文件大小或修改时间变化时从头开始)。完成后比对sha256, 不一致时删除
+    临时文件并抛出 RuntimeError。返回下载的字节数。
+    """
+    conn.open()
+    stat = conn.sftp().stat(remote_path)
+    size = stat.st_size
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    started = time.monotonic()
+    if size < PARALLEL_MIN_SIZE:
+        conn.get(remote_path, local_path)
+    else:
+        part_path = f"{local_path}.part"
+        state_path = f"{part_path}.json"
+        source = {'host': conn.host, 'path': remote_path, 'size': size,
+                  'mtime': stat.st_mtime, 'segment_size': segment_size}
+        done = _load_state(state_path, source) if os.path.exists(part_path) else set()
+        if done:
+            console.print(f"[dim]续传 {remote_path}: 已完成 {len(done)} 个分段[/dim]")
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        lock = threading.Lock()
+        try:
+            os.ftruncate(fd, size)
+
+            def fetch(sftp, segment):
+                _, offset, length = segment
+                with sftp.open(remote_path, 'rb') as f:
+                    blocks = [(pos, min(SFTP_BLOCK_SIZE, offset + length - pos))
+                              for pos in range(offset, offset + length, SFTP_BLOCK_SIZE)]
+                    for (pos, _), data in zip(blocks, f.readv(blocks)):
+                        os.pwrite(fd, data, pos)
+
+            def on_done(segment):
+                with lock:
+                    done.add(segment[0])
+                    _save_state(state_path, source, done)
+
+            segments = [segment for segment in _segments(size, segment_size) if segment[0] not in done]
+            _run_segments(conn, segments, channels, fetch, on_done)
+        finally:
+            os.close(fd)
+        if verify and local_sha256(part_path) != remote_sha256(conn, remote_path):
+            os.remove(part_path)
+            os.remove(state_path)
+            raise RuntimeError(f"checksum mismatch after downloading {remote_path}")
+        os.replace(part_path, local_path)
+        os.remove(state_path)
+        verify = False
+    if verify and local_sha256(local_path) != remote_sha256(conn, remote_path):
+        raise RuntimeError(f"checksum mismatch after downloading {remote_path}")
+    elapsed = max(time.monotonic() - started, 1e-6)
+    console.print(f"[dim]{remote_path}: {size / 1024 / 1024:.1f} MB, {size / 1024 / 1024 / elapsed:.1f} MB/s[/dim]")
+    return size
+
+
+def parallel_put(conn, local_path, remote_path, channels=4, segment_size=SEGMENT_SIZE, verify=True):
+    """多通道并行上传大文件 (parallel_get 的反方向)
+
+    先写入 <remote_path>.part, 各通道以流水线方式写入自己的分段, 校验sha256后再原子改名。
+    断点续传状态记录在本地 <local_path>.<主机>.put.json。返回上传的字节数。
+    """
+    conn.open()
+    size = os.path.getsize(local_path)
+    started = time.monotonic()
+    if size < PARALLEL_MIN_SIZE:
+        conn.put(local_path, remote_path)
+    else:
+        part_path = f"{remote_path}.part"
+        state_path = f"{local_path}.{conn.host}.put.json"
+        source = {'host': conn.host, 'path': remote_path, 'size': size,
+                  'mtime': os.path.getmtime(local_path), 'segment_size': segment_size}
+        sftp = conn.sftp()
+        try:
+            resumable = sftp.stat(part_path).st_size == size
+        except IOError:
+            resumable = False
+        done = _load_state(state_path, source) if resumable else set()
+        if done:
+            console.print(f"[dim]续传 {remote_path}: 已完成 {len(done)} 个分段[/dim]")
+        else:
+            with sftp.open(part_path, 'wb') as f:
+                f.truncate(size)
+        lock = threading.Lock()
+        fd = os.open(local_path, os.O_RDONLY)
+        try:
+            def send(channel_sftp, segment):
+                _, offset, length = segment
+                with channel_sftp.open(part_path, 'r+b') as f:
+                    f.set_pipelined(True)
+                    f.seek(offset)
+                    for pos in range(offset, offset + length, SFTP_BLOCK_SIZE):
+                        f.write(os.pread(fd, min(SFTP_BLOCK_SIZE, offset + length - pos), pos))
+
+            def on_done(segment):
+                with lock:
+                    done.add(segment[0])
+                    _save_state(state_path, source, done)
+
+            segments = [segment for segment in _segments(size, segment_size) if segment[0] not in done]
+            _run_segments(conn, segments, channels, send, on_done)
+        finally:
+            os.close(fd)
+        if verify and local_sha256(local_path) != remote_sha256(conn, part_path):
+            sftp.remove(part_path)
+            os.remove(state_path)
+            raise RuntimeError(f"checksum mismatch after uploading {remote_path}")
+        sftp.posix_rename(part_path, remote_path)
+        os.remove(state_path)
+        verify = False
+    if verify and local_sha256(local_path) != remote_sha256(conn, remote_path):
+        raise RuntimeError(f"checksum mismatch after uploading {remote_path}")
+    elapsed = max(time.monotonic() - started, 1e-6)
+    console.print(f"[dim]{remote_path}: {size / 1024 / 1024:.1f} MB, {size / 1024 / 1024 / elapsed:.1f} MB/s[/dim]")
+    return size
@@ -0,0 +1,210 @@
+# coding: utf-8
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+# 阶段类型
+STAGE_PROVISION = "provision"
+STAGE_BOOTSTRAP = "bootstrap"
+STAGE_REMOTE = "remote"
+STAGE_FETCH = "fetch"
+STAGE_TEARDOWN = "teardown"
+STAGE_KINDS = (STAGE_PROVISION, STAGE_BOOTSTRAP, STAGE_REMOTE, STAGE_FETCH, STAGE_TEARDOWN)
+
+# 阶段状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Stage:
+    """任务DAG中的一个阶段
+
+    action(results) 接收已完成阶段的结果 (阶段名 -> 返回值), 抛出异常或返回假值
+    (False、空列表等, 与各 step_* 函数的约定一致) 视为失败, 失败后最多重试 retries 次。
+    依赖的阶段失败或被跳过时本阶段被跳过; always=True 的阶段 (通常是 teardown)
+    在依赖全部结束后无论成败都会执行。checkpoint=False 的阶段在续跑时总是重新执行。
+    """
+
+    def __init__(self, name, kind, action, needs=(), retries=0, retry_delay=10, always=False, checkpoint=True):
+        if kind not in STAGE_KINDS:
+            raise ValueError(f"unknown stage kind: {kind}")
+        self.name = name
+        self.kind = kind
+        self.action = action
+        self.needs = tuple(needs)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.always = always
+        self.checkpoint = checkpoint
+
+
+class Job:
+    """由阶段组成的DAG, 互不依赖的阶段并行执行
+
+    每个阶段完成后把状态和结果写入 state_path (JSON); run(resume=True) 时已完成且允许
+    checkpoint 的阶段直接使用记录的结果, 不再执行。所有 teardown 阶段成功后删除状态文件
+    (资源已释放, 记录的结果不再可用)。
+    """
+
+    def __init__(self, name, state_path=None, max_workers=8):
+        self.name = name
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.stages = {}
+        self.status = {}
+        self.results = {}
+        self.attempts = {}
+        self.durations = {}
+
+    def add(self, name, kind, action, needs=(), **options):
+        if name in self.stages:
+            raise ValueError(f"duplicate stage: {name}")
+        self.stages[name] = Stage(name, kind, action, needs, **options)
+        return self.stages[name]
+
+    def validate(self):
+        """检查依赖是否存在且无环, 返回拓扑序"""
+        for stage in self.stages.values():
+            for dep in stage.needs:
+                if dep not in self.stages:
+                    raise ValueError(f"stage {stage.name} needs unknown stage {dep}")
+        order, visiting, visited = [], set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"dependency cycle at stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].needs:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _load_checkpoint(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            console.print(f"[yellow]⚠ 无法读取任务状态 {self.state_path}: {e}[/yellow]")
+            return {}
+        if state.get('job') != self.name:
+            return {}
+        return state.get('stages', {})
+
+    def _save_checkpoint(self):
+        if not self.state_path:
+            return
+        stages = {name: {'status': self.status[name], 'result': self.results.get(name),
+                         'attempts': self.attempts.get(name, 0)}
+                  for name, stage in self.stages.items() if stage.checkpoint and self.status[name] == DONE}
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'job': self.name, 'stages': stages}, f, indent=2, default=str)
+        os.replace(tmp_path, self.state_path)
+
+    def _execute(self, stage):
+        """执行一个阶段 (含重试), 返回 (是否成功, 结果)"""
+        for attempt in range(1, stage.retries + 2):
+            self.attempts[stage.name] = attempt
+            try:
+                result = stage.action(self.results)
+                if result:
+                    return True, result
+                console.print(f"[red]✗ 阶段 {stage.name} 失败 (第{attempt}次)[/red]")
+            except Exception as e:
+                console.print(f"[red]✗ 阶段 {stage.name} 异常 (第{attempt}次): {e}[/red]")
+            if attempt <= stage.retries:
+                console.print(f"[yellow]{stage.retry_delay}秒后重试阶段 {stage.name}...[/yellow]")
+                time.sleep(stage.retry_delay)
+        return False, None
+
+    def _ready(self, name):
+        """判断待执行阶段现在能否开始: 返回 True (可执行)、False (继续等待) 或 SKIPPED"""
+        stage = self.stages[name]
+        states = [self.status[dep] for dep in stage.needs]
+        if stage.always:
+            return all(s in (DONE, FAILED, SKIPPED) for s in states)
+        if any(s in (FAILED, SKIPPED) for s in states):
+            return SKIPPED
+        return all(s == DONE for s in states)
+
+    def run(self, resume=False):
+        """执行整个DAG, 所有阶段成功时返回 True"""
+        order = self.validate()
+        self.status = {name: PENDING for name in order}
+        if resume:
+            for name, record in self._load_checkpoint().items():
+                if name in self.stages and self.stages[name].checkpoint and record.get('status') == DONE:
+                    self.status[name] = DONE
+                    self.results[name] = record.get('result')
+                    self.attempts[name] = record.get('attempts', 0)
+                    console.print(f"[dim]阶段 {name} 已在上次运行中完成, 跳过[/dim]")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while True:
+                changed = True
+                while changed:
+                    changed = False
+                    for name in order:
+                        if self.status[name] != PENDING:
+                            continue
+                        ready = self._ready(name)
+                        if ready is SKIPPED:
+                            self.status[name] = SKIPPED
+                            console.print(f"[yellow]⚠ 阶段 {name} 的依赖未完成, 跳过[/yellow]")
+                            changed = True
+                        elif ready:
+                            self.status[name] = RUNNING
+                            started = time.monotonic()
+                            future = executor.submit(self._execute, self.stages[name])
+                            running[future] = (name, started)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, started = running.pop(future)
+                    ok, result = future.result()
+                    self.durations[name] = time.monotonic() - started
+                    self.status[name] = DONE if ok else FAILED
+                    if ok:
+                        self.results[name] = result
+                    self._save_checkpoint()
+
+        teardowns = [name for name, stage in self.stages.items() if stage.kind == STAGE_TEARDOWN]
+        if self.state_path and teardowns and all(self.status[name] == DONE for name in teardowns):
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+        return all(s == DONE for s in self.status.values())
+
+    def show(self, title=None):
+        table = Table(title=title or f"任务 {self.name}", show_header=True, header_style="bold cyan")
+        table.add_column("阶段")
+        table.add_column("类型")
+        table.add_column("状态")
+        table.add_column("尝试次数", justify="right")
+        table.add_column("耗时(s)", justify="right")
+        styles = {DONE: "green", FAILED: "red", SKIPPED: "yellow"}
+        for name in self.validate():
+            status = self.status.get(name, PENDING)
+            style = styles.get(status, "dim")
+            duration = self.durations.get(name)
+            table.add_row(name, self.stages[name].kind, f"[{style}]{status}[/{style}]",
+                          str(self.attempts.get(name, 0)), f"{duration:.1f}" if duration is not None else "-")
+        console.print(table)
@@ -0,0 +1,192 @@
+# coding: utf-8
+import argparse
+import glob
+import heapq
+import json
+import os
+import tarfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+DEFAULT_HISTORY_GLOB = "./cache/unitest_xml_*.tar.gz"
+DEFAULT_PLAN_PATH = "./cache/spark_shard_plan.json"
+
+# Spark源码目录 -> sbt 项目名 (未列出的目录使用最后一级目录名)
+SBT_PROJECTS = {
+    "sql/core": "sql",
+    "sql/catalyst": "catalyst",
+    "sql/api": "sql-api",
+    "sql/hive": "hive",
+    "sql/hive-thriftserver": "hive-thriftserver",
+}
+# 这些项目需要额外的sbt profile
+SBT_PROJECT_PROFILES = {
+    "hive": ["-Phive"],
+    "hive-thriftserver": ["-Phive", "-Phive-thriftserver"],
+}
+
+
+def _sbt_project(report_path):
+    """由测试报告路径 (.../spark/sql/core/target/test-reports/TEST-x.xml) 推出sbt项目名"""
+    parts = report_path.replace("\\", "/").split("/")
+    if "target" not in parts:
+        return None
+    module_parts = parts[:parts.index("target")]
+    if "spark" in module_parts:
+        module_parts = module_parts[len(module_parts) - module_parts[::-1].index("spark"):]
+    module_dir = "/".join(module_parts)
+    return SBT_PROJECTS.get(module_dir, module_parts[-1] if module_parts else None)
+
+
+def _parse_report(content, report_path, timings):
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return
+    project = _sbt_project(report_path)
+    for suite in root.iter("testsuite"):
+        name = suite.get("name")
+        try:
+            seconds = float(suite.get("time", ""))
+        except ValueError:
+            continue
+        if not name or not project:
+            continue
+        entry = timings.setdefault(name, {'project': project, 'runs': []})
+        entry['runs'].append(seconds)
+
+
+def read_junit_timings(sources=(DEFAULT_HISTORY_GLOB,)):
+    """读取历史 TEST*.xml 的套件耗时
+
+    sources 可以是 test_spark_base 下载的 unitest_xml_*.tar.gz 归档、解压后的目录或通配符。
+    返回 {套件名: {'project': sbt项目, 'runs': [每次运行的秒数]}}
+    """
+    timings = {}
+    paths = []
+    for source in sources:
+        paths.extend(sorted(glob.glob(source)) if any(c in source for c in "*?[") else [source])
+    for path in paths:
+        if os.path.isdir(path):
+            for report in glob.glob(os.path.join(path, "**", "TEST*.xml"), recursive=True):
+                with open(report, 'rb') as f:
+                    _parse_report(f.read(), report, timings)
+        elif tarfile.is_tarfile(path):
+            with tarfile.open(path, 'r:*') as archive:
+                for member in archive:
+                    base = os.path.basename(member.name)
+                    if member.isfile() and base.startswith("TEST") and base.endswith(".xml"):
+                        _parse_report(archive.extractfile(member).read(), member.name, timings)
+        else:
+            console.print(f"[yellow]⚠ 跳过无法识别的历史数据: {path}[/yellow]")
+    return timings
+
+
+def plan_shards(timings, num_shards, projects=None):
+    """按历史耗时把套件装箱到 num_shards 个分片 (LPT: 耗时从大到小依次放入当前最轻的分片)
+
+    projects 不为空时只规划这些sbt项目的套件。历史数据中没有的套件 (新增或改名) 无法预估耗时,
+    由最轻分片上的兜底 testOnly 运行 (catch_all: 匹配项目的全部套件, 排除已规划的套件),
+    保证覆盖范围不小于按tag划分的固定分片。返回计划字典 (可 JSON 序列化)。
+    """
+    suites = [(sum(entry['runs']) / len(entry['runs']), name, entry['project'])
+              for name, entry in timings.items()
+              if entry['runs'] and (not projects or entry['project'] in projects)]
+    suites.sort(key=lambda s: (-s[0], s[1]))
+    shards = [{'suites': [], 'predicted': 0.0} for _ in range(max(1, num_shards))]
+    heap = [(0.0, i) for i in range(len(shards))]
+    for seconds, name, project in suites:
+        load, i = heapq.heappop(heap)
+        shards[i]['suites'].append([name, project])
+        shards[i]['predicted'] += seconds
+        heapq.heappush(heap, (load + seconds, i))
+    planned = {}
+    for _, name, project in suites:
+        planned.setdefault(project, []).append(name)
+    for project in projects or []:
+        planned.setdefault(project, [])
+    lightest = min(shards, key=lambda shard: shard['predicted'])
+    lightest['catch_all'] = {project: sorted(names) for project, names in sorted(planned.items())}
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'suites': len(suites),
+        'shards': {f"shard-{i}": shard for i, shard in enumerate(shards, 1)
+                   if shard['suites'] or shard.get('catch_all')},
+    }
+
+
+def shard_command(shard):
+    """分片 -> 在 /root/spark 下执行的 sbt testOnly 命令 (每个sbt项目一个 testOnly)
+
+    兜底项目 (catch_all) 追加 'project/testOnly * -已规划套件...', 运行历史数据中没有的套件
+    """
+    by_project = {}
+    for name, project in shard['suites']:
+        by_project.setdefault(project, []).append(name)
+    catch_all = shard.get('catch_all', {})
+    profiles = []
+    for project in list(by_project) + list(catch_all):
+        for profile in SBT_PROJECT_PROFILES.get(project, []):
+            if profile not in profiles:
+                profiles.append(profile)
+    # 用单引号包裹, 命令会被放进 bash -c "..." 执行
+    tasks = [f"'{project}/testOnly {' '.join(names)}'" for project, names in sorted(by_project.items())]
+    tasks += [f"'{project}/testOnly {' '.join(['*'] + ['-' + name for name in excluded])}'"
+              for project, excluded in catch_all.items()]
+    return " ".join(["./build/sbt"] + profiles + tasks)
+
+
+def save_plan(plan, path=DEFAULT_PLAN_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=2)
+    return path
+
+
+def load_plan(path=DEFAULT_PLAN_PATH):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def show_plan(plan):
+    table = Table(title=f"Spark测试分片计划 ({plan['suites']} 个套件)", show_header=True, header_style="bold cyan")
+    table.add_column("分片")
+    table.add_column("套件数", justify="right")
+    table.add_column("sbt项目")
+    table.add_column("预计耗时(min)", justify="right")
+    for name, shard in plan['shards'].items():
+        projects = sorted({project for _, project in shard['suites']})
+        catch_all = f" (+兜底: {','.join(shard['catch_all'])})" if shard.get('catch_all') else ""
+        table.add_row(name, str(len(shard['suites'])), ",".join(projects) + catch_all, f"{shard['predicted'] / 60:.1f}")
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='根据历史JUnit耗时生成Spark测试分片计划',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""示例:
+  python -m hwscheduler.tasks.spark_shards --shards 8 --projects sql hive hive-thriftserver
+""")
+    parser.add_argument('--history', nargs='*', default=[DEFAULT_HISTORY_GLOB],
+                        help='历史测试结果 (unitest_xml_*.tar.gz 归档或目录, 支持通配符)')
+    parser.add_argument('--shards', type=int, required=True, help='分片数 (可用节点数)')
+    parser.add_argument('--projects', nargs='*', default=None, help='只规划这些sbt项目 (默认全部)')
+    parser.add_argument('--output', default=DEFAULT_PLAN_PATH, help='计划输出路径')
+    args = parser.parse_args()
+
+    timings = read_junit_timings(args.history)
+    if not timings:
+        console.print("[red]✗ 没有找到历史测试耗时数据[/red]")
+        exit(1)
+    plan = plan_shards(timings, args.shards, args.projects)
+    show_plan(plan)
+    console.print(f"[green]✓ 分片计划已保存到 {save_plan(plan, args.output)}[/green]")
+
+
+if __name__ == "__main__":
+    main()
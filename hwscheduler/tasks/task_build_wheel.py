@@ -1,9 +1,9 @@
 # coding: utf-8
-from fabric import Connection
 from concurrent.futures import ThreadPoolExecutor
 import os
 import argparse
 import time
+from contextlib import nullcontext
 from concurrent.futures import as_completed
 from datetime import datetime
 from rich.console import Console
@@ -14,10 +14,19 @@ from rich.text import Text
 from rich.syntax import Syntax
 from huaweicloudsdkecs.v2 import *
 from huaweicloudsdkeip.v2 import *
-from hwscheduler.huawei.ecs_manager import ECSInstanceManager, save_eips_to_file
+from hwscheduler.huawei.ecs_manager import ECSInstanceManager, SSHConfigurator, save_eips_to_file
+from hwscheduler.huawei.instance_pool import InstancePool
+from hwscheduler.huawei.eip_pool import EIPPool
+from hwscheduler.huawei.network import ClusterNetwork, NETWORK_PUBLIC, NETWORK_PRIVATE
+from hwscheduler.huawei.bandwidth import BandwidthBooster, remote_size
+from hwscheduler.huawei.connection_pool import ConnectionPool, shared_pool
+from hwscheduler.huawei.transfer import stream_tar, parallel_get
+from hwscheduler.tasks.engine import Job, STAGE_PROVISION, STAGE_BOOTSTRAP, STAGE_REMOTE, STAGE_FETCH, STAGE_TEARDOWN
 
 console = Console()
 
+WHEEL_NAME = "chukonu-1.1.0-py3-none-manylinux2014_aarch64.manylinux_2_17_aarch64.whl"
+
 def print_step_header(title: str, style: str = "bold blue"):
     """打印步骤标题"""
     console.rule(f"[{style}]{title}[/{style}]")
@@ -100,180 +109,189 @@ def execute_command_with_logging(conn, command: str, log_file: str = None, descr
         console.print(f"[red]⚠ Exception during command execution: {str(e)}[/red]")
         console.print_exception()
         return False
-def step_build_wheel(node: str, initial_key_path: str, user: str, task_name: str,script_path) -> bool:
+def build_logs_dir(timestamp: str) -> str:
+    """Log directory on the build node for the run started at timestamp"""
+    return f"/tmp/chukonu_spark_test_logs_{timestamp}"
+
+def set_build_env(conn):
+    conn.config.run.env = {
+        'JAVA_HOME': '/usr/lib/jvm/java-11-openjdk-arm64',
+        'CHUKONU_HOME': '/root/chukonu/install',
+        'LD_LIBRARY_PATH': '/root/chukonu/install/lib:/tmp/cache',
+        'CHUKONU_TEMP': '/tmp',
+        'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+    }
+
+def step_prepare_builder(node: str, initial_key_path: str, user: str, script_path,
+                         pool: ConnectionPool = None) -> bool:
     """
-    Build and install Chukonu on the specified node and collect test results
-    
+    Upload the build script and start the manylinux container
+
+    Independent of the repository checkout, so it can run while step_fetch_repo is fetching.
+    """
+    print_step_header(f"Preparing builder on {node}")
+    pool = pool or shared_pool()
+
+    try:
+        with pool.connection(node, user, initial_key_path) as conn:
+            # Upload build script
+            console.print("\n[bold]Uploading build script...[/bold]")
+            if not execute_command_with_logging(conn,
+                                             "mkdir -p /root",
+                                             description="Ensure /root exists"):
+                return False
+
+            try:
+                conn.put(script_path, "/root/build_wheel.sh")
+                console.print("[green]✓ Build script uploaded successfully[/green]")
+
+                # Verify file exists
+                if not execute_command_with_logging(conn,
+                                                  "test -f /root/build_wheel.sh",
+                                                  description="Verify build script exists"):
+                    return False
+            except Exception as e:
+                console.print(f"[red]✗ Failed to upload build script: {e}[/red]")
+                return False
+
+            prepare_commands = [
+                ("chmod +x /root/build_wheel.sh", "Make build script executable"),
+                ("docker start manylinux", "Start Docker container"),
+            ]
+            for cmd, desc in prepare_commands:
+                if not execute_command_with_logging(conn, cmd, description=desc):
+                    return False
+
+            print_success(f"Builder ready on {node}")
+            return True
+
+    except Exception:
+        console.print_exception()
+        return False
+
+def step_build_wheel(node: str, initial_key_path: str, user: str, timestamp: str,
+                     pool: ConnectionPool = None) -> bool:
+    """
+    Build the wheel on the specified node and collect it into the run's log directory
+
     Args:
         node: Target node IP/hostname
         initial_key_path: Path to SSH key
         user: SSH user
-        task_name: Name of the task for log naming
-        
+        timestamp: Run timestamp naming the log directory (see build_logs_dir)
+        pool: Connection pool shared with the other steps (defaults to the process-wide pool)
+
     Returns:
         bool: True if all steps succeeded, False otherwise
     """
-    conn = None
-    test_logs_dir = ""
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    success = True  # Assume success until proven otherwise
-    
+    test_logs_dir = build_logs_dir(timestamp)
+    pool = pool or shared_pool()
+
     try:
         print_step_header(f"Building wheel on {node}")
-        
+
         # Establish connection
         console.print("\n[bold]Establishing SSH connection...[/bold]")
-        try:
-            conn = Connection(
-                host=node,
-                user=user,
-                connect_kwargs={"key_filename": initial_key_path},
-            )
-            conn.open()
+        with pool.connection(node, user, initial_key_path) as conn:
             console.print(f"[green]✓ Connected to {node} as {user}[/green]")
-        except Exception as e:
-            console.print(f"[red]✗ Connection failed: {str(e)}[/red]")
-            return False
-        
-        # Set environment variables
-        console.print("\n[bold]Setting environment variables...[/bold]")
-        conn.config.run.env = {
-            'JAVA_HOME': '/usr/lib/jvm/java-11-openjdk-arm64',
-            'CHUKONU_HOME': '/root/chukonu/install',
-            'LD_LIBRARY_PATH': '/root/chukonu/install/lib:/tmp/cache',
-            'CHUKONU_TEMP': '/tmp',
-            'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
-        }
-        console.print("[green]✓ Environment variables set[/green]")
-        
-        # Create necessary directories
-        console.print("\n[bold]Creating directories...[/bold]")
-        dir_commands = [
-            ("mkdir -p /tmp/staging /tmp/cache /root/chukonu/build /root/chukonu/install",
-             "Create base directories"),
-            (f"mkdir -p /tmp/chukonu_spark_test_logs_{timestamp}",
-             "Create logs directory")
-        ]
-        
-        for cmd, desc in dir_commands:
-            if not execute_command_with_logging(conn, cmd, description=desc):
-                success = False
-                break
-        
-        if not success:
-            return False
-        
-        test_logs_dir = f"/tmp/chukonu_spark_test_logs_{timestamp}"
-        
-        # Upload build script
-        console.print("\n[bold]Uploading build script...[/bold]")
-        if not execute_command_with_logging(conn, 
-                                         "mkdir -p /root",
-                                         description="Ensure /root exists"):
-            return False
-            
-        try:
-            conn.put(script_path, "/root/build_wheel.sh")
-            console.print("[green]✓ Build script uploaded successfully[/green]")
-            
-            # Verify file exists
+
+            # Set environment variables
+            console.print("\n[bold]Setting environment variables...[/bold]")
+            set_build_env(conn)
+            console.print("[green]✓ Environment variables set[/green]")
+
+            # Create necessary directories
+            console.print("\n[bold]Creating directories...[/bold]")
+            dir_commands = [
+                ("mkdir -p /tmp/staging /tmp/cache /root/chukonu/build /root/chukonu/install",
+                 "Create base directories"),
+                (f"mkdir -p {test_logs_dir}",
+                 "Create logs directory")
+            ]
+
+            for cmd, desc in dir_commands:
+                if not execute_command_with_logging(conn, cmd, description=desc):
+                    return False
+
+            # Build commands with logging
+            console.print("\n[bold]Starting build process...[/bold]")
+            build_cmd = f"docker exec manylinux /bin/bash -c 'bash /io/build_wheel.sh' > {test_logs_dir}/build_wheel.log 2>&1"
+            if not execute_command_with_logging(conn, build_cmd, f"{test_logs_dir}/build_wheel.log",
+                                              description="Build wheel in Docker container"):
+                return False
+
+            # Copy wheel file
+            console.print("\n[bold]Collecting build artifacts...[/bold]")
+            copy_cmd = f"cp /root/chukonu/python/wheelhouse/{WHEEL_NAME} {test_logs_dir}/"
+            if not execute_command_with_logging(conn, copy_cmd,
+                                              description="Copy wheel file"):
+                return False
+
+            # Verify wheel file exists
             if not execute_command_with_logging(conn,
-                                              "test -f /root/build_wheel.sh",
-                                              description="Verify build script exists"):
+                                             f"test -f {test_logs_dir}/{WHEEL_NAME}",
+                                             description="Verify wheel file exists"):
                 return False
-        except Exception as e:
-            console.print(f"[red]✗ Failed to upload build script: {e}[/red]")
-            return False
-        
-        # Build commands with logging
-        console.print("\n[bold]Starting build process...[/bold]")
-        build_commands = [
-            (f"chmod +x /root/build_wheel.sh",
-             "Make build script executable",
-             f"{test_logs_dir}/chmod.log"),
-             
-            (f"docker start manylinux",
-             "Start Docker container",
-             f"{test_logs_dir}/docker_start.log"),
-             
-            (f"docker exec manylinux /bin/bash -c 'bash /io/build_wheel.sh' > {test_logs_dir}/build_wheel.log 2>&1",
-             "Build wheel in Docker container",
-             f"{test_logs_dir}/build_wheel.log")
-        ]
-        
-        for cmd, desc, log_file in build_commands:
-            if not execute_command_with_logging(conn, cmd, log_file, description=desc):
-                success = False
-                break
-        
-        if not success:
-            return False
-        
-        # Copy wheel file
-        console.print("\n[bold]Collecting build artifacts...[/bold]")
-        copy_cmd = f"cp /root/chukonu/python/wheelhouse/chukonu-1.1.0-py3-none-manylinux2014_aarch64.manylinux_2_17_aarch64.whl {test_logs_dir}/"
-        if not execute_command_with_logging(conn, copy_cmd,
-                                          description="Copy wheel file"):
-            return False
-        
-        # Verify wheel file exists
-        if not execute_command_with_logging(conn,
-                                         f"test -f {test_logs_dir}/chukonu-1.1.0-py3-none-manylinux2014_aarch64.manylinux_2_17_aarch64.whl",
-                                         description="Verify wheel file exists"):
-            return False
-        
-        print_success(f"Wheel built successfully on {node}")
-        return True
-        
-    except Exception as e:
+
+            print_success(f"Wheel built successfully on {node}")
+            return True
+
+    except Exception:
         console.print_exception()
         return False
-    finally:
-        try:
-            if conn is not None and conn.is_connected:
-                if test_logs_dir and success:
-                    console.print("\n[bold]Compressing and downloading logs...[/bold]")
-                    
-                    # Compress logs
-                    compress_cmd = f"tar -czf {test_logs_dir}.tar.gz -C {test_logs_dir} ."
-                    if not execute_command_with_logging(conn, compress_cmd,
-                                                      description="Compress logs"):
-                        return False
-                    
-                    # Download logs
-                    local_cache_dir = "./logs"
-                    os.makedirs(local_cache_dir, exist_ok=True)
-                    local_log_path = os.path.join(local_cache_dir, 
-                                                f"chukonu_logs_{task_name}_{timestamp}.tar.gz")
-                    
-                    try:
-                        console.print(f"Downloading logs to {local_log_path}...")
-                        conn.get(f"{test_logs_dir}.tar.gz", local_log_path)
-                        console.print(f"[green]✓ Logs downloaded to: {local_log_path}[/green]")
-                        
-                        # Verify local file
-                        if os.path.exists(local_log_path):
-                            file_size = os.path.getsize(local_log_path) / (1024 * 1024)  # MB
-                            console.print(f"[dim]Log file size: {file_size:.2f} MB[/dim]")
-                        else:
-                            console.print("[yellow]⚠ Warning: Local log file not found after download[/yellow]")
-                    except Exception as e:
-                        console.print(f"[red]✗ Failed to download logs: {e}[/red]")
-        finally:
-            if conn is not None:
-                conn.close()
-                console.print("[dim]SSH connection closed[/dim]")
-
-def step_fetch_repo(node: str, initial_key_path: str, user: str, commit_id: str) -> bool:
+
+def step_download_artifacts(node: str, initial_key_path: str, user: str, task_name: str, timestamp: str,
+                            booster: BandwidthBooster = None, eip_id: str = None,
+                            pool: ConnectionPool = None) -> bool:
+    """
+    Download the run's logs and wheel from the build node
+
+    Args:
+        booster: Optional EIP bandwidth booster used while downloading the log archive and wheel
+        eip_id: EIP bound to the node (no boost when None)
+    """
+    print_step_header(f"Downloading artifacts from {node}")
+    test_logs_dir = build_logs_dir(timestamp)
+    pool = pool or shared_pool()
+
+    local_cache_dir = "./logs"
+    os.makedirs(local_cache_dir, exist_ok=True)
+    local_log_path = os.path.join(local_cache_dir,
+                                f"chukonu_logs_{task_name}_{timestamp}.tar.gz")
+
+    try:
+        with pool.connection(node, user, initial_key_path) as conn:
+            console.print(f"Downloading logs to {local_log_path}...")
+            # tar output is compressed on the node and written locally as it arrives,
+            # so no archive is staged on the node's disk; the wheel is fetched separately
+            # over parallel SFTP channels (resumable and checksummed)
+            wheel = f"{test_logs_dir}/{WHEEL_NAME}"
+            local_wheel_path = os.path.join(local_cache_dir, WHEEL_NAME)
+            with booster.boost(eip_id, remote_size(conn, test_logs_dir)) if booster else nullcontext():
+                stream_tar(conn, test_logs_dir, local_log_path, exclude=["*.whl"])
+                parallel_get(conn, wheel, local_wheel_path)
+            console.print(f"[green]✓ Logs downloaded to: {local_log_path}[/green]")
+            console.print(f"[green]✓ Wheel downloaded to: {local_wheel_path}[/green]")
+
+            # Verify local file
+            if os.path.exists(local_log_path):
+                file_size = os.path.getsize(local_log_path) / (1024 * 1024)  # MB
+                console.print(f"[dim]Log file size: {file_size:.2f} MB[/dim]")
+            else:
+                console.print("[yellow]⚠ Warning: Local log file not found after download[/yellow]")
+            return True
+    except Exception as e:
+        console.print(f"[red]✗ Failed to download logs: {e}[/red]")
+        return False
+
+def step_fetch_repo(node: str, initial_key_path: str, user: str, commit_id: str,
+                    pool: ConnectionPool = None) -> bool:
     """Fetch and checkout the specified commit on the remote node"""
     print_step_header(f"Fetching repository on {node}")
+    pool = pool or shared_pool()
     
     try:
-        with Connection(
-            host=node,
-            user=user,
-            connect_kwargs={"key_filename": initial_key_path},
-        ) as conn:
+        with pool.connection(node, user, initial_key_path) as conn:
             # Print connection info
             console.print(f"\n[bold]Connected to [cyan]{node}[/cyan] as [cyan]{user}[/cyan][/bold]")
             
@@ -317,7 +335,7 @@ def step_fetch_repo(node: str, initial_key_path: str, user: str, commit_id: str)
             print_success(f"Repository updated on {node}")
             return True
             
-    except Exception as e:
+    except Exception:
         console.print_exception()
         return False
 
@@ -328,9 +346,48 @@ def step_create_instances(manager: ECSInstanceManager, args) -> list:
     instance_zone = args.instance_zone if args.instance_zone else f"{args.region}a"
     created_instances_details = []
     
+    if args.use_pool:
+        # Lease pre-booted instances from the warm pool, fall back to fresh instances when it runs dry
+        leased = make_instance_pool(manager, args).lease(
+            args.instance_type, args.ami, instance_zone, args.num_instances,
+            lessee=f"{args.run_number}_{args.task_type}"
+        )
+        if leased:
+            print_success(f"Leased {len(leased)} instances from the warm pool")
+            return leased
+        print_warning("Warm pool cannot satisfy the request, creating fresh instances")
+
+    if args.bulk_create:
+        # Single CreatePostPaidServers request with count=N; EIPs are allocated by the same request
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn(),
+            console=console,
+        ) as progress:
+            task_id = progress.add_task(f"Bulk creating {args.num_instances} instances", total=100)
+            return manager.create_instances_bulk(
+                progress, task_id,
+                count=args.num_instances,
+                vpc_id=args.vpc_id,
+                instance_type=args.instance_type,
+                instance_zone=instance_zone,
+                ami=args.ami,
+                key_pair=args.key_pair,
+                security_group_id=args.security_group_id,
+                subnet_id=args.subnet_id,
+                run_number=args.run_number,
+                task_type=args.task_type,
+                timeout_hours=args.timeout_hours,
+                actor=args.actor,
+                use_ip=args.use_ip,
+                bandwidth_size=args.bandwidth
+            )
+
     if args.use_ip:
         console.print("\n[bold]Allocating EIPs...[/bold]")
-        manager.eip_list = manager.eip_manager.create_eips(
+        manager.eip_list = manager.allocate_eips(
             args.num_instances, 
             f"{args.run_number}_{args.task_type}",
             args.bandwidth
@@ -402,16 +459,42 @@ def step_create_instances(manager: ECSInstanceManager, args) -> list:
 
     return created_instances_details
 
-def step_delete_resources(manager: ECSInstanceManager, instances: list, args):
-    """Delete created resources (instances and EIPs)"""
+def make_instance_pool(manager: ECSInstanceManager, args) -> InstancePool:
+    """Build the warm pool handle shared with the pool daemon through its state file"""
+    return InstancePool(
+        manager, args.vpc_id, args.key_pair, args.security_group_id, args.subnet_id, args.actor,
+        state_path=args.pool_state, key_path=args.key_path
+    )
+
+def step_delete_resources(manager: ECSInstanceManager, instances: list, args, leased_eip_ids: list = None):
+    """Delete created resources (instances and EIPs)
+
+    leased_eip_ids: EIPs leased from the EIP pool for this run; defaults to manager.eip_list,
+    which is empty when the run was resumed in a new process
+    """
     print_step_header("Cleaning up resources", style="bold red")
+    # Drop pooled SSH sessions before their hosts go away
+    shared_pool().close_all()
     
     if not instances:
         print_warning("No instances to delete")
         return False
+
+    pooled = [inst for inst in instances if inst.get('pooled')]
+    if pooled:
+        # Leased instances go back to the pool instead of being destroyed
+        make_instance_pool(manager, args).release(pooled, reuse=args.pool_reuse)
+        instances = [inst for inst in instances if not inst.get('pooled')]
+        if not instances:
+            return True
     
     server_ids_to_delete = [inst['id'] for inst in instances]
     eip_ids_to_delete = [inst['eip_id'] for inst in instances if inst.get('eip_id')]
+    if manager.eip_pool is not None:
+        # Return every leased EIP, including ones whose instance failed to come up
+        if leased_eip_ids is None:
+            leased_eip_ids = [eip['id'] for eip in manager.eip_list]
+        eip_ids_to_delete = list(dict.fromkeys(leased_eip_ids + eip_ids_to_delete))
     
     # Display summary of resources to delete
     summary_table = Table(title="Resources to Delete", show_header=True, header_style="bold yellow")
@@ -443,12 +526,12 @@ def step_delete_resources(manager: ECSInstanceManager, instances: list, args):
     if all_deleted:
         console.print(f"[green]✓ Successfully deleted {len(server_ids_to_delete)} instances[/green]")
     else:
-        console.print(f"[red]✗ Failed to delete some or all instances[/red]")
+        console.print("[red]✗ Failed to delete some or all instances[/red]")
     
-    # Delete EIPs
+    # Delete EIPs (or return them to the EIP pool)
     if eip_ids_to_delete:
         console.print("\n[bold]Deleting associated EIPs...[/bold]")
-        deleted_count = manager.eip_manager.delete_eips(eip_ids_to_delete)
+        deleted_count = manager.release_eips(eip_ids_to_delete)
         console.print(f"[green]✓ Deleted {deleted_count}/{len(eip_ids_to_delete)} EIPs[/green]")
         
         # Clean up files
@@ -520,63 +603,120 @@ def main():
     parser.add_argument('--commit-id', default="", help='Chukonu commit ID')
     parser.add_argument('--bandwidth', type=int, default=5, help='EIP bandwidth (Mbps)')
     parser.add_argument('--script-path', required=True, help='build wheel sh')
+    parser.add_argument('--bulk-create', action='store_true', default=False,
+                        help='Create all instances with a single request (count field)')
+    parser.add_argument('--use-pool', action='store_true', default=False,
+                        help='Lease instances from the warm instance pool')
+    parser.add_argument('--pool-state', default="./cache/instance_pool.json", help='Warm pool state file')
+    parser.add_argument('--pool-no-reuse', dest='pool_reuse', action='store_false', default=True,
+                        help='Delete leased pool instances after the run instead of returning them')
+    parser.add_argument('--eip-pool', action='store_true', default=False,
+                        help='Lease EIPs from the persistent EIP pool and return them after the run (ignored with --bulk-create)')
+    parser.add_argument('--eip-pool-state', default="./cache/eip_pool.json", help='EIP pool state file')
+    parser.add_argument('--network', choices=(NETWORK_PUBLIC, NETWORK_PRIVATE), default=NETWORK_PUBLIC,
+                        help='public: connect over EIPs; private: scheduler runs inside the VPC, no EIPs, connect over private IPs')
+    parser.add_argument('--boost-ceiling', type=int, default=100,
+                        help='Max EIP bandwidth (Mbps) while downloading build logs; no boost when not above --bandwidth')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='Resume an interrupted run from ./cache/<run-number>_<task-type>_job.json, reusing its instances')
     args = parser.parse_args()
 
+    if args.network == NETWORK_PRIVATE and args.use_ip:
+        parser.error("--network private allocates no EIPs and cannot be combined with --use-ip")
+    network = ClusterNetwork(args.network, key_path=args.key_path)
+
     # Initialize manager
     console.print("\n[bold]Initializing ECS Instance Manager...[/bold]")
     manager = ECSInstanceManager(args.ak, args.sk, args.region)
+    if args.eip_pool and args.use_ip and not args.bulk_create:
+        manager.eip_pool = EIPPool(manager.eip_manager, bandwidth=args.bandwidth, state_path=args.eip_pool_state)
     console.print(f"[green]✓ Manager initialized for region {args.region}[/green]")
     
-    # Step 1: Create instances
-    created_instances = step_create_instances(manager, args)
-    if not created_instances:
-        print_error("Test failed: No instances created successfully")
-        if args.use_ip and manager.eip_list:
-            console.print("\n[bold yellow]Cleaning up allocated EIPs...[/bold yellow]")
-            manager.eip_manager.delete_eips([eip['id'] for eip in manager.eip_list])
-        return
+    # The run is a DAG of stages: the builder is prepared while the repository is fetched,
+    # and the teardown stage always runs once everything it depends on has finished
+    run_name = f"{args.run_number}_{args.task_type}"
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    booster = BandwidthBooster(manager.eip_manager, baseline=args.bandwidth, ceiling=args.boost_ceiling)
+    job = Job(run_name, state_path=f"./cache/{run_name}_job.json")
 
-    print_success(f"Total {len(created_instances)}/{args.num_instances} instances created successfully")
-    if len(created_instances) < args.num_instances:
-        print_warning(f"Note: {args.num_instances - len(created_instances)} instances failed to create")
+    def provision(results):
+        # The timestamp names the node's log directory, so it is checkpointed with the instances
+        created_instances = step_create_instances(manager, args)
+        if not created_instances:
+            print_error("Test failed: No instances created successfully")
+            if args.use_ip and manager.eip_list:
+                console.print("\n[bold yellow]Cleaning up allocated EIPs...[/bold yellow]")
+                manager.release_eips([eip['id'] for eip in manager.eip_list])
+            return []
 
-    # Save instance information
-    info_file = manager.save_instances_info(
-        f"{args.run_number}_{args.task_type}",
-        created_instances
-    )
-    console.print(f"[green]✓ Instance information saved to {info_file}[/green]")
-    
-    # Display instance table
-    display_instance_table(created_instances)
-    
-    # Step 2: Fetch repository and build wheel on first instance
-    if created_instances and created_instances[0].get('public_ip'):
-        first_instance = created_instances[0]
-        console.print(f"\n[bold]Using first instance: {first_instance['public_ip']}[/bold]")
-        
-        # Fetch repository
-        if not step_fetch_repo(first_instance['public_ip'], args.key_path, "root", args.commit_id):
-            console.print("[red]Aborting due to repository fetch failure[/red]")
-            step_delete_resources(manager, created_instances, args)
-            return
-        
-        # Build wheel
-        if not step_build_wheel(first_instance['public_ip'], args.key_path, "root", args.task_type,args.script_path):
-            console.print("[red]Aborting due to build failure[/red]")
-            step_delete_resources(manager, created_instances, args)
-            return
-    
-    # Step 3: Clean up resources
-    all_deleted = step_delete_resources(manager, created_instances, args)
-    
-    if all_deleted:
-        if len(created_instances) == args.num_instances:
-            print_success(f"Test completed: {len(created_instances)} instances created and deleted successfully!")
+        print_success(f"Total {len(created_instances)}/{args.num_instances} instances created successfully")
+        if len(created_instances) < args.num_instances:
+            print_warning(f"Note: {args.num_instances - len(created_instances)} instances failed to create")
+
+        # Save instance information
+        info_file = manager.save_instances_info(run_name, created_instances)
+        console.print(f"[green]✓ Instance information saved to {info_file}[/green]")
+
+        # Display instance table
+        display_instance_table(created_instances)
+        # Leased EIPs are checkpointed too, so a resumed teardown can return them to the EIP pool
+        return {'instances': created_instances, 'timestamp': timestamp,
+                'eips': [eip['id'] for eip in manager.eip_list]}
+
+    def build_node(results):
+        first = results['provision']['instances'][0]
+        return SSHConfigurator.node_from_instance(first), first.get('eip_id')
+
+    def wait_ssh(results):
+        first = results['provision']['instances'][0]
+        if not network.reachable(first):
+            print_error("The first instance has no address reachable from this host")
+            return False
+        first_node = build_node(results)[0]
+        console.print(f"\n[bold]Using first instance: {network.ssh_host(first_node)}[/bold]")
+        # Wait for sshd instead of failing on the first connection attempt
+        if not network.wait_for_ssh([first_node])[first_node['hostname']]:
+            console.print("[red]Aborting: SSH on the build instance never became ready[/red]")
+            return False
+        return network.ssh_host(first_node)
+
+    def teardown(results):
+        provisioned = results.get('provision') or {}
+        instances = provisioned.get('instances', [])
+        if not instances:
+            # Nothing was created (EIPs were already released by the provision stage)
+            return True
+        all_deleted = step_delete_resources(manager, instances, args, provisioned.get('eips'))
+        if all_deleted:
+            if len(instances) == args.num_instances:
+                print_success(f"Test completed: {len(instances)} instances created and deleted successfully!")
+            else:
+                print_success(f"Test partially completed: {len(instances)}/{args.num_instances} instances created and deleted successfully!")
         else:
-            print_success(f"Test partially completed: {len(created_instances)}/{args.num_instances} instances created and deleted successfully!")
-    else:
-        print_error(f"Test failed: Some or all instances (total {len(created_instances)} attempted) failed to delete")
+            print_error(f"Test failed: Some or all instances (total {len(instances)} attempted) failed to delete")
+        return all_deleted
+
+    job.add('provision', STAGE_PROVISION, provision)
+    job.add('wait_ssh', STAGE_BOOTSTRAP, wait_ssh, needs=['provision'], checkpoint=False)
+    job.add('fetch_repo', STAGE_REMOTE,
+            lambda results: step_fetch_repo(results['wait_ssh'], args.key_path, "root", args.commit_id),
+            needs=['wait_ssh'], retries=2)
+    job.add('prepare_builder', STAGE_REMOTE,
+            lambda results: step_prepare_builder(results['wait_ssh'], args.key_path, "root", args.script_path),
+            needs=['wait_ssh'], retries=1)
+    job.add('build_wheel', STAGE_REMOTE,
+            lambda results: step_build_wheel(results['wait_ssh'], args.key_path, "root",
+                                             results['provision']['timestamp']),
+            needs=['fetch_repo', 'prepare_builder'])
+    job.add('download_artifacts', STAGE_FETCH,
+            lambda results: step_download_artifacts(results['wait_ssh'], args.key_path, "root", args.task_type,
+                                                    results['provision']['timestamp'], booster,
+                                                    build_node(results)[1]),
+            needs=['build_wheel'], retries=2)
+    job.add('teardown', STAGE_TEARDOWN, teardown, needs=['download_artifacts'], always=True)
+
+    job.run(resume=args.resume)
+    job.show()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,24 +1,66 @@
 # coding: utf-8
 # 在文件顶部添加新的import
-from fabric import Connection
 from concurrent.futures import ThreadPoolExecutor
 import os
 
 import argparse
+import json
 import os
+import re
+import tarfile
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 from rich.table import Table
 from huaweicloudsdkecs.v2 import *
 from huaweicloudsdkeip.v2 import *
-from hwscheduler.huawei.ecs_manager import ECSInstanceManager,save_eips_to_file
+from hwscheduler.huawei.ecs_manager import ECSInstanceManager,SSHConfigurator,save_eips_to_file
+from hwscheduler.huawei.instance_pool import InstancePool
+from hwscheduler.huawei.eip_pool import EIPPool
+from hwscheduler.huawei.network import ClusterNetwork, NETWORK_MODES, NETWORK_BASTION, NETWORK_PRIVATE
+from hwscheduler.huawei.bandwidth import BandwidthBooster, remote_size
+from hwscheduler.huawei.transfer import stream_tar, remote_find_size, remote_list_size, parallel_put
+from hwscheduler.tasks.spark_shards import load_plan, shard_command
+from hwscheduler.huawei.cluster import ClusterGroup
+from hwscheduler.huawei.broadcast import broadcast, BROADCAST_MODES
+from hwscheduler.huawei.connection_pool import shared_pool
+from hwscheduler.tasks.engine import Job, STAGE_PROVISION, STAGE_BOOTSTRAP, STAGE_REMOTE, STAGE_FETCH, STAGE_TEARDOWN
 console = Console()
 
+# 测试结果JSON中的计数字段
+TEST_COUNT_FIELDS = ("succeeded", "failed", "canceled", "ignored", "pending")
+
+# Spark 和 PySpark 的构建命令 (命令, 日志文件)
+SPARK_BUILD_COMMANDS = [
+    # Build Spark
+    ('cd /root/spark && ~/.local/share/coursier/bin/sbt package', 'sbt_build.log'),
+
+    # Build and install PySpark
+    ('cd /root/spark/python && python3 setup.py sdist', 'pyspark_build.log'),
+    ('cd /root/spark/python && pip install dist/pyspark-3.4.4.dev0.tar.gz', 'pyspark_install.log')
+]
+
+# 构建产物包的内容 (相对 /, 以NUL分隔): Spark和Chukonu scala的target目录、Chukonu安装目录、
+# pyspark sdist 以及 sbt/ivy/coursier 缓存
+SPARK_BUNDLE_LIST = (
+    "{ find root/spark root/chukonu/scala -type d -name target -prune -print0 2>/dev/null;"
+    " find root/spark/python/dist -maxdepth 1 -name 'pyspark-*.tar.gz' -print0 2>/dev/null;"
+    " for d in root/chukonu/install root/.ivy2 root/.sbt root/.cache/coursier;"
+    " do [ -e $d ] && printf '%s\\0' $d; done; true; }"
+)
+SPARK_BUNDLE_REMOTE_PATH = "/tmp/spark_bundle.tar.gz"
+
+# 需要收集的单元测试结果文件 (find 表达式)
+UNITEST_RESULT_FILTER = r"\( -name 'TEST*.xml' -o -name 'hs_err*.log' \)"
+
 # 首先定义不同任务对应的命令模板
-def get_test_command(task_name):
+def get_test_command(task_name, shard_plan=None):
+    # 分片计划 (spark_shards.plan_shards) 中的分片按历史耗时均衡, 优先于按tag划分的固定分片
+    if shard_plan and task_name in shard_plan['shards']:
+        return shard_command(shard_plan['shards'][task_name])
     if task_name == "hive-1":
         return './dev/run-tests --parallelism 1 --modules hive --included-tags "org.apache.spark.tags.HivePartOneTest,org.apache.spark.tags.HivePartTwoTest"'
     elif task_name == "hive-2":
@@ -68,16 +110,18 @@ def get_test_command(task_name):
         return f'./dev/run-tests --parallelism 1 --modules {task_name}'
 
 
-def test_spark_base(node, initial_key_path, user, task_name):
+def test_spark_base(node, initial_key_path, user, task_name, gateway=None, booster=None, eip_id=None,
+                    shard_plan=None, prebuilt=False):
     """
     Build and install Chukonu on the specified node and collect test results
+    (gateway: optional bastion Connection used when node is a private IP;
+     booster/eip_id: raise the node's EIP bandwidth while downloading archives;
+     shard_plan: optional plan from spark_shards, task_name may then name one of its shards;
+     prebuilt: skip the Spark/PySpark build, the node already has the bundle from install_spark_bundle)
+    Returns a dict with the downloaded json/xml/logs paths, or False on failure
     """
     try:
-        with Connection(
-            host=node,
-            user=user,
-            connect_kwargs={"key_filename": initial_key_path},
-        ) as conn:
+        with shared_pool().connection(node, user, initial_key_path, gateway) as conn:
             # Set environment variables
             conn.config.run.env = {
                 'JAVA_HOME': '/usr/lib/jvm/java-11-openjdk-arm64',
@@ -95,14 +139,8 @@ def test_spark_base(node, initial_key_path, user, task_name):
             test_logs_dir = f"/tmp/chukonu_spark_test_logs_{timestamp}"
             conn.run(f"mkdir -p {test_logs_dir}")
             
-            commands = [
-                # Build Spark
-                ('cd /root/spark && ~/.local/share/coursier/bin/sbt package', 'sbt_build.log'),
-                
-                # Build and install PySpark
-                ('cd /root/spark/python && python3 setup.py sdist', 'pyspark_build.log'),
-                ('cd /root/spark/python && pip install dist/pyspark-3.4.4.dev0.tar.gz', 'pyspark_install.log')
-            ]
+            # 已经装好构建产物包 (install_spark_bundle) 的节点不再重复编译
+            commands = [] if prebuilt else SPARK_BUILD_COMMANDS
             
             for cmd, logfile in commands:
                 print(f"Executing on {node}: {cmd}")
@@ -117,15 +155,19 @@ def test_spark_base(node, initial_key_path, user, task_name):
             ctest_log = f"{test_logs_dir}/{task_name}.log"
             print(f"Running C++ tests on {node} and saving logs to {ctest_log}")
             conn.run(f"touch {ctest_log}")
+            # 只收集本次测试产生的结果文件 (同一节点依次运行多个分片时, 前面分片的XML仍留在 /root/spark 下)
+            started_marker = f"{test_logs_dir}/.tests_started"
+            conn.run(f"touch {started_marker}")
+            result_filter = f"-newer {started_marker} {UNITEST_RESULT_FILTER}"
 
-            test_command = get_test_command(task_name)
+            test_command = get_test_command(task_name, shard_plan)
             result = conn.run(
                 f'cd /root/spark && bash -c "{test_command} > {ctest_log} 2>&1"',
                 warn=True
             )
             
             if not result.ok:
-                print(f"Warning: Command failed on {node}: {cmd}")
+                print(f"Warning: Command failed on {node}: {test_command}")
 
             # 分析日志文件并生成JSON
             json_log = f"{test_logs_dir}/{task_name}.json"
@@ -149,30 +191,6 @@ def test_spark_base(node, initial_key_path, user, task_name):
             
             conn.run(awk_script)
             
-            # 收集测试结果文件 (TEST*.xml 和 hs_err*.log)
-            print("\nCollecting test result files...")
-            unitest_xml_dir = f"{test_logs_dir}/unitest_xml"
-            conn.run(f"mkdir -p {unitest_xml_dir}")
-            
-            # 使用find命令查找并复制测试结果文件
-            collect_cmd = f"""
-            TMP_DIR=$(mktemp -d)
-            sudo find /root/spark -type f \( \
-              -name 'TEST*.xml' \
-              -o -name 'hs_err*.log' \
-            \) -exec cp --parents {{}} "$TMP_DIR/" \;
-            
-            # 如果有文件被找到，打包它们
-            if [ "$(ls -A $TMP_DIR)" ]; then
-                tar -czf {unitest_xml_dir}/unitest_xml.tar.gz -C $TMP_DIR .
-            else
-                echo "No test result files found" > {unitest_xml_dir}/no_files_found.txt
-            fi
-            rm -rf $TMP_DIR
-            """
-            
-            conn.run(collect_cmd)
-            
             # 下载文件到本地
             local_cache_dir = "./cache"
             os.makedirs(local_cache_dir, exist_ok=True)
@@ -182,41 +200,44 @@ def test_spark_base(node, initial_key_path, user, task_name):
             conn.get(json_log, local_json_path)
             print(f"Downloaded test results JSON to: {local_json_path}")
             
-            # 下载单元测试XML和错误日志
-            local_xml_path = os.path.join(local_cache_dir, f"unitest_xml_{task_name}_{timestamp}.tar.gz")
-            conn.get(f"{unitest_xml_dir}/unitest_xml.tar.gz", local_xml_path)
-            print(f"Downloaded unit test XML files to: {local_xml_path}")
+            # 测试结果文件 (TEST*.xml 和 hs_err*.log) 和日志目录在远端边打包边下载, 不在节点上落盘
+            print("\nCollecting test result files...")
+            xml_size = remote_find_size(conn, "/", ["root/spark"], result_filter)
+            # 大文件下载期间临时提高EIP带宽 (按未压缩大小估算)
+            boost = booster.boost(eip_id, xml_size + remote_size(conn, test_logs_dir)) if booster else nullcontext()
+            local_xml_path = None
+            with boost:
+                # 下载单元测试XML和错误日志
+                if xml_size:
+                    local_xml_path = os.path.join(local_cache_dir, f"unitest_xml_{task_name}_{timestamp}.tar.gz")
+                    stream_tar(conn, "/", local_xml_path, ["root/spark"], f"-type f {result_filter}")
+                    print(f"Downloaded unit test XML files to: {local_xml_path}")
+                else:
+                    print("No test result files found")
+
+                # Download the complete log archive
+                local_log_path = os.path.join(local_cache_dir, f"chukonu_test_logs_{task_name}_{timestamp}.tar.gz")
+                stream_tar(conn, test_logs_dir, local_log_path)
+                print(f"Downloaded complete test logs to: {local_log_path}")
             
             # 读取并打印JSON内容
             json_result = conn.run(f"cat {json_log}", hide=True)
             print("\nTest Results JSON:")
             print(json_result.stdout)
             
-            # Compress all test logs
-            conn.run(f"tar -czf {test_logs_dir}.tar.gz -C {test_logs_dir} .")
-            print(f"All test logs archived to: {test_logs_dir}.tar.gz")
-            
-            # Download the complete log archive
-            local_log_path = os.path.join(local_cache_dir, f"chukonu_test_logs_{task_name}_{timestamp}.tar.gz")
-            conn.get(f"{test_logs_dir}.tar.gz", local_log_path)
-            print(f"Downloaded complete test logs to: {local_log_path}")
-            
-            return True
+            return {'task_name': task_name, 'node': node, 'json': local_json_path,
+                    'xml': local_xml_path, 'logs': local_log_path}
             
     except Exception as e:
         print(f"Error configuring master node in test_spark_base: {node}: {e}")
         return False
 
-def test_build_chukonu(node, initial_key_path, user):
+def test_build_chukonu(node, initial_key_path, user, gateway=None):
     """
     Build and install Chukonu on the specified node
     """
     try:
-        with Connection(
-            host=node,
-            user=user,
-            connect_kwargs={"key_filename": initial_key_path},
-        ) as conn:
+        with shared_pool().connection(node, user, initial_key_path, gateway) as conn:
             # 设置环境变量（对所有后续命令生效）
             conn.config.run.env = {
                 'JAVA_HOME': '/usr/lib/jvm/java-11-openjdk-arm64',
@@ -258,6 +279,391 @@ def test_build_chukonu(node, initial_key_path, user):
         print(f"Error configuring master node in test_build_chukonu: {node}: {e}")
         return False
 
+def build_spark_bundle(node, initial_key_path, user, local_path, gateway=None, booster=None, eip_id=None):
+    """
+    在构建节点上编译 Spark/PySpark (Chukonu 需已由 test_build_chukonu 构建), 然后把构建产物
+    (SPARK_BUNDLE_LIST) 直接流式打包下载到本地 local_path, 供 install_spark_bundle 分发到测试节点;
+    local_path 为空时打包到构建节点的 SPARK_BUNDLE_REMOTE_PATH, 由节点之间中继分发 (broadcast)
+    """
+    try:
+        with shared_pool().connection(node, user, initial_key_path, gateway) as conn:
+            conn.config.run.env = {
+                'JAVA_HOME': '/usr/lib/jvm/java-11-openjdk-arm64',
+                'CHUKONU_HOME': '/root/chukonu/install',
+                'LD_LIBRARY_PATH': '/root/chukonu/install/lib:/tmp/cache',
+                'CHUKONU_TEMP': '/tmp',
+                'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
+            }
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            build_logs_dir = f"/tmp/spark_bundle_build_logs_{timestamp}"
+            conn.run(f"mkdir -p {build_logs_dir}")
+            for cmd, logfile in SPARK_BUILD_COMMANDS:
+                print(f"Executing on {node}: {cmd}")
+                log_path = f"{build_logs_dir}/{logfile}"
+                result = conn.run(f"{cmd} > {log_path} 2>&1", warn=True)
+                if not result.ok:
+                    print(f"Command failed on {node}: {cmd}")
+                    print(f"Check log file at {log_path}")
+                    return False
+
+            size = remote_list_size(conn, "/", SPARK_BUNDLE_LIST)
+            print(f"Packing build outputs on {node} ({size / 1024 / 1024:.1f} MB uncompressed)...")
+            if not local_path:
+                conn.run(f"cd / && {SPARK_BUNDLE_LIST} | tar -czf {SPARK_BUNDLE_REMOTE_PATH} --null -T -")
+                return True
+            with booster.boost(eip_id, size) if booster else nullcontext():
+                stream_tar(conn, "/", local_path, list_command=SPARK_BUNDLE_LIST)
+            print(f"Downloaded build bundle to: {local_path} ({os.path.getsize(local_path) / 1024 / 1024:.1f} MB)")
+            return True
+
+    except Exception as e:
+        print(f"Error building bundle in build_spark_bundle: {node}: {e}")
+        return False
+
+def install_spark_bundle(node, initial_key_path, user, local_path, gateway=None, booster=None, eip_id=None):
+    """
+    把 build_spark_bundle 生成的构建产物包上传到测试节点并解压到 /, 然后安装 pyspark
+    (local_path 为空时产物包已经由 broadcast 分发到节点上)
+    """
+    try:
+        with shared_pool().connection(node, user, initial_key_path, gateway) as conn:
+            if local_path:
+                with booster.boost(eip_id, os.path.getsize(local_path)) if booster else nullcontext():
+                    parallel_put(conn, local_path, SPARK_BUNDLE_REMOTE_PATH)
+            commands = [
+                f"tar -xzf {SPARK_BUNDLE_REMOTE_PATH} -C / && rm -f {SPARK_BUNDLE_REMOTE_PATH}",
+                SPARK_BUILD_COMMANDS[-1][0],
+            ]
+            for cmd in commands:
+                print(f"Executing on {node}: {cmd}")
+                result = conn.run(cmd, warn=True, hide=True)
+                if not result.ok:
+                    print(f"Command failed on {node}: {cmd}\n{result.stderr}")
+                    return False
+            return True
+
+    except Exception as e:
+        print(f"Error installing bundle in install_spark_bundle: {node}: {e}")
+        return False
+
+def run_shards(instances, shards, network, initial_key_path, booster, shard_plan=None, bundle_path=None,
+               broadcast_mode=None):
+    """
+    在多个节点上并发运行不同的分片 (节点少于分片时, 每个节点依次运行分到的多个分片)
+    bundle_path 不为空时只在第一个节点上编译一次, 构建产物包下载到 bundle_path 后安装到其余节点,
+    各节点跳过编译直接测试 (构建失败时退回到每个节点各自编译)。
+    broadcast_mode (tree/chain) 不为空时同样只编译一次, 但产物包不经过调度机, 而是从第一个节点
+    经私网中继分发 (需要已配置集群免密登录)。
+    返回 分片名 -> test_spark_base 的结果
+    """
+    instances = sorted(instances, key=lambda x: x['index'])[:len(shards)]
+    nodes = [SSHConfigurator.node_from_instance(inst) for inst in instances]
+    ready = network.wait_for_ssh(nodes)
+    assignments = {i: shards[i::len(nodes)] for i in range(len(nodes))}
+    table = Table(title="分片分配", show_header=True, header_style="bold cyan")
+    table.add_column("节点")
+    table.add_column("分片")
+    for i, node in enumerate(nodes):
+        table.add_row(node['hostname'], ", ".join(assignments[i]))
+    console.print(table)
+
+    def connect_args(i):
+        node = nodes[i]
+        gateway = None if network.is_bastion(node) else network.gateway()
+        return network.ssh_host(node), gateway
+
+    prebuilt = False
+    received = {}
+    if (bundle_path or broadcast_mode) and ready[nodes[0]['hostname']]:
+        host, gateway = connect_args(0)
+        console.rule(f"[bold blue]在 {nodes[0]['hostname']} 上构建一次, 分发到 {len(nodes) - 1} 个测试节点[/bold blue]")
+        prebuilt = (test_build_chukonu(host, initial_key_path, "root", gateway)
+                    and build_spark_bundle(host, initial_key_path, "root", None if broadcast_mode else bundle_path,
+                                           gateway, booster, instances[0].get('eip_id')))
+        if not prebuilt:
+            console.print("[yellow]⚠ 构建产物包生成失败, 各节点分别编译[/yellow]")
+        elif broadcast_mode:
+            group = ClusterGroup([node for node in nodes if ready[node['hostname']]], "root", initial_key_path, network)
+            received = broadcast(group, SPARK_BUNDLE_REMOTE_PATH, mode=broadcast_mode)
+
+    def run_node(i):
+        node = nodes[i]
+        if not ready[node['hostname']]:
+            console.print(f"[red]✗ {node['hostname']} SSH未就绪, 跳过分片 {', '.join(assignments[i])}[/red]")
+            return {shard: False for shard in assignments[i]}
+        host, gateway = connect_args(i)
+        eip_id = instances[i].get('eip_id')
+        if not prebuilt:
+            test_build_chukonu(host, initial_key_path, "root", gateway)
+        elif i > 0:
+            if broadcast_mode and not received.get(node['hostname']):
+                console.print(f"[red]✗ {node['hostname']} 没有收到构建产物包, 跳过分片 {', '.join(assignments[i])}[/red]")
+                return {shard: False for shard in assignments[i]}
+            local_path = None if broadcast_mode else bundle_path
+            if not install_spark_bundle(host, initial_key_path, "root", local_path, gateway, booster, eip_id):
+                return {shard: False for shard in assignments[i]}
+        # 同一节点上的多个分片只编译一次: 第一个成功的分片之后其余分片跳过编译
+        built = prebuilt
+        results = {}
+        for shard in assignments[i]:
+            results[shard] = test_spark_base(host, initial_key_path, "root", shard, gateway, booster,
+                                             eip_id, shard_plan, built)
+            built = built or bool(results[shard])
+        return results
+
+    reports = {}
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        for result in executor.map(run_node, range(len(nodes))):
+            reports.update(result)
+    return reports
+
+
+def read_test_counts(json_path):
+    """读取 test_spark_base 生成的结果JSON中的测试计数
+
+    多个sbt项目的分片会输出多段 Tests: 统计, 生成的文件不一定是合法JSON, 这里逐项累加。
+    日志中没有任何 Tests: 统计 (测试命令在运行测试前就已失败) 时返回 None。
+    """
+    counts = dict.fromkeys(TEST_COUNT_FIELDS, 0)
+    with open(json_path, 'r') as f:
+        content = f.read()
+    parsed = False
+    for field in TEST_COUNT_FIELDS:
+        for value in re.findall(rf'"{field}": "(\d+)"', content):
+            counts[field] += int(value)
+            parsed = True
+    return counts if parsed else None
+
+
+def merge_shard_reports(reports, run_name, local_cache_dir="./cache"):
+    """合并各分片的结果: 测试计数汇总为一个JSON, 各分片的XML归档按分片名加前缀合并为一个归档"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    merged = {'run': run_name, 'shards': {}, 'total': dict.fromkeys(TEST_COUNT_FIELDS, 0)}
+    xml_path = os.path.join(local_cache_dir, f"unitest_xml_{run_name}_merged_{timestamp}.tar.gz")
+    with tarfile.open(xml_path, 'w:gz') as merged_xml:
+        for shard, report in sorted(reports.items()):
+            if not report:
+                merged['shards'][shard] = {'ok': False}
+                continue
+            counts = read_test_counts(report['json'])
+            if counts is None:
+                console.print(f"[red]✗ 分片 {shard} 没有测试统计, 测试命令可能在运行测试前失败[/red]")
+                merged['shards'][shard] = {'ok': False, 'node': report['node']}
+            else:
+                merged['shards'][shard] = dict(counts, ok=True, node=report['node'])
+                for field in TEST_COUNT_FIELDS:
+                    merged['total'][field] += counts[field]
+            if report['xml']:
+                with tarfile.open(report['xml'], 'r:gz') as shard_xml:
+                    for member in shard_xml:
+                        data = shard_xml.extractfile(member) if member.isfile() else None
+                        member.name = f"{shard}/{member.name}"
+                        merged_xml.addfile(member, data)
+    json_path = os.path.join(local_cache_dir, f"test_results_{run_name}_merged_{timestamp}.json")
+    with open(json_path, 'w') as f:
+        json.dump(merged, f, indent=2)
+
+    table = Table(title=f"分片测试结果 ({run_name})", show_header=True, header_style="bold cyan")
+    table.add_column("分片")
+    table.add_column("节点")
+    for field in TEST_COUNT_FIELDS:
+        table.add_column(field, justify="right")
+    for shard, result in merged['shards'].items():
+        if not result['ok']:
+            table.add_row(shard, result.get('node', "-"), *(["[red]✗[/red]"] + ["-"] * (len(TEST_COUNT_FIELDS) - 1)))
+            continue
+        table.add_row(shard, result['node'], *(str(result[field]) for field in TEST_COUNT_FIELDS))
+    table.add_row("[bold]合计[/bold]", "", *(str(merged['total'][field]) for field in TEST_COUNT_FIELDS))
+    console.print(table)
+    console.print(f"[green]✓ 合并结果: {json_path}, {xml_path}[/green]")
+    return merged
+
+
+def create_test_instances(manager, network, pool, args, instance_zone):
+    """
+    从预热实例池借用 (pool 不为空时) 或新建本次测试的实例, 新建时按网络模式先申请EIP
+    返回实例详情列表, 失败时返回空列表 (已申请的EIP由调用方清理)
+    """
+    created_instances_details = []
+    if pool is not None:
+        created_instances_details = pool.lease(args.instance_type, args.ami, instance_zone, args.num_instances,
+                                               lessee=f"{args.run_number}_{args.task_type}")
+    
+    if created_instances_details:
+        console.print(f"[green]✓ 已从实例池借用 {len(created_instances_details)} 个实例[/green]")
+    elif args.use_ip and not args.bulk_create and network.eip_count(args.num_instances):
+        eip_count = network.eip_count(args.num_instances)
+        console.print(f"[cyan]正在为 {eip_count} 个实例申请EIP...[/cyan]")
+        manager.eip_list = manager.allocate_eips(  # 存储到实例变量
+            eip_count,
+            f"{args.run_number}_{args.task_type}",
+            args.bandwidth
+        )
+        
+        if not manager.eip_list or len(manager.eip_list) < eip_count:
+            console.print("[red]✗ EIP申请失败或数量不足，无法继续创建实例[/red]")
+            return []
+        save_eips_to_file(f"{args.run_number}_{args.task_type}", manager.eip_list)
+        
+        # 显示EIP信息
+        eip_table = Table(title="已申请EIP列表", show_header=True, header_style="bold cyan")
+        eip_table.add_column("序号", style="dim", justify="right")
+        eip_table.add_column("EIP ID")
+        eip_table.add_column("IP地址")
+        for i, eip in enumerate(manager.eip_list, 1):
+            eip_table.add_row(str(i), eip['id'], eip['ip'])
+        console.print(eip_table)
+
+    if args.bulk_create and not created_instances_details:
+        # 单次请求批量创建, 不受线程池并发数限制
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TimeElapsedColumn(),
+            console=console,
+        ) as creation_progress:
+            task_id = creation_progress.add_task(f"批量创建 {args.num_instances} 个实例...", total=100)
+            created_instances_details = manager.create_instances_bulk(
+                creation_progress, task_id,
+                count=args.num_instances,
+                vpc_id=args.vpc_id,
+                instance_type=args.instance_type,
+                instance_zone=instance_zone,
+                ami=args.ami,
+                key_pair=args.key_pair,
+                security_group_id=args.security_group_id,
+                subnet_id=args.subnet_id,
+                run_number=args.run_number,
+                task_type=args.task_type,
+                timeout_hours=args.timeout_hours,
+                actor=args.actor,
+                use_ip=args.use_ip,
+                bandwidth_size=args.bandwidth
+            )
+    elif not created_instances_details:
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[progress.description]{task.description}"),
+            BarColumn(),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TimeElapsedColumn(),
+            console=console,
+        ) as creation_progress:
+            with ThreadPoolExecutor(max_workers=min(args.num_instances, 10)) as executor:
+                futures = {}
+                for i in range(args.num_instances):
+                    task_id = creation_progress.add_task(f"Instance {i}...", total=100, start=False, visible=True)
+                    creation_progress.update(task_id, completed=0)
+
+                    # 如果有EIP列表，获取对应的EIP ID
+                    eip_id = manager.eip_list[i]['id'] if args.use_ip and i < len(manager.eip_list) else None
+                
+                    future = executor.submit(
+                        manager.create_instance,
+                        creation_progress, task_id, 
+                        vpc_id=args.vpc_id,
+                        instance_index=i,
+                        instance_type=args.instance_type,
+                        instance_zone=instance_zone,
+                        ami=args.ami,
+                        key_pair=args.key_pair,
+                        security_group_id=args.security_group_id,
+                        subnet_id=args.subnet_id,
+                        run_number=args.run_number,
+                        task_type=args.task_type,
+                        timeout_hours=args.timeout_hours,
+                        actor=args.actor,
+                        eip_id=eip_id
+                    )
+                    futures[future] = (i, task_id) 
+
+                for future in as_completed(futures):
+                    instance_index, task_id = futures[future]
+                    try:
+                        instance_detail = future.result()
+                        if instance_detail:
+                            created_instances_details.append(instance_detail)
+                        else:
+                            creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} failed.", completed=100, visible=False)
+                    except Exception as e:
+                        creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} error: {e}", completed=100, visible=False)
+                        console.print(f"[red]Error processing instance {instance_index}: {e}[/red]")
+    return created_instances_details
+
+def show_test_instances(instances):
+    """打印已创建实例列表"""
+    table = Table(title="已创建实例列表 (等待删除)", show_header=True, header_style="bold green")
+    table.add_column("序号", style="dim", justify="right")
+    table.add_column("名称")
+    table.add_column("ID")
+    table.add_column("私有IP")
+    table.add_column("公网IP")
+    table.add_column("状态")
+    for inst in sorted(instances, key=lambda x: x['index']):
+        table.add_row(
+            str(inst['index']),
+            inst['name'],
+            inst['id'],
+            inst.get('private_ip', 'N/A'),
+            inst.get('public_ip', 'N/A'),
+            inst['status']
+        )
+    console.print(table)
+
+def delete_test_resources(manager, network, instances, pool, args, leased_eip_ids=None):
+    """
+    测试结束后的清理: 借用的实例归还到实例池, 其余实例删除, EIP删除或归还到EIP池
+    leased_eip_ids 为本次从EIP池借用的EIP (默认取 manager.eip_list, 续跑时为空)
+    """
+    # 实例删除前关闭池中的SSH连接
+    shared_pool().close_all()
+    network.close()
+
+    pooled = [inst for inst in instances if inst.get('pooled')] if pool is not None else []
+    if pooled:
+        # 借用的实例归还到池中, 不删除
+        pool.release(pooled)
+    others = [inst for inst in instances if inst not in pooled]
+    server_ids_to_delete = [inst['id'] for inst in others]
+    eip_ids_to_delete = [inst['eip_id'] for inst in others if inst.get('eip_id')]
+    if manager.eip_pool is not None:
+        # 借用的EIP全部归还, 包括创建失败的实例未用上的
+        if leased_eip_ids is None:
+            leased_eip_ids = [eip['id'] for eip in manager.eip_list]
+        eip_ids_to_delete = list(dict.fromkeys(leased_eip_ids + eip_ids_to_delete))
+    
+    console.rule("[bold red]自动删除模式[/bold red]")
+    wait_seconds = 10
+    console.print(f"[yellow]等待 {wait_seconds} 秒后自动删除 {len(server_ids_to_delete)} 个已创建的实例...[/yellow]")
+    for i in range(wait_seconds, 0, -1):
+        print(f"\r[yellow]开始删除倒计时: {i}s...[/yellow]", end="")
+        time.sleep(1)
+    print("\r" + " " * 30 + "\r", end="") 
+
+    # 先删除实例
+    all_deleted_successfully = manager.delete_instances(server_ids_to_delete)
+    
+    # 然后删除EIP
+    if eip_ids_to_delete:
+        console.print("[cyan]开始清理关联的EIP...[/cyan]")
+        manager.release_eips(eip_ids_to_delete)
+        
+        # 清理文件
+        info_path = f"./cache/{args.run_number}_{args.task_type}_ip_info.txt"
+        if os.path.exists(info_path):
+            os.remove(info_path)
+            console.print(f"[dim]已清理文件: {info_path}[/dim]")
+
+    if all_deleted_successfully:
+        if len(server_ids_to_delete) == args.num_instances :
+             console.print(f"[bold green]✓ 测试完成: {len(server_ids_to_delete)} 个实例全部创建并成功删除![/bold green]")
+        else:
+             console.print(f"[bold green]✓ 测试部分完成: {len(server_ids_to_delete)}/{args.num_instances} 个实例创建并成功删除! (其余实例创建失败)[/bold green]")
+    else:
+        console.print(f"[bold red]✗ 测试失败: 部分或全部实例 (共 {len(server_ids_to_delete)} 个尝试删除) 删除失败.[/bold red]")
+    return all_deleted_successfully
+
 def main():
     parser = argparse.ArgumentParser(
         description='华为云ECS实例创建后自动删除工具 (支持多实例)',
@@ -272,7 +678,8 @@ def main():
     parser.add_argument('--sk', required=True, help='华为云Secret Key')
     parser.add_argument('--region', required=True, help='区域(如: cn-north-4)')
     parser.add_argument('--vpc-id', required=True, help='VPC ID')
-    parser.add_argument('--num-instances', type=int, default=1, help='要创建的实例数量')
+    parser.add_argument('--num-instances', type=int, default=None,
+                        help='要创建的实例数量 (默认1; --fan-out 时默认每个分片一个节点)')
     parser.add_argument('--instance-type', required=True, help='实例类型 (如: s6.large.2)')
     parser.add_argument('--instance-zone', help='可用区(如: cn-north-4a, 默认: <region>a)', default=None)
     parser.add_argument('--ami', help='镜像ID (如: CentOS 7.x)', default="04b5ea14-da35-47de-8467-66808dd62007")
@@ -285,180 +692,142 @@ def main():
     parser.add_argument('--actor', required=True, help='操作者')
     parser.add_argument('--use-ip', action='store_true', help='是否分配公网IP (默认为不分配)', default=False)
     parser.add_argument('--bandwidth', type=int, default=5, help='EIP带宽大小(Mbps)')
+    parser.add_argument('--bulk-create', action='store_true', default=False,
+                        help='使用单次请求(count字段)批量创建全部实例')
+    parser.add_argument('--use-pool', action='store_true', default=False, help='优先从预热实例池借用实例')
+    parser.add_argument('--pool-state', default="./cache/instance_pool.json", help='实例池状态文件路径')
+    parser.add_argument('--eip-pool', action='store_true', default=False,
+                        help='从持久化EIP池借用EIP, 删除实例后归还 (不与 --bulk-create 同时生效)')
+    parser.add_argument('--eip-pool-state', default="./cache/eip_pool.json", help='EIP池状态文件路径')
+    parser.add_argument('--network', choices=NETWORK_MODES, default="public",
+                        help='public: 每个实例一个EIP; bastion: 只有node0 (或 --bastion-host) 有公网IP, 其余节点经跳板机访问; '
+                             'private: 调度机位于同一VPC, 不申请EIP, 直接使用私有IP')
+    parser.add_argument('--bastion-host', default=None, help='bastion模式下使用已有的跳板机地址 (此时不申请EIP)')
+    parser.add_argument('--boost-ceiling', type=int, default=100,
+                        help='下载测试结果时EIP带宽提升上限(Mbps), 不大于 --bandwidth 时不提升')
+    parser.add_argument('--shard-plan', default=None,
+                        help='spark_shards 生成的分片计划, --task-type 为其中的分片名 (如 shard-1) 时按计划运行套件')
+    parser.add_argument('--fan-out', action='store_true', default=False,
+                        help='一次运行多个分片: 每个节点运行不同的分片, 结束后合并结果 (--task-type 只作为运行名称)')
+    parser.add_argument('--shards', nargs='*', default=None,
+                        help='--fan-out 时要运行的分片 (如 hive-1 hive-2 或计划中的 shard-1...), 默认为分片计划中的全部分片')
+    parser.add_argument('--build-once', action='store_true', default=False,
+                        help='--fan-out 时只在第一个节点上编译Spark/Chukonu, 构建产物分发到其余节点')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='从 ./cache/<run-number>_<task-type>_job.json 续跑中断的运行, 复用其中记录的实例')
+    parser.add_argument('--bundle-broadcast', choices=("scheduler",) + BROADCAST_MODES, default="scheduler",
+                        help='--build-once 的分发方式: scheduler: 经调度机下载再上传到每个节点; '
+                             'tree/chain: 配置集群免密登录后从构建节点经私网二项树/流水线链中继')
     args = parser.parse_args()
 
+    if args.network == NETWORK_BASTION and (args.bulk_create or not (args.use_ip or args.bastion_host)):
+        parser.error("--network bastion 需要 --use-ip 或 --bastion-host, 且不能与 --bulk-create 同时使用")
+    if args.network == NETWORK_PRIVATE and args.use_ip:
+        parser.error("--network private 不申请EIP, 不能与 --use-ip 同时使用")
+    shard_plan = load_plan(args.shard_plan) if args.shard_plan else None
+    shards = []
+    if args.fan_out:
+        shards = args.shards or (list(shard_plan['shards']) if shard_plan else [])
+        if not shards:
+            parser.error("--fan-out 需要 --shards 或 --shard-plan")
+    elif args.build_once:
+        parser.error("--build-once 只能与 --fan-out 一起使用")
+    elif shard_plan and args.task_type not in shard_plan['shards']:
+        parser.error(f"分片计划中没有 {args.task_type}, 可选: {', '.join(shard_plan['shards'])}")
+    if args.num_instances is None:
+        args.num_instances = len(shards) if args.fan_out else 1
+    broadcast_mode = args.bundle_broadcast if args.build_once and args.bundle_broadcast != "scheduler" else None
+
+    initial_key_path="/root/schedule/KeyPair-loacl.pem"
+    network = ClusterNetwork(args.network, key_path=initial_key_path, bastion_host=args.bastion_host)
     manager = ECSInstanceManager(args.ak, args.sk, args.region)
+    manager.ssh_configurator.network = network
+    if args.eip_pool and args.use_ip and not args.bulk_create:
+        manager.eip_pool = EIPPool(manager.eip_manager, bandwidth=args.bandwidth, state_path=args.eip_pool_state)
     console.rule(f"[bold blue]测试模式: 创建 {args.num_instances} 个实例后自动删除[/bold blue]")
     instance_zone = args.instance_zone if args.instance_zone else f"{args.region}a"
-    created_instances_details = []
-    
-    if args.use_ip:
-        console.print(f"[cyan]正在为 {args.num_instances} 个实例申请EIP...[/cyan]")
-        manager.eip_list = manager.eip_manager.create_eips(  # 存储到实例变量
-            args.num_instances, 
-            f"{args.run_number}_{args.task_type}",
-            args.bandwidth
-        )
-        
-        if not manager.eip_list or len(manager.eip_list) < args.num_instances:
-            console.print("[red]✗ EIP申请失败或数量不足，无法继续创建实例[/red]")
-            return
-        save_eips_to_file(f"{args.run_number}_{args.task_type}", manager.eip_list)
-        
-        # 显示EIP信息
-        eip_table = Table(title="已申请EIP列表", show_header=True, header_style="bold cyan")
-        eip_table.add_column("序号", style="dim", justify="right")
-        eip_table.add_column("EIP ID")
-        eip_table.add_column("IP地址")
-        for i, eip in enumerate(manager.eip_list, 1):
-            eip_table.add_row(str(i), eip['id'], eip['ip'])
-        console.print(eip_table)
+    pool = None
+    if args.use_pool:
+        # 从预热实例池借用, 不足时退回到新建实例
+        pool = InstancePool(manager, args.vpc_id, args.key_pair, args.security_group_id, args.subnet_id,
+                            args.actor, state_path=args.pool_state, key_path=initial_key_path)
 
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-        TimeElapsedColumn(),
-        console=console,
-    ) as creation_progress:
-        with ThreadPoolExecutor(max_workers=min(args.num_instances, 10)) as executor:
-            futures = {}
-            for i in range(args.num_instances):
-                task_id = creation_progress.add_task(f"Instance {i}...", total=100, start=False, visible=True)
-                creation_progress.update(task_id, completed=0)
-
-                # 如果有EIP列表，获取对应的EIP ID
-                eip_id = manager.eip_list[i]['id'] if args.use_ip and i < len(manager.eip_list) else None
-                
-                future = executor.submit(
-                    manager.create_instance,
-                    creation_progress, task_id, 
-                    vpc_id=args.vpc_id,
-                    instance_index=i,
-                    instance_type=args.instance_type,
-                    instance_zone=instance_zone,
-                    ami=args.ami,
-                    key_pair=args.key_pair,
-                    security_group_id=args.security_group_id,
-                    subnet_id=args.subnet_id,
-                    run_number=args.run_number,
-                    task_type=args.task_type,
-                    timeout_hours=args.timeout_hours,
-                    actor=args.actor,
-                    eip_id=eip_id
-                )
-                futures[future] = (i, task_id) 
-
-            for future in as_completed(futures):
-                instance_index, task_id = futures[future]
-                try:
-                    instance_detail = future.result()
-                    if instance_detail:
-                        created_instances_details.append(instance_detail)
-                    else:
-                        creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} failed.", completed=100, visible=False)
-                except Exception as e:
-                    creation_progress.update(task_id, description=f"[red]✗ Instance {instance_index} error: {e}", completed=100, visible=False)
-                    console.print(f"[red]Error processing instance {instance_index}: {e}[/red]")
-
-    if not created_instances_details:
-        console.print("[red]✗ 测试失败: 没有实例成功创建.[/red]")
-        # 清理已申请的EIP
-        if args.use_ip and manager.eip_list:
-            console.print("[yellow]清理已申请的EIP...[/yellow]")
-            manager.eip_manager.delete_eips([eip['id'] for eip in manager.eip_list])
-        return
-
-    console.print(f"\n[bold green]总共 {len(created_instances_details)}/{args.num_instances} 个实例创建成功.[/bold green]")
-    
-    if len(created_instances_details) < args.num_instances:
-        console.print(f"[yellow]注意: {args.num_instances - len(created_instances_details)} 个实例创建失败.[/yellow]")
+    # 整个运行是一个阶段DAG (engine.Job): 各阶段完成后写入检查点, --resume 时跳过已完成的阶段,
+    # teardown 阶段在前面的阶段结束后无论成败都会执行
+    run_name = f"{args.run_number}_{args.task_type}"
+    booster = BandwidthBooster(manager.eip_manager, baseline=args.bandwidth, ceiling=args.boost_ceiling)
+    job = Job(run_name, state_path=f"./cache/{run_name}_job.json")
 
-    if created_instances_details:
+    def provision(results):
+        instances = create_test_instances(manager, network, pool, args, instance_zone)
+        if not instances:
+            console.print("[red]✗ 测试失败: 没有实例成功创建.[/red]")
+            # 清理已申请的EIP
+            if args.use_ip and manager.eip_list:
+                console.print("[yellow]清理已申请的EIP...[/yellow]")
+                manager.release_eips([eip['id'] for eip in manager.eip_list])
+            return []
+
+        console.print(f"\n[bold green]总共 {len(instances)}/{args.num_instances} 个实例创建成功.[/bold green]")
+        if len(instances) < args.num_instances:
+            console.print(f"[yellow]注意: {args.num_instances - len(instances)} 个实例创建失败.[/yellow]")
         # 保存实例信息到文件
-        info_file = manager.save_instances_info(
-            f"{args.run_number}_{args.task_type}",
-            created_instances_details
-        )
-        initial_key_path="/root/schedule/KeyPair-loacl.pem"
-        # 配置SSH免密登录（仅在成功创建实例且有公网IP时）
-        # if args.use_ip and any(inst.get('public_ip', 'N/A') != 'N/A' for inst in created_instances_details):
-        #     console.rule("[bold blue]配置SSH免密登录[/bold blue]")
-            
-        #     # 获取初始SSH密钥路径（从参数或默认位置）
-        #     # initial_key_path = os.path.expanduser("~/.ssh/id_rsa")  # 默认使用用户的SSH密钥
-        #     # if args.key_pair:
-        #     #     # 如果是华为云的密钥对，可能需要从特定位置获取
-        #     #     initial_key_path = os.path.expanduser(f"~/.ssh/{args.key_pair}.pem")
-        #     initial_key_path="/root/schedule/KeyPair-loacl.pem"
-        #     # 配置免密登录
-        #     ssh_success = manager.ssh_configurator.configure_cluster_pwdless(
-        #         created_instances_details,
-        #         initial_key_path=initial_key_path,
-        #         user="root"
-        #     )
-            
-        #     if ssh_success:
-        #         console.print("[bold green]✓ SSH免密登录配置成功![/bold green]")
-        #     else:
-        #         console.print("[yellow]⚠ SSH免密登录配置部分失败[/yellow]")
-        
-        
-        table = Table(title="已创建实例列表 (等待删除)", show_header=True, header_style="bold green")
-        table.add_column("序号", style="dim", justify="right")
-        table.add_column("名称")
-        table.add_column("ID")
-        table.add_column("私有IP")
-        table.add_column("公网IP")
-        table.add_column("状态")
-        for inst in sorted(created_instances_details, key=lambda x: x['index']):
-            table.add_row(
-                str(inst['index']),
-                inst['name'],
-                inst['id'],
-                inst.get('private_ip', 'N/A'),
-                inst.get('public_ip', 'N/A'),
-                inst['status']
-            )
-        console.print(table)
-        test_build_chukonu(created_instances_details[0]['public_ip'],initial_key_path,"root")
-        test_spark_base(created_instances_details[0]['public_ip'],initial_key_path,"root",args.task_type)
-        
-        server_ids_to_delete = [inst['id'] for inst in created_instances_details]
-        eip_ids_to_delete = [inst['eip_id'] for inst in created_instances_details if inst.get('eip_id')]
-        
-        console.rule("[bold red]自动删除模式[/bold red]")
-        wait_seconds = 10
-        console.print(f"[yellow]等待 {wait_seconds} 秒后自动删除 {len(server_ids_to_delete)} 个已创建的实例...[/yellow]")
-        for i in range(wait_seconds, 0, -1):
-            print(f"\r[yellow]开始删除倒计时: {i}s...[/yellow]", end="")
-            time.sleep(1)
-        print("\r" + " " * 30 + "\r", end="") 
-
-        # 先删除实例
-        all_deleted_successfully = manager.delete_instances(server_ids_to_delete)
-        
-        # 然后删除EIP
-        if eip_ids_to_delete:
-            console.print("[cyan]开始清理关联的EIP...[/cyan]")
-            manager.eip_manager.delete_eips(eip_ids_to_delete)
-            
-            # 清理文件
-            info_path = f"./cache/{args.run_number}_{args.task_type}_ip_info.txt"
-            if os.path.exists(info_path):
-                os.remove(info_path)
-                console.print(f"[dim]已清理文件: {info_path}[/dim]")
-
-        if all_deleted_successfully:
-            if len(server_ids_to_delete) == args.num_instances :
-                 console.print(f"[bold green]✓ 测试完成: {len(server_ids_to_delete)} 个实例全部创建并成功删除![/bold green]")
-            else:
-                 console.print(f"[bold green]✓ 测试部分完成: {len(server_ids_to_delete)}/{args.num_instances} 个实例创建并成功删除! (其余实例创建失败)[/bold green]")
-        else:
-            console.print(f"[bold red]✗ 测试失败: 部分或全部实例 (共 {len(server_ids_to_delete)} 个尝试删除) 删除失败.[/bold red]")
-    else:
-        console.print("[red]⚠ 没有实例创建成功，因此不执行删除操作.[/red]")
+        manager.save_instances_info(run_name, instances)
+        show_test_instances(instances)
+        # 借用的EIP一并写入检查点, 续跑时 teardown 仍能把它们归还到EIP池
+        return {'instances': instances, 'eips': [eip['id'] for eip in manager.eip_list]}
+
+    def bootstrap(results):
+        instances = results['provision']['instances']
+        # 跳板机地址不在检查点中, 续跑时重新确定
+        network.use_nodes(instances)
+        if broadcast_mode:
+            # 节点之间中继需要集群免密登录和hosts
+            manager.ssh_configurator.configure_cluster_pwdless(instances, initial_key_path)
+        return True
+
+    def run_tests(results):
+        instances = results['provision']['instances']
+        if args.fan_out:
+            bundle_path = f"./cache/spark_bundle_{run_name}.tar.gz" if args.build_once else None
+            try:
+                reports = run_shards(instances, shards, network, initial_key_path, booster, shard_plan,
+                                     bundle_path, broadcast_mode)
+            finally:
+                if bundle_path and os.path.exists(bundle_path):
+                    os.remove(bundle_path)
+            return reports if any(reports.values()) else False
+        # 等待sshd返回banner后再开始构建 (bastion模式下非跳板节点经跳板机连接其私有IP, private模式直接连接私有IP)
+        node = SSHConfigurator.node_from_instance(instances[0])
+        if not network.wait_for_ssh([node])[node['hostname']]:
+            return False
+        gateway = None if network.is_bastion(node) else network.gateway()
+        test_build_chukonu(network.ssh_host(node), initial_key_path, "root", gateway)
+        report = test_spark_base(network.ssh_host(node), initial_key_path, "root", args.task_type, gateway, booster,
+                                 instances[0].get('eip_id'), shard_plan)
+        return {args.task_type: report} if report else False
+
+    def teardown(results):
+        provisioned = results.get('provision') or {}
+        instances = provisioned.get('instances', [])
+        if not instances:
+            # 没有实例创建成功 (provision 阶段已清理EIP)
+            console.print("[red]⚠ 没有实例创建成功，因此不执行删除操作.[/red]")
+            return True
+        return delete_test_resources(manager, network, instances, pool, args, provisioned.get('eips'))
+
+    job.add('provision', STAGE_PROVISION, provision)
+    job.add('bootstrap', STAGE_BOOTSTRAP, bootstrap, needs=['provision'], checkpoint=False)
+    job.add('test', STAGE_REMOTE, run_tests, needs=['bootstrap'])
+    last = 'test'
+    if args.fan_out:
+        job.add('merge_reports', STAGE_FETCH, lambda results: merge_shard_reports(results['test'], run_name),
+                needs=['test'])
+        last = 'merge_reports'
+    job.add('teardown', STAGE_TEARDOWN, teardown, needs=[last], always=True)
+
+    job.run(resume=args.resume)
+    job.show()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file